@@ -13,6 +13,7 @@ from .. export import indigo_log
 from .. import operators
 
 from . util import getVersion, getGuiPath, getConsolePath, getInstallPath, count_contiguous
+from . parallel_export import frame_progress
 
 BL_IDNAME = 'indigo_renderer'
 
@@ -57,6 +58,63 @@ def unregister():
         if BL_IDNAME in panel.COMPAT_ENGINES:
             panel.COMPAT_ENGINES.remove(BL_IDNAME)
 
+def get_output_paths(scene, is_animation):
+    '''
+    Returns (output_path, output_filename, image_out_path) for the current
+    frame of scene: the directory and name of the .igs file, and the image
+    output path without extension.
+    '''
+    # Get the frame path.
+    frame_path = efutil.filesystem_path(scene.render.frame_path())
+
+    # Get the filename for the frame sans extension.
+    image_out_path = os.path.splitext(frame_path)[0]
+
+    # Generate the name for the scene file(s).
+    if scene.indigo_engine.use_output_path == True:
+        # Get the output path from the frame path.
+        output_path = os.path.dirname(frame_path)
+
+        # Generate the output filename
+        output_filename = '%s.%s.%05i.igs' % (efutil.scene_filename(), bpy.path.clean_name(scene.name), scene.frame_current)
+    else:
+        # Get export path from the indigo_engine.
+        export_path = efutil.filesystem_path(scene.indigo_engine.export_path)
+
+        # Get the directory name from the output path.
+        output_path = os.path.dirname(export_path)
+
+        # Get the filename from the output path and remove the extension.
+        output_filename = os.path.splitext(os.path.basename(export_path))[0]
+
+        # Count contiguous # chars and replace them with the frame number.
+        # If the hash count is 0 and we are exporting an animation, append the frame numbers.
+        hash_count = util.count_contiguous('#', output_filename)
+        if hash_count != 0:
+            output_filename = output_filename.replace('#'*hash_count, ('%%0%0ii'%hash_count)%scene.frame_current)
+        elif is_animation:
+            output_filename = output_filename + ('%%0%0ii'%4)%scene.frame_current
+
+        # Add .igs extension.
+        output_filename += '.igs'
+
+    return (output_path, output_filename, image_out_path)
+
+def get_output_options(scene):
+    '''
+    The extra outputs Indigo is asked to save, see queue_runner.output_args.
+    '''
+    return {
+        'exr_untonemapped': scene.indigo_engine.save_exr_utm,
+        'exr_tonemapped': scene.indigo_engine.save_exr_tm,
+        'igi': scene.indigo_engine.save_igi,
+        'igi_timestamp': scene.indigo_engine.igi_timestamp_filename,
+        'channels_exr': scene.indigo_engine.save_render_channels_exr,
+    }
+
+def get_igq_filename(scene, output_path):
+    return '%s/%s.%s.igq'%(output_path, efutil.scene_filename(), bpy.path.clean_name(scene.name))
+
 from .. auto_load import force_register 
 @force_register
 class RENDERENGINE_indigo(bpy.types.RenderEngine):
@@ -67,6 +125,10 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
     bl_use_eevee_viewport = True
 
     render_lock = threading.Lock()
+    
+    # Set by the parallel animation export workers, which each write their
+    # own part of the render queue.
+    igq_filename_override = None
 
     def render(self, depsgraph):
         '''
@@ -89,41 +151,8 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
             #------------------------------------------------------------------------------
             # Export the Scene
 
-            # Get the frame path.
             scene = depsgraph.scene_eval
-            frame_path = efutil.filesystem_path(scene.render.frame_path())
-
-            # Get the filename for the frame sans extension.
-            image_out_path = os.path.splitext(frame_path)[0]
-
-            # Generate the name for the scene file(s).
-            if scene.indigo_engine.use_output_path == True:
-                # Get the output path from the frame path.
-                output_path = os.path.dirname(frame_path)
-
-                # Generate the output filename
-                output_filename = '%s.%s.%05i.igs' % (efutil.scene_filename(), bpy.path.clean_name(scene.name), scene.frame_current)
-            else:
-                # Get export path from the indigo_engine.
-                export_path = efutil.filesystem_path(scene.indigo_engine.export_path)
-
-                # Get the directory name from the output path.
-                output_path = os.path.dirname(export_path)
-
-                # Get the filename from the output path and remove the extension.
-                output_filename = os.path.splitext(os.path.basename(export_path))[0]
-
-                # Count contiguous # chars and replace them with the frame number.
-                # If the hash count is 0 and we are exporting an animation, append the frame numbers.
-                hash_count = util.count_contiguous('#', output_filename)
-                if hash_count != 0:
-                    output_filename = output_filename.replace('#'*hash_count, ('%%0%0ii'%hash_count)%scene.frame_current)
-                elif self.is_animation:
-                    output_filename = output_filename + ('%%0%0ii'%4)%scene.frame_current
-
-                # Add .igs extension.
-                output_filename += '.igs'
-
+            output_path, output_filename, image_out_path = get_output_paths(scene, self.is_animation)
 
             # The full path of the exported scene file.
             exported_file = '/'.join([
@@ -132,12 +161,14 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
             ])
 
             # Create output_path if it does not exist.
-            if not os.path.exists(output_path):
-                os.makedirs(output_path)
+            os.makedirs(output_path, exist_ok=True)
 
             # If an animation is rendered, write an indigo queue file (.igq).
             if self.is_animation:
-                igq_filename = '%s/%s.%s.igq'%(output_path, efutil.scene_filename(), bpy.path.clean_name(scene.name))
+                if RENDERENGINE_indigo.igq_filename_override != None:
+                    igq_filename = RENDERENGINE_indigo.igq_filename_override
+                else:
+                    igq_filename = get_igq_filename(scene, output_path)
 
                 if scene.frame_current == scene.frame_start:
                     # Start a new igq file.
@@ -166,10 +197,8 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
 
                 igq_file.close()
 
-                # Calculate the progress by frame with frame range (fr) and frame offset (fo).
-                fr = scene.frame_end - scene.frame_start
-                fo = scene.frame_current - scene.frame_start
-                self.update_progress(fo/fr)
+                # Calculate the progress by frame.
+                self.update_progress(frame_progress(scene.frame_start, scene.frame_end, scene.frame_current))
 
             scene_writer = operators._Impl_OT_indigo(
                 directory = output_path,
@@ -233,6 +262,11 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
                 if self.is_animation and scene.frame_current != scene.frame_end:
                     return
 
+                # if animation and final frame, render the queue with concurrent console jobs
+                if self.is_animation and scene.frame_current == scene.frame_end and scene.indigo_engine.queue_runner:
+                    self.run_queue(scene, igq_filename)
+                    return
+
                 # if animation and final frame, launch queue instead of single frame
                 if self.is_animation and scene.frame_current == scene.frame_end:
                     exported_file = igq_filename
@@ -248,22 +282,9 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
                         image_out_path + '.png'
                     ]
 
-                # export exrs
-                if scene.indigo_engine.save_exr_utm:
-                    indigo_args.extend(['-uexro', image_out_path + '_untonemapped.exr'])
-                if scene.indigo_engine.save_exr_tm:
-                    indigo_args.extend(['-texro', image_out_path + '_tonemapped.exr'])
-                if scene.indigo_engine.save_igi:
-                    if scene.indigo_engine.igi_timestamp_filename:
-                        #import datetime
-                        #filename = image_out_path+" "+str(datetime.datetime.today().strftime('%y-%m-%d %H %M %S'))
-                        filename = image_out_path+"_"+str(int(time.time()))
-                    else:
-                        filename = image_out_path
-                    indigo_args.extend(['-igio', filename + '.igi'])
-
-                if scene.indigo_engine.save_render_channels_exr:
-                    indigo_args.extend(['-channels', image_out_path + '_channels.exr'])
+                # export exrs, igi and render channels
+                from . queue_runner import output_args
+                indigo_args.extend(output_args(image_out_path, get_output_options(scene)))
 
                 # Set master or working master command line args.
                 if scene.indigo_engine.network_mode == 'master':
@@ -287,31 +308,61 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
 
                 # indigo_log("Starting indigo: %s" % indigo_args)
 
-                # If we're starting a console or should wait for the process, listen to the output.
-                if scene.indigo_engine.use_console or scene.indigo_engine.wait_for_process:
-                    f_stdout = subprocess.PIPE
-                else:
-                    f_stdout = None
-
                 # Launch the Indigo process.
                 from . util import isMac
                 if isMac():
                     indigo_args = ['open','-a'] + [indigo_args[0]] + ['-n', '--args'] + indigo_args[1:]
-                indigo_proc = subprocess.Popen(indigo_args, stdout=f_stdout)
-                indigo_pid = indigo_proc.pid
-                indigo_log('Started Indigo process, PID: %i' % indigo_pid)
 
-                # Wait for the render to finish if we use the console or should wait for the process.
+                # If we're starting a console or should wait for the process, follow its output.
                 if scene.indigo_engine.use_console or scene.indigo_engine.wait_for_process:
-                    while indigo_proc.poll() == None:
-                        indigo_proc.communicate()
-                        time.sleep(2)
-
-                    indigo_proc.wait()
-                    if not indigo_proc.stdout.closed:
-                        indigo_proc.communicate()
-                    if indigo_proc.returncode == -1:
+                    from . supervisor import IndigoProcessSupervisor
+                    supervisor = IndigoProcessSupervisor(
+                        indigo_args,
+                        halt_spp=scene.indigo_engine.haltspp,
+                        halt_time=scene.indigo_engine.halttime
+                    ).start()
+                    indigo_log('Started Indigo process, PID: %i' % supervisor.pid)
+
+                    # Show the images Indigo saves while rendering a single frame.
+                    if scene.indigo_engine.framebuffer_feedback and not self.is_animation:
+                        from . framebuffer import FramebufferThread
+                        fb_paths = [image_out_path + '.png']
+                        if scene.indigo_engine.save_exr_tm:
+                            fb_paths.insert(0, image_out_path + '_tonemapped.exr')
+                        self.framebuffer_thread = FramebufferThread(fb_paths)
+                        self.framebuffer_thread.start()
+                    last_framebuffer_update = 0.0
+
+                    def report_progress(stats, progress):
+                        nonlocal last_framebuffer_update
+                        self.update_stats('', 'Indigo Renderer: %s' % stats)
+                        if progress != None:
+                            self.update_progress(progress)
+
+                        if self.framebuffer_thread != None and time.time() - last_framebuffer_update >= scene.indigo_engine.framebuffer_update_interval:
+                            frame = self.framebuffer_thread.take()
+                            if frame != None:
+                                self.update_framebuffer(scene, frame)
+                                last_framebuffer_update = time.time()
+
+                    returncode = supervisor.wait(self.test_break, report_progress)
+                    indigo_log('Indigo process exited with status %i' % returncode)
+
+                    if self.framebuffer_thread != None:
+                        self.framebuffer_thread.stop()
+                        self.framebuffer_thread.join()
+                        # Pick up the final image even if it was written just before exiting.
+                        self.framebuffer_thread.check(final=True)
+                        frame = self.framebuffer_thread.take()
+                        if frame != None:
+                            self.update_framebuffer(scene, frame)
+                        self.framebuffer_thread = None
+                    if returncode == -1:
                         sys.exit(-1)
+                else:
+                    indigo_proc = subprocess.Popen(indigo_args)
+                    indigo_pid = indigo_proc.pid
+                    indigo_log('Started Indigo process, PID: %i' % indigo_pid)
 
             else:
                 indigo_log("Scene was exported to %s" % exported_file)
@@ -320,6 +371,56 @@ class RENDERENGINE_indigo(bpy.types.RenderEngine):
             # Finished
             return
 
+    def run_queue(self, scene, igq_filename):
+        '''
+        Render the animation queue locally with several indigo_console jobs.
+        '''
+        from . queue_runner import IgqQueueRunner, default_num_jobs
+
+        threads_per_job = scene.indigo_engine.queue_threads_per_job
+        num_jobs = scene.indigo_engine.queue_jobs
+        if num_jobs <= 0:
+            num_jobs = default_num_jobs(threads_per_job)
+
+        console_path = efutil.filesystem_path(getConsolePath(scene))
+        if not os.path.exists(console_path):
+            self.report({'ERROR'}, "Failed to find indigo_console at '%s'" % console_path)
+            return
+
+        runner = IgqQueueRunner(console_path, igq_filename, num_jobs, threads_per_job,
+            output_options=get_output_options(scene), resume=scene.indigo_engine.queue_resume)
+        indigo_log('Rendering %s with %i concurrent jobs, journal: %s' % (igq_filename, num_jobs, runner.journal_filename))
+
+        def report_progress(finished, total):
+            self.update_stats('', 'Indigo Renderer: %i of %i frames' % (finished, total))
+            self.update_progress(finished / max(1, total))
+
+        counts = runner.run(self.test_break, report_progress)
+        indigo_log('Render queue finished: %s' % ', '.join('%i %s' % (n, status) for status, n in sorted(counts.items())))
+        if counts.get('failed', 0) > 0:
+            self.report({'ERROR'}, '%i frames failed to render, see %s' % (counts['failed'], runner.journal_filename))
+
+    def update_framebuffer(self, scene, frame):
+        '''
+        Show a frame decoded by the FramebufferThread in the render result.
+        Frames that couldn't be decoded off the main thread, or don't match
+        the result size, are loaded by Blender from the file.
+        '''
+        path, width, height, pixels = frame
+        xres = scene.render.resolution_x * scene.render.resolution_percentage // 100
+        yres = scene.render.resolution_y * scene.render.resolution_percentage // 100
+
+        result = self.begin_result(0, 0, xres, yres)
+        try:
+            if pixels is not None and (width, height) == (xres, yres):
+                result.layers[0].passes['Combined'].rect = pixels
+            else:
+                result.layers[0].load_from_file(path)
+        except Exception as err:
+            indigo_log('Could not show %s: %s' % (path, err), message_type='WARNING')
+        finally:
+            self.end_result(result)
+
     def stats_timer(self):
         '''
         Update the displayed rendering statistics and detect end of rendering
@@ -0,0 +1,124 @@
+import os, threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import OpenImageIO as oiio
+except ImportError:
+    oiio = None
+
+def srgb_to_linear(a):
+    return np.where(a <= 0.04045, a / 12.92, ((a + 0.055) / 1.055) ** 2.4)
+
+def decode_image(path):
+    '''
+    Decode an image to a (width * height, 4) float32 array of linear RGBA
+    pixels, bottom row first as Blender render results are laid out.
+    Returns (width, height, pixels), or None if no decoder is available
+    here; the caller then lets Blender load the file.
+    '''
+    if oiio is None or np is None:
+        return None
+
+    inp = oiio.ImageInput.open(path)
+    if inp is None:
+        return None
+    try:
+        spec = inp.spec()
+        pixels = inp.read_image(oiio.FLOAT)
+    finally:
+        inp.close()
+    if pixels is None:
+        return None
+
+    pixels = np.asarray(pixels, dtype=np.float32).reshape(spec.height, spec.width, spec.nchannels)
+    rgba = np.ones((spec.height, spec.width, 4), dtype=np.float32)
+    if spec.nchannels >= 3:
+        rgba[:, :, 0:3] = pixels[:, :, 0:3]
+    else:
+        rgba[:, :, 0:3] = pixels[:, :, 0:1]
+    if spec.nchannels in (2, 4):
+        rgba[:, :, 3] = pixels[:, :, -1]
+
+    # 8 bit images are display referred sRGB.
+    if not path.lower().endswith('.exr'):
+        rgba[:, :, 0:3] = srgb_to_linear(rgba[:, :, 0:3])
+
+    return (spec.width, spec.height, np.ascontiguousarray(rgba[::-1]).reshape(-1, 4))
+
+class FramebufferThread(threading.Thread):
+    '''
+    Watches the images Indigo saves periodically and decodes new ones.
+
+    Each path is checked with a stat() every POLL_PERIOD seconds. An image
+    is decoded once its mtime and size are the same on two checks in a row,
+    so a file that is still being written is not read. The newest decoded
+    frame is picked up by the render thread with take().
+    '''
+
+    POLL_PERIOD = 0.25
+
+    def __init__(self, paths):
+        threading.Thread.__init__(self, name='Indigo framebuffer', daemon=True)
+        self.paths = paths
+        self.active = True
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+
+        self.seen = {}      # path -> (mtime, size) at the previous check
+        self.decoded = {}   # path -> (mtime, size) of the last decoded image
+        self.frame = None   # (path, width, height, pixels or None)
+        self.errors = 0
+
+    def stop(self):
+        self.active = False
+        self.wake.set()
+
+    def run(self):
+        while self.active:
+            self.check()
+            self.wake.wait(self.POLL_PERIOD)
+
+    def check(self, final=False):
+        '''
+        Decode an image that changed and has settled. With final set, the
+        writer is known to be done and an image is decoded on first sight.
+        '''
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature = (st.st_mtime_ns, st.st_size)
+
+            settled = final or self.seen.get(path) == signature
+            self.seen[path] = signature
+            if not settled or self.decoded.get(path) == signature:
+                continue
+
+            try:
+                decoded = decode_image(path)
+            except Exception:
+                # Most likely caught the file mid-write, try again on the next change.
+                self.errors += 1
+                continue
+
+            self.decoded[path] = signature
+            with self.lock:
+                if decoded == None:
+                    self.frame = (path, None, None, None)
+                else:
+                    self.frame = (path,) + decoded
+            return
+
+    def take(self):
+        '''
+        Returns the newest frame decoded since the last call, or None.
+        '''
+        with self.lock:
+            frame = self.frame
+            self.frame = None
+        return frame
@@ -0,0 +1,164 @@
+'''
+Parallel animation export.
+
+The frame range is split into contiguous subranges, and each subrange is
+exported by a background Blender process running this file:
+
+    blender -b file.blend -P parallel_export.py -- <addon> <first> <last> <igq part>
+
+Each worker renders its subrange with the Indigo render engine (Indigo
+itself is not started), writing the scene files and meshes into the same
+export directory, and its render queue items into its own .igq part. The
+parent merges the parts, in frame order, into the usual .igq file.
+
+This file is also imported as part of the add-on, so it only imports
+standard modules at the top level.
+'''
+
+import os, subprocess, sys
+import xml.etree.ElementTree as ET
+
+IGQ_HEADER = '<?xml version="1.0" encoding="utf-8" standalone="no" ?>\n<render_queue>\n'
+IGQ_FOOTER = '</render_queue>\n'
+
+def split_frame_range(frame_start, frame_end, frame_step, num_workers):
+    '''
+    Split the frames of the range into at most num_workers contiguous
+    (first, last) subranges of about equal length.
+    '''
+    frames = list(range(frame_start, frame_end + 1, frame_step))
+    num_workers = max(1, min(num_workers, len(frames)))
+
+    ranges = []
+    for i in range(num_workers):
+        chunk = frames[len(frames) * i // num_workers : len(frames) * (i+1) // num_workers]
+        ranges.append((chunk[0], chunk[-1]))
+    return ranges
+
+def frame_progress(frame_start, frame_end, frame_current):
+    '''
+    Progress in [0, 1] of exporting frame_current of the range. A range of a
+    single frame, as a worker can get, counts as done.
+    '''
+    frame_range = frame_end - frame_start
+    if frame_range <= 0:
+        return 1.0
+    return (frame_current - frame_start) / frame_range
+
+class ParallelAnimationExport(object):
+    '''
+    Runs and tracks the worker processes for one animation export.
+    '''
+
+    def __init__(self, blender_path, blend_path, addon_name, igq_filename, frame_ranges):
+        self.blender_path = blender_path
+        self.blend_path = blend_path
+        self.addon_name = addon_name
+        self.igq_filename = igq_filename
+        self.frame_ranges = frame_ranges
+        self.procs = []
+        self.log_files = []
+
+    def part_filename(self, i):
+        return '%s.part%03i' % (self.igq_filename, i)
+
+    def start(self):
+        for i, (first, last) in enumerate(self.frame_ranges):
+            part = self.part_filename(i)
+            if os.path.exists(part):
+                os.remove(part)
+
+            log_file = open(part + '.log', 'w')
+            self.log_files.append(log_file)
+            self.procs.append(subprocess.Popen(
+                [
+                    self.blender_path, '-b', self.blend_path,
+                    '-P', os.path.abspath(__file__),
+                    '--', self.addon_name, str(first), str(last), part
+                ],
+                stdout=log_file,
+                stderr=subprocess.STDOUT
+            ))
+
+    def poll(self):
+        '''
+        Returns the number of workers still running.
+        '''
+        return sum(1 for p in self.procs if p.poll() == None)
+
+    def failed(self):
+        '''
+        Returns the indices of workers that exited with an error.
+        '''
+        return [i for i, p in enumerate(self.procs) if p.poll() not in (None, 0)]
+
+    def terminate(self):
+        for p in self.procs:
+            if p.poll() == None:
+                p.terminate()
+        for p in self.procs:
+            p.wait()
+        self.close_logs()
+
+    def close_logs(self):
+        for f in self.log_files:
+            f.close()
+        self.log_files = []
+
+    def merge(self):
+        '''
+        Merge the .igq parts into igq_filename, in frame order, and remove them.
+        Raises Exception if a part is missing or incomplete.
+        '''
+        self.close_logs()
+
+        items = []
+        for i in range(len(self.frame_ranges)):
+            part = self.part_filename(i)
+            try:
+                items.extend(ET.parse(part).getroot().findall('item'))
+            except (OSError, ET.ParseError) as err:
+                raise Exception('Worker %i did not finish its render queue %s: %s' % (i, part, err))
+
+        with open(self.igq_filename, 'w') as igq_file:
+            igq_file.write(IGQ_HEADER)
+            for item in items:
+                igq_file.write('\t<item>\n')
+                for child in item:
+                    igq_file.write('\t\t%s' % ET.tostring(child, encoding='unicode').strip())
+                    igq_file.write('\n')
+                igq_file.write('\t</item>\n')
+            igq_file.write(IGQ_FOOTER)
+
+        for i in range(len(self.frame_ranges)):
+            os.remove(self.part_filename(i))
+            os.remove(self.part_filename(i) + '.log')
+
+        return len(items)
+
+def worker_main(argv):
+    import importlib
+    import addon_utils  #@UnresolvedImport
+    import bpy          #@UnresolvedImport
+
+    addon_name, first, last, part = argv[0], int(argv[1]), int(argv[2]), argv[3]
+
+    if not addon_utils.check(addon_name)[1]:
+        addon_utils.enable(addon_name, default_set=False)
+    core = importlib.import_module(addon_name + '.core')
+
+    scene = bpy.context.scene
+    scene.frame_start = first
+    scene.frame_end = last
+    scene.indigo_engine.auto_start = False
+
+    core.RENDERENGINE_indigo.igq_filename_override = part
+    bpy.ops.render.render(animation=True, scene=scene.name)
+
+if __name__ == '__main__':
+    try:
+        worker_main(sys.argv[sys.argv.index('--') + 1:])
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,228 @@
+import hashlib, json, os, threading, time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
+
+from . supervisor import IndigoProcessSupervisor
+
+def parse_igq(filename):
+    '''
+    Returns the items of an .igq render queue as a list of dicts with keys
+    scene_path, output_path, halt_time, halt_spp and seed.
+    '''
+    items = []
+    for item in ET.parse(filename).getroot().findall('item'):
+        def value(tag, default=None, convert=str):
+            e = item.find(tag)
+            if e == None or e.text == None:
+                return default
+            return convert(e.text.strip())
+
+        items.append({
+            'scene_path': value('scene_path'),
+            'output_path': value('output_path'),
+            'halt_time': value('halt_time', -1, int),
+            'halt_spp': value('halt_spp', -1, int),
+            'seed': value('seed', None, int),
+        })
+    return items
+
+def default_num_jobs(threads_per_job):
+    # Without a thread count each Indigo process uses every core.
+    if threads_per_job <= 0:
+        return 1
+    return max(1, (os.cpu_count() or 1) // threads_per_job)
+
+def output_args(image_out_path, options):
+    '''
+    Indigo arguments for the extra outputs of a frame, named after its image
+    output path without extension. options is a dict of booleans with keys
+    exr_untonemapped, exr_tonemapped, igi, igi_timestamp and channels_exr.
+    '''
+    args = []
+    if options.get('exr_untonemapped'):
+        args.extend(['-uexro', image_out_path + '_untonemapped.exr'])
+    if options.get('exr_tonemapped'):
+        args.extend(['-texro', image_out_path + '_tonemapped.exr'])
+    if options.get('igi'):
+        if options.get('igi_timestamp'):
+            filename = image_out_path + "_" + str(int(time.time()))
+        else:
+            filename = image_out_path
+        args.extend(['-igio', filename + '.igi'])
+    if options.get('channels_exr'):
+        args.extend(['-channels', image_out_path + '_channels.exr'])
+    return args
+
+def queue_signature(filename):
+    '''
+    Identifies one version of an .igq file: its mtime, size and content hash.
+    '''
+    st = os.stat(filename)
+    with open(filename, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return [st.st_mtime_ns, st.st_size, digest]
+
+class IgqQueueRunner(object):
+    '''
+    Renders the items of an .igq file with up to num_jobs concurrent
+    indigo_console processes. Each item is rendered from a queue of its own,
+    so Indigo sees the same seed, halt conditions and output path as when it
+    renders the whole queue, and gets the same extra output arguments.
+
+    Progress is kept in a JSON journal next to the queue, rewritten on every
+    change. The journal records which version of the .igq it belongs to and
+    is ignored once the queue is written again, e.g. by a new render of the
+    animation. On a rerun of the same queue, items the journal records as
+    done are skipped; an item that was running when the runner was
+    interrupted is rendered again. With resume set, items the journal knows
+    nothing about are also skipped when their output image exists.
+    '''
+
+    def __init__(self, console_path, igq_filename, num_jobs, threads_per_job, output_options=None, resume=False):
+        self.console_path = console_path
+        self.igq_filename = igq_filename
+        self.journal_filename = igq_filename + '.journal.json'
+        self.num_jobs = max(1, num_jobs)
+        self.threads_per_job = threads_per_job
+        self.output_options = output_options or {}
+        self.resume = resume
+
+        self.signature = queue_signature(igq_filename)
+        self.items = parse_igq(igq_filename)
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+        previous = self.read_journal()
+        for i, item in enumerate(self.items):
+            item['index'] = i
+            item['status'] = 'pending'
+            record = previous.get(item['scene_path'])
+            if record != None and record.get('status') in ('done', 'skipped'):
+                item['status'] = record['status']
+            elif record == None and self.resume and os.path.exists(self.image_filename(item)):
+                item['status'] = 'skipped'
+
+    def image_filename(self, item):
+        return item['output_path'] + '.png'
+
+    def item_queue_filename(self, item):
+        return '%s.item%05i.igq' % (self.igq_filename, item['index'])
+
+    def read_journal(self):
+        try:
+            with open(self.journal_filename, 'r') as f:
+                journal = json.load(f)
+            if journal.get('queue_signature') != self.signature:
+                return {}
+            return {item['scene_path']: item for item in journal.get('items', [])}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def write_journal(self):
+        with self.lock:
+            journal = {
+                'queue': self.igq_filename,
+                'queue_signature': self.signature,
+                'jobs': self.num_jobs,
+                'threads_per_job': self.threads_per_job,
+                'updated': time.time(),
+                'items': self.items,
+            }
+            temp_filename = '%s.%i.tmp' % (self.journal_filename, os.getpid())
+            with open(temp_filename, 'w') as f:
+                json.dump(journal, f, indent=1)
+            os.replace(temp_filename, self.journal_filename)
+
+    def set_status(self, item, status, **kwargs):
+        with self.lock:
+            item['status'] = status
+            item.update(kwargs)
+        self.write_journal()
+
+    def write_item_queue(self, item):
+        '''
+        Write a render queue holding just item, as RENDERENGINE_indigo.render writes them.
+        '''
+        lines = [
+            '<?xml version="1.0" encoding="utf-8" standalone="no" ?>',
+            '<render_queue>',
+            '\t<item>',
+            '\t\t<scene_path>%s</scene_path>' % escape(item['scene_path']),
+            '\t\t<halt_time>%d</halt_time>' % item['halt_time'],
+            '\t\t<halt_spp>%d</halt_spp>' % item['halt_spp'],
+            '\t\t<output_path>%s</output_path>' % escape(item['output_path']),
+        ]
+        if item['seed'] != None:
+            lines.append('\t\t<seed>%s</seed>' % item['seed'])
+        lines.extend(['\t</item>', '</render_queue>', ''])
+
+        filename = self.item_queue_filename(item)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        return filename
+
+    def args(self, item):
+        args = [self.console_path, self.item_queue_filename(item)]
+        if self.threads_per_job > 0:
+            args.extend(['-t', '%i' % self.threads_per_job])
+        args.extend(output_args(item['output_path'], self.output_options))
+        return args
+
+    def render_item(self, item):
+        if self.cancelled.is_set():
+            return
+
+        supervisor = IndigoProcessSupervisor(self.args(item), item['halt_spp'], item['halt_time'])
+        self.set_status(item, 'running', started=time.time())
+        try:
+            self.write_item_queue(item)
+            supervisor.start()
+            returncode = supervisor.wait(self.cancelled.is_set)
+        except OSError as err:
+            self.set_status(item, 'failed', finished=time.time(), error=str(err))
+            return
+        finally:
+            try:
+                os.remove(self.item_queue_filename(item))
+            except OSError:
+                pass
+
+        if self.cancelled.is_set():
+            self.set_status(item, 'cancelled', finished=time.time())
+        else:
+            self.set_status(item, 'done' if returncode == 0 else 'failed', finished=time.time(), returncode=returncode,
+                spp=supervisor.spp, elapsed=supervisor.elapsed)
+
+    def counts(self):
+        with self.lock:
+            counts = {}
+            for item in self.items:
+                counts[item['status']] = counts.get(item['status'], 0) + 1
+        return counts
+
+    def run(self, test_break=None, on_progress=None, poll_interval=0.1):
+        '''
+        Render all pending items. test_break is polled to cancel the queue,
+        on_progress(finished, total) is called whenever an item finishes.
+        Returns the item status counts.
+        '''
+        self.write_journal()
+        pending = [item for item in self.items if item['status'] not in ('done', 'skipped')]
+        total = len(self.items)
+
+        with ThreadPoolExecutor(max_workers=self.num_jobs) as pool:
+            futures = [pool.submit(self.render_item, item) for item in pending]
+            last_finished = -1
+            while not all(f.done() for f in futures):
+                if test_break != None and test_break():
+                    self.cancelled.set()
+                finished = total - sum(1 for item in self.items if item['status'] in ('pending', 'running'))
+                if on_progress != None and finished != last_finished:
+                    last_finished = finished
+                    on_progress(finished, total)
+                time.sleep(poll_interval)
+
+        if on_progress != None:
+            on_progress(total - sum(1 for item in self.items if item['status'] in ('pending', 'running')), total)
+        return self.counts()
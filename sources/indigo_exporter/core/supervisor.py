@@ -0,0 +1,131 @@
+import re, subprocess, threading, time
+
+# Progress as printed by indigo_console, e.g.
+#   "Time: 12.3 s, 45.6 samples/pixel"  or  "... 1.2e2 S/px, elapsed 65 s"
+SPP_RE = re.compile(r'([0-9]+(?:\.[0-9]*)?(?:[eE][-+]?[0-9]+)?)\s*(?:samples[ /]per[ /]pixel|samples/pixel|samples/px|s/px|spp)\b', re.IGNORECASE)
+ELAPSED_RE = re.compile(r'(?:elapsed|time)\s*(?:time)?\s*[:=]?\s*([0-9]+(?:\.[0-9]*)?)\s*s\b', re.IGNORECASE)
+
+def parse_progress(line):
+    '''
+    Returns (samples per pixel, elapsed seconds) found in an output line of
+    Indigo; either is None if the line doesn't contain it.
+    '''
+    spp = SPP_RE.search(line)
+    elapsed = ELAPSED_RE.search(line)
+    return (
+        float(spp.group(1)) if spp else None,
+        float(elapsed.group(1)) if elapsed else None
+    )
+
+class IndigoProcessSupervisor(object):
+    '''
+    Runs an Indigo process and follows its output on a background thread.
+
+    The reader thread parses samples per pixel and elapsed time from each
+    output line. wait() returns as soon as the process exits, and checks
+    test_break and reports progress every poll_interval seconds meanwhile.
+    Any executable printing Indigo style progress lines can stand in for
+    indigo_console.
+    '''
+
+    def __init__(self, args, halt_spp=-1, halt_time=-1):
+        self.args = args
+        self.halt_spp = halt_spp
+        self.halt_time = halt_time
+
+        self.proc = None
+        self.reader = None
+        self.lock = threading.Lock()
+        self.exited = threading.Event()
+
+        self.spp = None
+        self.elapsed = None
+        self.last_line = ''
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            self.args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            errors='replace',
+            bufsize=1
+        )
+        self.reader = threading.Thread(target=self.read_output, name='Indigo output reader', daemon=True)
+        self.reader.start()
+        return self
+
+    def read_output(self):
+        # Indigo rewrites its progress line with carriage returns, so split on those too.
+        for line in self.proc.stdout:
+            for part in line.split('\r'):
+                part = part.strip()
+                if part == '':
+                    continue
+                spp, elapsed = parse_progress(part)
+                with self.lock:
+                    self.last_line = part
+                    if spp != None: self.spp = spp
+                    if elapsed != None: self.elapsed = elapsed
+        self.proc.wait()
+        self.exited.set()
+
+    def progress(self):
+        '''
+        Returns (stats string, progress in [0, 1] or None if unknown).
+        '''
+        with self.lock:
+            spp, elapsed, last_line = self.spp, self.elapsed, self.last_line
+
+        stats = []
+        fractions = []
+        if spp != None:
+            stats.append('%.1f S/px' % spp)
+            if self.halt_spp > 0: fractions.append(spp / self.halt_spp)
+        if elapsed != None:
+            stats.append('%i s' % elapsed)
+            if self.halt_time > 0: fractions.append(elapsed / self.halt_time)
+
+        stats_string = ', '.join(stats) if len(stats) > 0 else last_line
+        progress = min(1.0, max(fractions)) if len(fractions) > 0 else None
+        return (stats_string, progress)
+
+    def terminate(self, timeout=5.0):
+        if self.proc.poll() != None:
+            return
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def wait(self, test_break=None, on_progress=None, poll_interval=0.05, progress_interval=0.5):
+        '''
+        Wait for the process to exit and return its exit code. If test_break
+        returns True the process is terminated. on_progress(stats, progress)
+        is called every progress_interval seconds while output comes in.
+        '''
+        last_report = 0.0
+        while not self.exited.wait(poll_interval):
+            if test_break != None and test_break():
+                self.terminate()
+                break
+
+            now = time.time()
+            if on_progress != None and now - last_report >= progress_interval:
+                last_report = now
+                on_progress(*self.progress())
+
+        self.reader.join()
+        if on_progress != None:
+            on_progress(*self.progress())
+        return self.proc.returncode
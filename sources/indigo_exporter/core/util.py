@@ -1,4 +1,4 @@
-import getpass, os, platform, re, subprocess, sys
+import getpass, json, os, platform, re, subprocess, sys, threading
 
 from ..extensions_framework.util import filesystem_path
 
@@ -95,17 +95,115 @@ def getConsolePath(scene=None):
     elif isWindows():
         return os.path.join(getInstallPath(scene), "indigo_console.exe")
 
-def getVersion(scene=None):
+class BinaryInfoCache(object):
+    '''
+    Metadata read from Indigo binaries, such as the version and the GPU
+    device list, so that indigo_console is only run again once it changes.
+
+    Entries are keyed on the binary path and hold the mtime and size it had
+    when they were made; a binary with a different mtime or size starts a
+    new entry. The cache is stored as JSON in the add-on config directory.
+    '''
+
+    FILENAME = 'indigo_binary_info.json'
+
+    def __init__(self):
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def filename(self):
+        from ..extensions_framework.util import config_paths
+        for p in config_paths:
+            if os.path.isdir(p) and os.access(p, os.W_OK):
+                return os.path.join(p, self.FILENAME)
+        return None
+
+    def load(self):
+        if self.entries == None:
+            self.entries = {}
+            filename = self.filename()
+            if filename != None:
+                try:
+                    with open(filename, 'r') as f:
+                        self.entries = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self.entries
+
+    def save(self):
+        filename = self.filename()
+        if filename == None:
+            return
+        try:
+            temp_filename = '%s.%i.tmp' % (filename, os.getpid())
+            with open(temp_filename, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(temp_filename, filename)
+        except OSError as err:
+            print('Saving Indigo binary info failed: %s' % err)
+
+    def entry(self, path):
+        '''
+        Returns the entry of the binary at path, or None if it doesn't exist.
+        '''
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = [st.st_mtime_ns, st.st_size]
+
+        entries = self.load()
+        entry = entries.get(path)
+        if entry == None or entry.get('signature') != signature:
+            entry = {'signature': signature}
+            entries[path] = entry
+        return entry
+
+    def get(self, path, key, compute=None):
+        '''
+        Returns the value of key for the binary at path. If it isn't cached
+        and compute is given, compute() provides and caches it; a result of
+        None is returned but not cached.
+        '''
+        with self.lock:
+            entry = self.entry(path)
+            if entry != None and key in entry:
+                return entry[key]
+        if compute == None:
+            return None
+
+        value = compute()
+        if value != None:
+            self.set(path, key, value)
+        return value
+
+    def set(self, path, key, value):
+        with self.lock:
+            entry = self.entry(path)
+            if entry == None:
+                return
+            entry[key] = value
+            self.save()
+BinaryInfoCache = BinaryInfoCache()
+
+def readVersion(console_path):
     try:
-        version_str = subprocess.check_output([getConsolePath(scene), '-v'])
+        version_str = subprocess.check_output([console_path, '-v'])
         if len(version_str) > 0:
             version_str = version_str.decode().splitlines()[0]
             grps = re.search(r'(\d+)\.(\d+)\.(\d+)', version_str).groups()
             if grps != None and len(grps) == 3:
-                return tuple([int(n) for n in grps])
-        raise Exception('Error getting Indigo version')
+                return [int(n) for n in grps]
     except Exception:
+        pass
+    return None
+
+def getVersion(scene=None):
+    console_path = getConsolePath(scene)
+    version = BinaryInfoCache.get(console_path, 'version', lambda: readVersion(console_path))
+    if version == None:
         return (0,0,0)
+    return tuple(version)
 
 def get_worldscale(scene):
     ws = 1.0
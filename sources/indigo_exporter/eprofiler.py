@@ -1,3 +1,5 @@
+import json
+import threading
 import timeit
 from functools import reduce
 from collections import OrderedDict
@@ -40,6 +42,121 @@ def results():
         
 def reset():
     instances.clear()
+
+class Phase(object):
+    '''
+    A running phase of an ExportProfiler; stop() it when done. Phases
+    started while it runs are nested below it.
+    '''
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        profiler.stack.append(name)
+        self.path = '/'.join(profiler.stack)
+        self.start_time = timeit.default_timer()
+    
+    def stop(self):
+        elapsed = timeit.default_timer() - self.start_time
+        profiler = self.profiler
+        # Phases left open by an exception end with their parent
+        while len(profiler.stack) > 0:
+            name = profiler.stack.pop()
+            if '/'.join(profiler.stack + [name]) == self.path:
+                break
+        with profiler.lock:
+            entry = profiler.phases.get(self.path)
+            if entry == None:
+                entry = profiler.phases[self.path] = [0.0, 0]
+            entry[0] += elapsed
+            entry[1] += 1
+        return elapsed
+
+class NullPhase(object):
+    def stop(self):
+        return 0.0
+NULL_PHASE = NullPhase()
+
+class ExportProfiler(object):
+    '''
+    Hierarchical timings of one scene export, together with counters, bytes
+    written and the time spent on each object. Phases are aggregated by
+    their path, e.g. "frame 1/scene iteration/to_mesh". Phases are expected
+    on the main thread only; counters and bytes may come from any thread.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stack = []
+        self.phases = OrderedDict()     # path -> [seconds, count]
+        self.counters = OrderedDict()   # name -> count
+        self.bytes = OrderedDict()      # name -> bytes written
+        self.objects = {}               # object name -> [seconds, count]
+        self.start_time = timeit.default_timer()
+    
+    def phase(self, name):
+        return Phase(self, name)
+    
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def add_bytes(self, name, n):
+        with self.lock:
+            self.bytes[name] = self.bytes.get(name, 0) + n
+    
+    def object_time(self, name, elapsed):
+        entry = self.objects.get(name)
+        if entry == None:
+            entry = self.objects[name] = [0.0, 0]
+        entry[0] += elapsed
+        entry[1] += 1
+    
+    def slowest_objects(self, n=10):
+        return sorted(self.objects.items(), key=lambda item: item[1][0], reverse=True)[:n]
+    
+    def report(self):
+        with self.lock:
+            return {
+                'total_seconds': timeit.default_timer() - self.start_time,
+                'phases': [{'path': path, 'seconds': v[0], 'count': v[1]} for path, v in self.phases.items()],
+                'counters': dict(self.counters),
+                'bytes_written': dict(self.bytes),
+                'objects': [{'name': name, 'seconds': v[0], 'count': v[1]} for name, v in self.slowest_objects(len(self.objects))],
+            }
+    
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+# The profiler of the export in progress, if profiling is enabled
+current = None
+
+def begin_export():
+    global current
+    current = ExportProfiler()
+    return current
+
+def end_export():
+    global current
+    profiler, current = current, None
+    return profiler
+
+# Module level helpers, no-ops when no export is being profiled
+
+def phase(name):
+    if current == None:
+        return NULL_PHASE
+    return current.phase(name)
+
+def count(name, n=1):
+    if current != None:
+        current.count(name, n)
+
+def add_bytes(name, n):
+    if current != None:
+        current.add_bytes(name, n)
+
+def object_time(name, elapsed):
+    if current != None:
+        current.object_time(name, elapsed)
     
 if __name__ == "__main__":
     e = start('outside')
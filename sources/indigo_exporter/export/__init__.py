@@ -49,38 +49,39 @@ class xml_builder(object):
             
             x = self.SubElement(elem, key)
             
-            if type(d[key]) is xml_cdata:
-                # Since CDATA handling is near impossible, we'll use
-                # substitute sentinels for characters that would otherwise
-                # get entity-encoded, and substitute them back as we write
-                # to disk
-                cdata = '\n<![CDATA[\n%s\n]]>\n' % d[key]
-                cdata = cdata.replace('<', '{_LESSTHAN_}')
-                cdata = cdata.replace('>', '{_GREATERTHAN_}')
-                x.text = cdata
-                continue
-            
             # dictionary provides nested elements
             if type(d[key]) is dict:
                 self.build_subelements(context, d[key], x)
-                
-            # list provides direct value insertion
-            elif type(d[key]) is list:
-                x.text = ' '.join([str(i) for i in d[key]])
-            
-            # else look up property
             else:
-                for p in self.properties:
-                    if d[key] == p['attr']:
-                        if 'compute' in p.keys():
-                            x.text = str(p['compute'](context, self))
-                        else:
-                            x.text = str(
-                                self.format_types[p['type']](
-                                    context,
-                                    getattr(self, d[key])
-                                )
-                            )
+                x.text = self.format_value(context, d[key])
+    
+    def format_value(self, context, value):
+        """Format a leaf value of a format dict as element text.
+        xml_cdata is kept as is so the scene writer can emit a real
+        CDATA section for it.
+        
+        """
+        
+        if type(value) is xml_cdata:
+            return value
+        
+        # list provides direct value insertion
+        if type(value) is list:
+            return ' '.join([str(i) for i in value])
+        
+        # else look up property
+        for p in self.properties:
+            if value == p['attr']:
+                if 'compute' in p.keys():
+                    return str(p['compute'](context, self))
+                else:
+                    return str(
+                        self.format_types[p['type']](
+                            context,
+                            getattr(self, value)
+                        )
+                    )
+        return None
                             
 class InvalidGeometryException(Exception):
     pass
@@ -145,20 +146,23 @@ class SceneIterator(object):
                 obj = ob_inst.object
     
             if self.canAbort(): break
-            if OBJECT_ANALYSIS: indigo_log('Analysing object %s : %s' % (obj, obj.type))
-                
-            try:
-                # Export only objects which are enabled for render (in the outliner) and visible on a render layer
-                if obj.is_instancer and not obj.show_instancer_for_render:
-                    raise UnexportableObjectException(' -> not visible')
-                
-                if not obj.type in self.supported_mesh_types:
-                    raise UnexportableObjectException('Unsupported object type')
-                
-                if obj.type == 'LIGHT':
-                    self.handleLamp(obj)
-                elif obj.type in ('MESH', 'CURVE', 'SURFACE', 'FONT'):
-                    self.handleMesh(ob_inst)
+            self.handleObjectInstance(ob_inst, obj)
+    
+    def handleObjectInstance(self, ob_inst, obj):
+        if OBJECT_ANALYSIS: indigo_log('Analysing object %s : %s' % (obj, obj.type))
             
-            except UnexportableObjectException as err:
-                if OBJECT_ANALYSIS: indigo_log(' -> Unexportable object: %s : %s : %s' % (obj, obj.type, err))
\ No newline at end of file
+        try:
+            # Export only objects which are enabled for render (in the outliner) and visible on a render layer
+            if obj.is_instancer and not obj.show_instancer_for_render:
+                raise UnexportableObjectException(' -> not visible')
+            
+            if not obj.type in self.supported_mesh_types:
+                raise UnexportableObjectException('Unsupported object type')
+            
+            if obj.type == 'LIGHT':
+                self.handleLamp(obj)
+            elif obj.type in ('MESH', 'CURVE', 'SURFACE', 'FONT'):
+                self.handleMesh(ob_inst)
+        
+        except UnexportableObjectException as err:
+            if OBJECT_ANALYSIS: indigo_log(' -> Unexportable object: %s : %s : %s' % (obj, obj.type, err))
\ No newline at end of file
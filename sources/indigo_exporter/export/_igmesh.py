@@ -120,12 +120,11 @@ class igmesh():
         self.bytes_written += self.calcsize('I')
     
     def encode_string(self, s):
-        slen = len(s)
+        string_bytes = s.encode(encoding='UTF-8')
+        slen = len(string_bytes)
         self.encode_uint32(slen)
-        cf = make_format('c', 1)
-        for c in s:
-            self.file_handle.write( self.pack(cf, ('%s'%c).encode()) )
-        self.bytes_written += slen * self.calcsize('c')
+        self.file_handle.write(string_bytes)
+        self.bytes_written += slen
     
     def encode_vec3f(self, vec3f):
         self.file_handle.write( self.pack(self.f3, *vec3f[:]) )
@@ -324,6 +323,17 @@ class igmesh_stream(igmesh):
         ADD_VERT_NORMAL
         ADD_UV_PAIR
         ADD_TRIANGLE
+        ADD_QUAD
+        ADD_CHUNK
+    
+    Counted sections can also be written in bulk, without knowing the
+    number of items up front:
+        begin_section(SEQ_NVP)    # writes a count placeholder
+        add_chunk(buffer)         # any number of times, raw item data
+        end_section()             # patches the count
+    
+    format_version 3 adds the UV layout flag before the UV pairs and a
+    quad section after the triangles, as written by igmesh_writer.
     '''
     
     SEQ            = None    # current sequence number
@@ -338,17 +348,32 @@ class igmesh_stream(igmesh):
     SEQ_VP        = 9        # vert_positions
     SEQ_NVN        = 10    # num_vert_normals
     SEQ_VN        = 11    # vert_normals
-    SEQ_NUP        = 12    # num_uv_pairs
-    SEQ_UP        = 13    # uv_pairs
-    SEQ_NT        = 14    # num_triangles
-    SEQ_T        = 15    # triangles
-    SEQ_END        = 16    # END
-    
-    def __init__(self, filename):
+    SEQ_UVL        = 12    # uv_layout (v3)
+    SEQ_NUP        = 13    # num_uv_pairs
+    SEQ_UP        = 14    # uv_pairs
+    SEQ_NT        = 15    # num_triangles
+    SEQ_T        = 16    # triangles
+    SEQ_NQ        = 17    # num_quads (v3)
+    SEQ_Q        = 18    # quads (v3)
+    SEQ_END        = 19    # END
+    
+    # Size in bytes of a single item in each counted section
+    SECTION_ITEM_SIZE = {
+        SEQ_VP: 3 * 4,
+        SEQ_VN: 3 * 4,
+        SEQ_UP: 2 * 4,
+        SEQ_T: 7 * 4,
+        SEQ_Q: 9 * 4,
+    }
+    
+    def __init__(self, filename, format_version=1):
         super().__init__()
+        self.format_version = format_version
+        self.section_count_offset = None
+        self.section_count = 0
         self.file_handle = open(filename, 'wb')
         self.add_header()
-        # file is closed after last triangle written
+        # file is closed after last triangle (v1) or quad (v3) written
     
     def finish(self):
         # Update data_length so that len(self) is correct
@@ -362,6 +387,14 @@ class igmesh_stream(igmesh):
             self.finish()
             raise Exception('IGMesh Stream sequence error (%i called, expected %i)' % (SEQ_E, self.SEQ))
     
+    def next_sequence(self):
+        self.SEQ+=1
+        # v1 files have no UV layout flag and no quads
+        if self.format_version < 3 and self.SEQ in (self.SEQ_UVL, self.SEQ_NQ):
+            self.SEQ = self.SEQ_NUP if self.SEQ == self.SEQ_UVL else self.SEQ_END
+        if self.SEQ == self.SEQ_END:
+            self.finish()
+    
     def add_header(self):
         self.encode_uint32(self.magic_number)
         self.encode_uint32(self.format_version)
@@ -370,28 +403,28 @@ class igmesh_stream(igmesh):
     def add_num_uv_mappings(self, val):
         self.check_sequence(self.SEQ_NUVM)
         self.encode_uint32(val)
-        self.SEQ+=1
+        self.next_sequence()
     
     def add_num_used_materials(self, val):
         self.check_sequence(self.SEQ_NUM)
         self.encode_uint32(val)
         self.num_used_materials = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_used_material(self, s):
         self.check_sequence(self.SEQ_UM)
         self.encode_string(s)
         self.num_used_materials-=1
         if self.num_used_materials == 0:
-            self.SEQ+=1
+            self.next_sequence()
     
     def add_num_uv_set_expositions(self, val):
         self.check_sequence(self.SEQ_NUSE)
         self.encode_uint32(val)
         self.num_uv_set_expositions = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_uv_set_exposition(self, name, index):
         self.check_sequence(self.SEQ_USE)
@@ -399,21 +432,21 @@ class igmesh_stream(igmesh):
         self.encode_uint32(index)
         self.num_uv_set_expositions-=1
         if self.num_uv_set_expositions == 0:
-            self.SEQ+=1
+            self.next_sequence()
     
     def add_num_vert_positions(self, val):
         self.check_sequence(self.SEQ_NVP)
         self.encode_uint32(val)
         self.num_vert_positions = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_vert_position(self, vec3f):
         if self.debug: self.check_sequence(self.SEQ_VP)
         self.encode_vec3f(vec3f)
         self.num_vert_positions-=1
         if self.num_vert_positions == 0:
-            self.SEQ+=1
+            self.next_sequence()
 
     def add_vert_position_fast(self, vec3f):
         self.file_handle.write(self.pack(self.f3, *vec3f[:]))
@@ -422,32 +455,37 @@ class igmesh_stream(igmesh):
         self.check_sequence(self.SEQ_NVN)
         self.encode_uint32(val)
         self.num_vert_normals = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_vert_normal(self, vec3f):
         if self.debug: self.check_sequence(self.SEQ_VN)
         self.encode_vec3f(vec3f)
         self.num_vert_normals-=1
         if self.num_vert_normals == 0:
-            self.SEQ+=1
+            self.next_sequence()
 
     def add_vert_normal_fast(self, vec3f):
         self.file_handle.write(self.pack(self.f3, *vec3f[:]))
     
+    def add_uv_layout(self, val):
+        self.check_sequence(self.SEQ_UVL)
+        self.encode_uint32(val)
+        self.next_sequence()
+    
     def add_num_uv_pairs(self, val):
         self.check_sequence(self.SEQ_NUP)
         self.encode_uint32(val)
         self.num_uv_pairs = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_uv_pair(self, vec2f):
         if self.debug: self.check_sequence(self.SEQ_UP)
         self.encode_vec2f(vec2f)
         self.num_uv_pairs -= 1
         if self.num_uv_pairs == 0:
-            self.SEQ+=1
+            self.next_sequence()
     
     def add_uv_pair_fast(self, vec2f):
         self.file_handle.write(self.pack(self.f2, *vec2f[:]))
@@ -458,16 +496,15 @@ class igmesh_stream(igmesh):
         self.check_sequence(self.SEQ_NT)
         self.encode_uint32(val)
         self.num_triangles = val
-        self.SEQ+=1
-        if val == 0: self.SEQ+=1
+        self.next_sequence()
+        if val == 0: self.next_sequence()
     
     def add_triangle(self, tri):
         if self.debug: self.check_sequence(self.SEQ_T)
         self.encode_triangle(tri)
         self.num_triangles -= 1
         if self.num_triangles == 0:
-            self.SEQ+=1
-            self.finish()
+            self.next_sequence()
 
     def add_triangle_fast(self, vert_idx, uv_idx, mat_idx):
 
@@ -475,4 +512,262 @@ class igmesh_stream(igmesh):
         self.file_handle.write( self.pack(self.I3, *uv_idx ))
         self.file_handle.write( self.pack(self.I1, mat_idx ))
 
-        self.bytes_written += 7 * 4 #7 * self.calcsize('I')
\ No newline at end of file
+        self.bytes_written += 7 * 4 #7 * self.calcsize('I')
+    
+    def add_num_quads(self, val):
+        self.check_sequence(self.SEQ_NQ)
+        self.encode_uint32(val)
+        self.num_quads = val
+        self.next_sequence()
+        if val == 0: self.next_sequence()
+    
+    def add_quad(self, vert_idx, uv_idx, mat_idx):
+        if self.debug: self.check_sequence(self.SEQ_Q)
+        self.file_handle.write( self.pack(make_format('I', 4), *vert_idx ))
+        self.file_handle.write( self.pack(make_format('I', 4), *uv_idx ))
+        self.file_handle.write( self.pack(self.I1, mat_idx ))
+        self.bytes_written += 9 * 4
+        self.num_quads -= 1
+        if self.num_quads == 0:
+            self.next_sequence()
+    
+    def begin_section(self, SEQ_N):
+        '''
+        Start a counted section (SEQ_NVP, SEQ_NVN, SEQ_NUP, SEQ_NT or SEQ_NQ)
+        whose number of items is not known yet. A zero count is written as a
+        placeholder and patched by end_section().
+        '''
+        self.check_sequence(SEQ_N)
+        self.section_count_offset = self.file_handle.tell()
+        self.section_count = 0
+        self.encode_uint32(0)
+        self.next_sequence()
+    
+    def add_chunk(self, data):
+        '''
+        Append raw little-endian item data (array.array, numpy array, bytes)
+        to the current section. The buffer must hold whole items.
+        '''
+        if self.debug and self.SEQ not in self.SECTION_ITEM_SIZE:
+            self.check_sequence(self.SEQ_VP)
+        
+        mv = memoryview(data).cast('B')
+        item_size = self.SECTION_ITEM_SIZE[self.SEQ]
+        if mv.nbytes % item_size != 0:
+            self.finish()
+            raise Exception('IGMesh Stream chunk is not a whole number of items (%i bytes, item size %i)' % (mv.nbytes, item_size))
+        
+        self.file_handle.write(mv)
+        self.bytes_written += mv.nbytes
+        self.section_count += mv.nbytes // item_size
+    
+    def end_section(self):
+        '''
+        Patch the count placeholder of the current section and move on to the next one.
+        '''
+        if self.section_count_offset is None:
+            self.finish()
+            raise Exception('IGMesh Stream end_section called without begin_section')
+        
+        end_offset = self.file_handle.tell()
+        self.file_handle.seek(self.section_count_offset)
+        self.file_handle.write(self.pack(self.I1, self.section_count))
+        self.file_handle.seek(end_offset)
+        
+        self.section_count_offset = None
+        self.next_sequence()
+
+class igmesh_view():
+    '''
+    Read-only, memory-mapped view of an .igmesh file.
+    
+    Only the header, material names and section offsets are decoded
+    when the file is opened. The bulk sections are exposed as zero-copy
+    views over the mapped file (numpy arrays if numpy is available,
+    otherwise memoryviews) and are only touched when accessed.
+    
+    Understands format version 1 and the version 3 layout written by
+    igmesh_writer (UV layout flag before the UV pairs, separate quad
+    section after the triangles).
+    
+    Example usage:
+    with igmesh_view('mesh.igmesh') as m:
+        print(m)                       # Prints out mesh info
+        tris = m.triangles             # (num_triangles, 7) uint32
+        vert_indices = tris[:, 0:3]
+    
+    Views stay valid after the file is closed, the mapping is released
+    together with the last of them.
+    '''
+    
+    # Number of 4 byte components per item in each section
+    SECTIONS = (
+        ('vert_positions', 'f', 3),
+        ('vert_normals', 'f', 3),
+        ('uv_pairs', 'f', 2),
+        ('triangles', 'I', 7),
+        ('quads', 'I', 9),
+    )
+    
+    def __init__(self, filename):
+        import mmap
+        from struct import unpack_from
+        self.unpack_from = unpack_from
+        
+        self.filename = filename
+        self.file_handle = open(filename, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file_handle.close()
+            raise Exception('Invalid IGMESH File (empty)')
+        
+        self.views = {}
+        self.offsets = {}
+        self.counts = {}
+        self.uv_layout = 0
+        try:
+            self.decode_header()
+        except Exception:
+            # The caller never gets the view, so nothing else would close the file.
+            self.close()
+            raise
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self.views.clear()
+        try:
+            self.mm.close()
+        except BufferError:
+            # Views handed out are still alive; they keep the mapping valid
+            # and it is unmapped once the last of them is released.
+            pass
+        finally:
+            self.file_handle.close()
+    
+    def read_uint32(self, offset):
+        if offset + 4 > len(self.mm):
+            raise Exception('IGMESH data truncated at offset %i' % offset)
+        return self.unpack_from('<I', self.mm, offset)[0], offset + 4
+    
+    def read_string(self, offset):
+        length, offset = self.read_uint32(offset)
+        return bytes(self.mm[offset:offset + length]).decode('UTF-8'), offset + length
+    
+    def skip_section(self, name, offset, item_components):
+        count, offset = self.read_uint32(offset)
+        self.counts[name] = count
+        self.offsets[name] = offset
+        return offset + count * item_components * 4
+    
+    def decode_header(self):
+        offset = 0
+        self.magic_number, offset = self.read_uint32(offset)
+        if self.magic_number != 5456751:
+            raise Exception('Invalid IGMESH File')
+        
+        self.format_version, offset = self.read_uint32(offset)
+        self.num_uv_mappings, offset = self.read_uint32(offset)
+        
+        # Materials
+        num_used_materials, offset = self.read_uint32(offset)
+        self.used_materials = []
+        for i in range(num_used_materials):                #@UnusedVariable
+            name, offset = self.read_string(offset)
+            self.used_materials.append(name)
+        
+        # UV Expositions
+        num_uv_set_expositions, offset = self.read_uint32(offset)
+        self.uv_set_expositions = {}
+        for i in range(num_uv_set_expositions):            #@UnusedVariable
+            name, offset = self.read_string(offset)
+            ind, offset = self.read_uint32(offset)
+            self.uv_set_expositions[ind] = name
+        
+        # Bulk sections, recording where each one starts
+        for name, letter, components in self.SECTIONS:
+            if self.format_version >= 3 and name == 'uv_pairs':
+                self.uv_layout, offset = self.read_uint32(offset)
+            if self.format_version < 3 and name == 'quads':
+                self.counts[name] = 0
+                self.offsets[name] = offset
+                continue
+            offset = self.skip_section(name, offset, components)
+        
+        if offset != len(self.mm):
+            raise Exception('IGMESH data size mismatch (expected %i bytes, file has %i)' % (offset, len(self.mm)))
+    
+    def get_view(self, name):
+        if name in self.views:
+            return self.views[name]
+        
+        letter, components = [(l, c) for (n, l, c) in self.SECTIONS if n == name][0]
+        count = self.counts[name]
+        offset = self.offsets[name]
+        
+        try:
+            import numpy as np
+            dtype = np.dtype('<f4') if letter == 'f' else np.dtype('<u4')
+            view = np.frombuffer(self.mm, dtype=dtype, count=count * components, offset=offset).reshape((count, components))
+        except ImportError:
+            view = memoryview(self.mm)[offset:offset + count * components * 4].cast(letter, (count, components))
+        
+        self.views[name] = view
+        return view
+    
+    @property
+    def vert_positions(self):
+        return self.get_view('vert_positions')
+    
+    @property
+    def vert_normals(self):
+        return self.get_view('vert_normals')
+    
+    @property
+    def uv_pairs(self):
+        return self.get_view('uv_pairs')
+    
+    @property
+    def triangles(self):
+        return self.get_view('triangles')
+    
+    @property
+    def quads(self):
+        return self.get_view('quads')
+    
+    def __len__(self):
+        return len(self.mm)
+    
+    def __str__(self):
+        return '''<igmesh_view
+    Magic Number:            %s
+    Format Version:            %s
+    Num UV Mappings:        %s
+    Used Materials:            %s
+    UV Set Expositions:        %s
+    UV Layout:                %s
+    Num vert positions:        %s
+    Num Vert Normals:        %s
+    Num UV Pairs:            %s
+    Num Triangles:            %s
+    Num Quads:                %s
+    Data size:                %s bytes
+>''' % (
+        self.magic_number,
+        self.format_version,
+        self.num_uv_mappings,
+        self.used_materials,
+        self.uv_set_expositions,
+        self.uv_layout,
+        self.counts['vert_positions'],
+        self.counts['vert_normals'],
+        self.counts['uv_pairs'],
+        self.counts['triangles'],
+        self.counts['quads'],
+        len(self)
+        )
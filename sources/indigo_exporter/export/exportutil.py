@@ -2,6 +2,11 @@ import mathutils
 
 from decimal import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from .. core.util import get_worldscale
 
 
@@ -74,6 +79,11 @@ def getTransform(scene, obj, matrix, xml_format='matrix'):
         return xform'''
 
 def matrixListToKeyframes(scene, obj, matrix_list):
+    if np is not None and all(p[1] != None for p in matrix_list):
+        matrices = np.array([[list(row) for row in p[1]] for p in matrix_list], dtype=np.float32)
+        times = np.array([p[0] for p in matrix_list], dtype=np.float64)
+        return matrixArrayToKeyframes(scene, matrices[np.newaxis], times[np.newaxis])[0]
+
     if matrix_list[0][1] == None:
         base_matrix = obj.matrix_world
     else:
@@ -122,4 +132,117 @@ def matrixListToKeyframes(scene, obj, matrix_list):
         keyframes.append(dict(keyframes[-1]))
         keyframes[-1]['time'] = [1.0]
         
-    return keyframes
\ No newline at end of file
+    return keyframes
+
+def _matrixToQuaternion(m):
+    # Vectorised mat3_normalized_to_quat over (..., 3, 3) row major matrices.
+    # Returns (..., 4) quaternions (w, x, y, z) with w >= 0.
+    m00, m01, m02 = m[..., 0, 0], m[..., 1, 0], m[..., 2, 0]
+    m10, m11, m12 = m[..., 0, 1], m[..., 1, 1], m[..., 2, 1]
+    m20, m21, m22 = m[..., 0, 2], m[..., 1, 2], m[..., 2, 2]
+
+    tr = 0.25 * (1.0 + m00 + m11 + m22)
+    case_x = (m00 > m11) & (m00 > m22)
+    case_y = m11 > m22
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(np.maximum(tr, 0.0))
+        qt = np.stack([s, (m12 - m21) / (4*s), (m20 - m02) / (4*s), (m01 - m10) / (4*s)], axis=-1)
+
+        s = 2.0 * np.sqrt(np.maximum(1.0 + m00 - m11 - m22, 0.0))
+        qx = np.stack([(m12 - m21) / s, 0.25 * s, (m10 + m01) / s, (m20 + m02) / s], axis=-1)
+
+        s = 2.0 * np.sqrt(np.maximum(1.0 + m11 - m00 - m22, 0.0))
+        qy = np.stack([(m20 - m02) / s, (m10 + m01) / s, 0.25 * s, (m21 + m12) / s], axis=-1)
+
+        s = 2.0 * np.sqrt(np.maximum(1.0 + m22 - m00 - m11, 0.0))
+        qz = np.stack([(m01 - m10) / s, (m20 + m02) / s, (m21 + m12) / s, 0.25 * s], axis=-1)
+
+    q = np.where((tr > 1e-4)[..., np.newaxis], qt,
+            np.where(case_x[..., np.newaxis], qx,
+                np.where(case_y[..., np.newaxis], qy, qz)))
+
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+    q *= np.where(q[..., :1] < 0.0, -1.0, 1.0)
+    return q
+
+def matrixArrayToKeyframeTransforms(matrices):
+    '''
+    Batched form of the per sample maths in matrixListToKeyframes.
+
+    matrices is an (N, K, 4, 4) array of K world matrices for each of N
+    objects, the first sample being the base. Returns (pos, axis, angle)
+    arrays of shape (N, K, 3), (N, K, 3) and (N, K) holding the keyframe
+    translation (not world scaled) and the axis/angle rotation written to
+    <rotation_quaternion>, computed in double precision.
+    '''
+    m = np.asarray(matrices, dtype=np.float64)
+
+    # Transform from the base matrix to each sample, transposed.
+    diff = np.matmul(m, np.linalg.inv(m[:, 0])[:, np.newaxis])
+    diff_t = np.swapaxes(diff, -1, -2)[..., 0:3, 0:3]
+
+    # Rotation part as in Matrix.decompose(): normalise the columns and
+    # flip negative scale.
+    rot = diff_t / np.linalg.norm(diff_t, axis=-2, keepdims=True)
+    rot *= np.where(np.linalg.det(rot) < 0.0, -1.0, 1.0)[..., np.newaxis, np.newaxis]
+    q_diff = _matrixToQuaternion(rot)
+
+    # getTransform writes the quaternion of the transposed keyframe rotation,
+    # i.e. the conjugate of q_diff.
+    w = np.clip(q_diff[..., 0], -1.0, 1.0)
+    half_angle = np.arccos(w)
+    si = np.sin(half_angle)
+    si = np.where(np.abs(si) < np.finfo(np.float32).eps, 1.0, si)
+    axis = -q_diff[..., 1:4] / si[..., np.newaxis]
+    angle = 2.0 * half_angle
+
+    # Same fallback as quat_to_axis_angle for a zero rotation, and no negative zeros.
+    zero_axis = np.all(axis == 0.0, axis=-1)
+    axis[zero_axis] = (0.0, 1.0, 0.0)
+    axis += 0.0
+
+    pos = m[..., 0:3, 3]
+    return (pos, axis, angle)
+
+def matrixArrayToKeyframes(scene, matrices, times):
+    '''
+    Returns a list of N keyframe lists, as matrixListToKeyframes would for
+    each object, for an (N, K, 4, 4) array of sample matrices and an (N, K)
+    array of normalised sample times. Values are rounded to single
+    precision before formatting, as mathutils would have them.
+    '''
+    pos, axis, angle = matrixArrayToKeyframeTransforms(matrices)
+
+    # pos is scaled in single precision like getTransform does.
+    ws = np.float32(get_worldscale(scene))
+    pos = (pos.astype(np.float32) * ws).astype(np.float64).tolist()
+    axis = axis.astype(np.float32).astype(np.float64).tolist()
+    angle = (-angle).astype(np.float32).astype(np.float64).tolist()
+    times = np.asarray(times).tolist()
+
+    keyframes_list = []
+    for n in range(len(times)):
+        keyframes = [
+            {
+                'pos': [str(co) for co in pos[n][k]],
+                'rotation_quaternion': {
+                    'axis': axis[n][k],
+                    'angle': [angle[n][k]]
+                },
+                'time': [times[n][k]]
+            }
+            for k in range(len(times[n]))
+        ]
+
+        # For particles that are born after start frame or die before end frame.
+        if times[n][0] > 0.0:
+            keyframes.insert(0, dict(keyframes[0]))
+            keyframes[0]['time'] = [0.0]
+        if times[n][-1] < 1.0:
+            keyframes.append(dict(keyframes[-1]))
+            keyframes[-1]['time'] = [1.0]
+
+        keyframes_list.append(keyframes)
+
+    return keyframes_list
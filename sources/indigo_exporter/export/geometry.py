@@ -9,6 +9,11 @@ import math
 import hashlib
 import array
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from ..extensions_framework import util as efutil
 
 from .. core.util import get_worldscale
@@ -19,6 +24,8 @@ from .. export import ( indigo_log,
                             )
 from .. export.igmesh import igmesh_writer
 from . import ExportCache
+from . material_graph import MaterialGraph
+from .. import eprofiler as ep
 
 class model_base(xml_builder):
     element_type = 'model'
@@ -271,6 +278,254 @@ class LightingChecker:
             return valid_sp
     
     
+class InstanceStore(object):
+    '''
+    Array-backed store for 'OBJECT' model instances.
+
+    Each instance is a row: an entry in the instance key index and an id into
+    the table of distinct (object, mesh name, scene) models. Each keyframe
+    appends the row, the time and the 16 floats of the matrix to flat
+    arrays, so an instance costs around a hundred bytes instead of a dict
+    entry, a tuple, a list and Matrix copies.
+
+    write() emits instances grouped by model. With numpy, the transforms and
+    keyframes of a whole group are converted at once.
+    '''
+
+    def __init__(self):
+        self.index = {}                     # instance key -> row
+        self.model_ids = {}                 # (obj, mesh_name) -> id into self.models
+        self.models = []                    # (obj, mesh_name, scene)
+        self.mesh_ids = array.array('i')    # per row: id into self.models
+        self.kf_rows = array.array('i')     # per keyframe: row
+        self.kf_times = array.array('d')    # per keyframe: normalised time
+        self.kf_matrices = array.array('f') # per keyframe: 4x4 matrix, row major
+
+    def __len__(self):
+        return len(self.mesh_ids)
+
+    def find(self, key):
+        return self.index.get(key)
+
+    def add(self, key, obj, mesh_name, scene, time, matrix):
+        model_id = self.model_ids.get((obj, mesh_name))
+        if model_id == None:
+            model_id = len(self.models)
+            self.model_ids[(obj, mesh_name)] = model_id
+            self.models.append((obj, mesh_name, scene))
+
+        row = len(self.mesh_ids)
+        self.index[key] = row
+        self.mesh_ids.append(model_id)
+        self.add_keyframe(row, time, matrix)
+
+    def add_keyframe(self, row, time, matrix):
+        self.kf_rows.append(row)
+        self.kf_times.append(time)
+        for matrix_row in matrix:
+            self.kf_matrices.extend(matrix_row)
+
+    def begin_sample(self, time):
+        '''
+        Start a transform sample of the existing rows for a motion blur
+        subframe. Matrices go to a (rows, 4, 4) array allocated up front and
+        are appended as keyframes in one go by end_sample().
+        '''
+        return InstanceSample(self, time)
+
+    def end_sample(self, sample):
+        if np is None or len(sample.rows) == 0:
+            return
+        rows = np.array(sample.rows, dtype=np.int32)
+        self.kf_rows.extend(sample.rows)
+        self.kf_times.extend(array.array('d', [sample.time]) * len(rows))
+        self.kf_matrices.frombytes(sample.matrices[rows].tobytes())
+
+    def keyframe_matrix(self, kf):
+        m = self.kf_matrices
+        return mathutils.Matrix([m[kf*16 + r*4 : kf*16 + r*4 + 4] for r in range(4)])
+
+    def model_definition(self, row, keyframes):
+        obj, mesh_name, scene = self.models[self.mesh_ids[row]]
+        obj_matrices = [(self.kf_times[kf], self.keyframe_matrix(kf)) for kf in keyframes]
+        return ('OBJECT', obj, mesh_name, obj_matrices, scene)
+
+    def write(self, writer, model_xml):
+        '''
+        Write all instances with writer and clear the store. model_xml builds
+        the element for a model definition tuple.
+        '''
+        if np is not None:
+            self.write_numpy(writer, model_xml)
+        else:
+            keyframes = [[] for row in range(len(self.mesh_ids))]
+            for kf, row in enumerate(self.kf_rows):
+                keyframes[row].append(kf)
+            for row in sorted(range(len(self.mesh_ids)), key=self.mesh_ids.__getitem__):
+                writer.write_element(model_xml(self.model_definition(row, keyframes[row])))
+
+        self.__init__()
+
+    def write_numpy(self, writer, model_xml):
+        num_rows = len(self.mesh_ids)
+        if num_rows == 0:
+            return
+
+        mesh_ids = np.array(self.mesh_ids, dtype=np.int32)
+        kf_rows = np.array(self.kf_rows, dtype=np.int32)
+        matrices = np.array(self.kf_matrices, dtype=np.float32).reshape(-1, 4, 4)
+        times = np.array(self.kf_times, dtype=np.float64)
+
+        # Keyframes of each row are contiguous in kf_order, starting at kf_start.
+        kf_order = np.argsort(kf_rows, kind='stable')
+        kf_count = np.bincount(kf_rows, minlength=num_rows)
+        kf_start = np.cumsum(kf_count) - kf_count
+
+        row_order = np.argsort(mesh_ids, kind='stable')
+        group_ends = np.flatnonzero(np.diff(mesh_ids[row_order])) + 1
+        for rows in np.split(row_order, group_ends):
+            obj, mesh_name, scene = self.models[mesh_ids[rows[0]]]
+            builder = model_object(scene)
+            additional = builder.get_additional_elements(obj)
+
+            # Same arithmetic as exportutil.getTransform: scale by the world scale
+            # in single precision, pos from the last column, rotation from the
+            # first three columns.
+            static_rows = rows[kf_count[rows] == 1]
+            m = matrices[kf_order[kf_start[static_rows]]] * np.float32(get_worldscale(scene))
+            positions = m[:, 0:3, 3].astype(np.float64).tolist()
+            rotations = m[:, :, 0:3].reshape(-1, 12).astype(np.float64).tolist()
+            for pos, rotation in zip(positions, rotations):
+                xml_format = {
+                    'mesh_name': [mesh_name],
+                    'scale': [1.0],
+                    'pos': pos,
+                    'rotation': { 'matrix': rotation },
+                }
+                xml_format.update(additional)
+                writer.write_format(builder, obj, {'model': xml_format})
+
+            # Motion blurred instances, batched by keyframe count.
+            moving_rows = rows[kf_count[rows] > 1]
+            for num_keyframes in np.unique(kf_count[moving_rows]).tolist():
+                batch = moving_rows[kf_count[moving_rows] == num_keyframes]
+                kfs = kf_order[kf_start[batch][:, np.newaxis] + np.arange(num_keyframes)]
+                m = matrices[kfs]
+                keyframes_list = exportutil.matrixArrayToKeyframes(scene, m, times[kfs])
+
+                base = m[:, 0] * np.float32(get_worldscale(scene))
+                rotations = base[:, :, 0:3].reshape(-1, 12).astype(np.float64).tolist()
+                for rotation, keyframes in zip(rotations, keyframes_list):
+                    xml_format = {
+                        'mesh_name': [mesh_name],
+                        'scale': [1.0],
+                        'rotation': { 'matrix': rotation },
+                        'keyframe': tuple(keyframes),
+                    }
+                    xml_format.update(additional)
+                    writer.write_format(builder, obj, {'model': xml_format})
+
+class InstanceSample(object):
+    '''
+    Transforms of known instances for one motion blur subframe, see
+    InstanceStore.begin_sample(). Without numpy, keyframes are added to the
+    store directly.
+    '''
+
+    def __init__(self, store, time):
+        self.store = store
+        self.time = time
+        self.rows = array.array('i')
+        if np is not None:
+            self.matrices = np.empty((len(store), 4, 4), dtype=np.float32)
+
+    def add(self, row, matrix):
+        if np is not None:
+            self.rows.append(row)
+            self.matrices[row] = matrix
+        else:
+            self.store.add_keyframe(row, self.time, matrix)
+
+class FrameMeshCache(object):
+    '''
+    Remembers the mesh each object was exported with in the previous frames of
+    an animation render, so objects whose geometry hasn't changed reuse it
+    instead of going through to_mesh() and writing the igmesh again.
+
+    An object's mesh is reused when neither the object nor its mesh or shape
+    keys carry animation data (which covers animated and driven modifier
+    properties), its modifier stack and material slots are unchanged, and its
+    geometry matches the previous frame. For mesh objects that is checked
+    with the full mesh hash of the evaluated mesh, modifiers included, so
+    deformation by other objects or frame change handlers is caught. Other
+    objects can only be checked against what the depsgraph reports as
+    updated, and are not reused when it reports nothing.
+    '''
+
+    def __init__(self):
+        self.job_token = None
+        self.entries = {}
+        self.updated_geometry = set()
+        self.updates_known = False
+
+    def reset(self):
+        self.entries = {}
+
+    def begin_frame(self, depsgraph, job_token):
+        # job_token identifies the export the frames belong to; it must stay the
+        # same across the frames of one render, unlike the depsgraph pointer.
+        if job_token != self.job_token:
+            self.reset()
+            self.job_token = job_token
+
+        self.updated_geometry = set()
+        self.updates_known = False
+        for update in depsgraph.updates:
+            self.updates_known = True
+            if update.is_updated_geometry:
+                self.updated_geometry.add(update.id.name_full)
+
+    def object_key(self, obj, mesh_hash):
+        '''
+        Returns (key, signature) for obj, or (None, None) if the geometry of obj
+        may have changed since the previous frame. mesh_hash(obj, mesh) is
+        GeometryExporter.meshHash.
+        '''
+        orig = obj.original
+        data = orig.data
+
+        if orig.animation_data != None or data.animation_data != None:
+            return (None, None)
+        shape_keys = getattr(data, 'shape_keys', None)
+        if shape_keys != None and shape_keys.animation_data != None:
+            return (None, None)
+        if orig.name_full in self.updated_geometry or data.name_full in self.updated_geometry:
+            return (None, None)
+
+        if obj.type == 'MESH':
+            # The data of an evaluated mesh object is the evaluated mesh.
+            geometry = mesh_hash(obj, obj.data)
+        elif self.updates_known:
+            geometry = None
+        else:
+            return (None, None)
+
+        modifiers = tuple((m.name, m.type, m.show_render) for m in orig.modifiers)
+        materials = tuple(ms.material.name if ms.material != None else '' for ms in orig.material_slots)
+        return ((orig.name_full, data.name_full), (modifiers, materials, geometry))
+
+    def get(self, key, signature):
+        entry = self.entries.get(key)
+        if entry == None or entry[0] != signature:
+            return None
+        return entry[1:]
+
+    def add(self, key, signature, exported_mesh_name, mesh_filename, used_mat_indices, shading_normals):
+        self.entries[key] = (signature, exported_mesh_name, mesh_filename, list(used_mat_indices), shading_normals)
+
+# Persists across the per-frame exports of an animation render.
+frame_mesh_cache = FrameMeshCache()
+
 class GeometryExporter(SceneIterator):
     # Cache
     ExportedMaterials = None
@@ -282,6 +537,28 @@ class GeometryExporter(SceneIterator):
     
     mesh_uses_shading_normals = None
     
+    # Optional MeshWriterPool; when set, igmesh files are written off the main thread
+    mesh_writer_pool = None
+    
+    # Optional MeshCache; persistent manifest of the meshes in mesh_dir
+    mesh_cache = None
+    
+    # Optional FrameMeshCache; meshes exported in previous animation frames
+    frame_mesh_cache = None
+    
+    # Optional MaterialExportCache; material XML exported in previous animation frames
+    material_cache = None
+    
+    # MaterialGraph filling ExportedMaterials, created on first use
+    material_graph = None
+    
+    # Optional xml_stream_writer for objects.igs; when set, <model> elements are
+    # written as soon as they are final instead of being kept in ExportedObjects
+    objects_writer = None
+    
+    # False while iterating motion blur subframes that are followed by more subframes
+    final_subframe = True
+    
     # Options
     normalised_time = 0
     mesh_dir = None
@@ -298,6 +575,8 @@ class GeometryExporter(SceneIterator):
     def __init__(self):        
         self.ExportedMaterials = {}
         self.ExportedObjects = {}
+        self.Instances = InstanceStore() # 'OBJECT' models that aren't written yet
+        self.WrittenObjects = set() # Instance keys already streamed to objects_writer
         self.ExportedDuplis = {}
         self.ExportedLamps = {}
         self.ExportedMeshes = {}
@@ -310,6 +589,18 @@ class GeometryExporter(SceneIterator):
     
     def isLightingValid(self):
         return self.lc.valid_lighting
+    
+    def finishMeshWrites(self):
+        '''
+        Wait for meshes queued on the mesh writer pool.
+        Returns a list of (filename, error) for meshes that failed to write.
+        '''
+        if self.mesh_writer_pool == None:
+            return []
+        
+        errors = self.mesh_writer_pool.join()
+        self.mesh_writer_pool = None
+        return errors
 
     def handleLamp(self, obj):
         if OBJECT_ANALYSIS: indigo_log(' -> handleLamp: %s' % obj)
@@ -345,47 +636,84 @@ class GeometryExporter(SceneIterator):
         return self.exportMeshElement(obj)
 
 
-    def add_vec2_list_hash(self, hash, vec2_list):
-        # Convert the list of vec2s to a list of floats
-        component_list = []
-        for v in vec2_list:
-            component_list.extend([v[0], v[1]])
-
-        a = array.array('f', component_list)
+    def add_collection_hash(self, hash, collection, attr, typecode, components=1):
+        # Bulk-extract attr of every element of collection and hash the raw buffer.
+        # typecode is an array module typecode: 'f' float32, 'i' int32, 'b' bool (one byte)
+        n = len(collection) * components
+        if np is not None:
+            a = np.empty(n, dtype={'f': np.float32, 'i': np.int32, 'b': bool}[typecode])
+        else:
+            a = array.array(typecode, bytes(n * array.array(typecode).itemsize))
+        collection.foreach_get(attr, a)
         hash.update(a)
         return hash
 
-    def add_vec3_list_hash(self, hash, vec3_list):
-        # Convert the list of vec3s to a list of floats
-        component_list = []
-        for v in vec3_list:
-            component_list.extend([v[0], v[1], v[2]])
 
-        a = array.array('f', component_list)
-        hash.update(a)
-        return hash
+    # Returns (key, signature) under which the mesh of obj can be remembered
+    # across exports, or (None, None) if the evaluated geometry of obj doesn't
+    # only depend on its mesh data-block. The signature is the full meshHash
+    # of that data-block, plus the linked library file if any, so any edit
+    # is caught while to_mesh() and the igmesh write are still skipped.
+    def objectCacheKey(self, obj):
+        orig = obj.original
+        data = orig.data
+        if orig.type != 'MESH' or len(orig.modifiers) > 0 or orig.animation_data != None:
+            return (None, None)
+        if data.animation_data != None or data.shape_keys != None:
+            return (None, None)
+
+        key = '%s/%s' % (orig.name, data.name)
+        library_signature = ''
+        library = data.library or orig.library
+        if library != None:
+            library_path = efutil.filesystem_path(library.filepath)
+            try:
+                library_signature = '%s|%i' % (library_path, os.stat(library_path).st_mtime_ns)
+            except OSError:
+                return (None, None)
+            key = '%s:%s' % (library_path, key)
+
+        return (key, '%s|%s' % (library_signature, self.meshHash(orig, data)))
 
 
     # Compute a hash of the mesh data.
     # Returns a string of hex characters
     def meshHash(self, obj, mesh):
 
-        hash = hashlib.sha224()
+        # Same digest length as the sha224 hashes used before, so mesh names keep their shape.
+        hash = hashlib.blake2b(digest_size=28)
+        
+        ### Salt with the igmesh format and writer version ###
+        hash.update(b'igmesh3.w%i' % igmesh_writer.WRITER_VERSION)
 
         ### Hash material names ###
         for ms in obj.material_slots:
             if ms.material != None:
                 hash.update(ms.material.name.encode(encoding='UTF-8'))
 
-        ### Hash Vertex coords ###
-        vertices = []
-        if mesh:
-            for v in mesh.vertices:
-                vertices.append(v.co)
-        else:
+        if not mesh:
             hash.update(obj.data.indigo_mesh.mesh_path.encode(encoding='UTF-8'))
+            return hash.hexdigest()
 
-        self.add_vec3_list_hash(hash, vertices)
+        ### Hash element counts, so the buffers below can't run into each other ###
+        hash.update(array.array('i', [len(mesh.vertices), len(mesh.loops), len(mesh.polygons), len(mesh.edges), len(mesh.uv_layers), mesh.has_custom_normals]))
+
+        ### Hash geometry and topology ###
+        self.add_collection_hash(hash, mesh.vertices, 'co', 'f', 3)
+        self.add_collection_hash(hash, mesh.loops, 'vertex_index', 'i')
+        self.add_collection_hash(hash, mesh.polygons, 'loop_start', 'i')
+        self.add_collection_hash(hash, mesh.polygons, 'loop_total', 'i')
+        self.add_collection_hash(hash, mesh.polygons, 'material_index', 'i')
+
+        ### Hash everything that decides the exported normals ###
+        self.add_collection_hash(hash, mesh.polygons, 'use_smooth', 'b')
+        self.add_collection_hash(hash, mesh.edges, 'use_edge_sharp', 'b')
+        if mesh.has_custom_normals:
+            self.add_collection_hash(hash, mesh.loops, 'normal', 'f', 3)
+
+        ### Hash UVs ###
+        for layer_uv in mesh.uv_layers:
+            self.add_collection_hash(hash, layer_uv.data, 'uv', 'f', 2)
 
         return hash.hexdigest()
 
@@ -403,20 +731,61 @@ class GeometryExporter(SceneIterator):
                 return exported_mesh
         
             mesh = None
-            if not obj.data.indigo_mesh.valid_proxy():
-                # Create mesh with applied modifiers
-                mesh = obj.to_mesh()
-
-            # depsgraph = context.evaluated_depsgraph_get()
-            # object_eval = obj.evaluated_get(depsgraph)
-            # mesh_from_eval = object_eval.to_mesh()
-
-            # Compute a hash over the mesh data (vertex positions, material names etc..)
-            mesh_hash = self.meshHash(obj, mesh)
-
-            # Form a mesh name like "4618cbf0bc13316135d676fffe0a74fc9b0577909246477354da9254"
-            # The name cannot contain the objects name, as the name itself is always unique.
-            exported_mesh_name = bpy.path.clean_name(mesh_hash)
+            exported_mesh_name = None
+            is_proxy = obj.data.indigo_mesh.valid_proxy()
+
+            # Reuse the mesh of a previous animation frame if the object's geometry can't have changed.
+            frame_key = None
+            if self.frame_mesh_cache != None and not is_proxy:
+                frame_key, frame_signature = self.frame_mesh_cache.object_key(obj, self.meshHash)
+                previous = self.frame_mesh_cache.get(frame_key, frame_signature) if frame_key != None else None
+                if previous != None:
+                    ep.count('frame mesh cache hit')
+                    (exported_mesh_name, mesh_filename, used_mat_indices, shading_normals) = previous
+                    exported_mesh = self.MeshesOnDisk.get(exported_mesh_name)
+                    if exported_mesh == None:
+                        exported_mesh = self.finishMeshDefinition(obj, exported_mesh_name, mesh_filename, used_mat_indices, shading_normals)
+                        if self.mesh_cache != None:
+                            self.mesh_cache.get(exported_mesh_name)
+                    self.ExportedMeshes[obj] = exported_mesh
+                    total = time.time() - start_time
+                    self.total_mesh_export_time += total
+                    ep.object_time(obj.name, total)
+                    return exported_mesh
+                elif frame_key != None:
+                    ep.count('frame mesh cache miss')
+
+            # An object whose geometry can't have changed since a previous export
+            # maps straight to its mesh on disk, without evaluating or hashing it.
+            object_key = None
+            if self.mesh_cache != None and not is_proxy:
+                object_key, object_signature = self.objectCacheKey(obj)
+                if object_key != None and self.skip_existing_meshes:
+                    exported_mesh_name = self.mesh_cache.get_object(object_key, object_signature)
+                    ep.count('mesh cache object hit' if exported_mesh_name != None else 'mesh cache object miss')
+
+            if exported_mesh_name == None:
+                if not is_proxy:
+                    # Create mesh with applied modifiers
+                    prof = ep.phase('to_mesh')
+                    mesh = obj.to_mesh()
+                    prof.stop()
+
+                # depsgraph = context.evaluated_depsgraph_get()
+                # object_eval = obj.evaluated_get(depsgraph)
+                # mesh_from_eval = object_eval.to_mesh()
+
+                # Compute a hash over the mesh data (vertex positions, material names etc..)
+                prof = ep.phase('hash')
+                mesh_hash = self.meshHash(obj, mesh)
+                prof.stop()
+
+                # Form a mesh name like "4618cbf0bc13316135d676fffe0a74fc9b0577909246477354da9254"
+                # The name cannot contain the objects name, as the name itself is always unique.
+                exported_mesh_name = bpy.path.clean_name(mesh_hash)
+
+                if object_key != None:
+                    self.mesh_cache.add_object(object_key, object_signature, exported_mesh_name)
 
             # If this mesh has already been exported, then don't export it again
             exported_mesh = self.MeshesOnDisk.get(exported_mesh_name)
@@ -425,7 +794,10 @@ class GeometryExporter(SceneIterator):
                 # Otherwise the mesh checksum will be computed over and over again.
                 self.ExportedMeshes[obj] = exported_mesh
                 if mesh: obj.to_mesh_clear()
-                self.total_mesh_export_time += time.time() - start_time
+                ep.count('shared mesh')
+                total = time.time() - start_time
+                self.total_mesh_export_time += total
+                ep.object_time(obj.name, total)
                 return exported_mesh
 
             # Make full mesh path.
@@ -435,8 +807,22 @@ class GeometryExporter(SceneIterator):
             #indigo_log('full_mesh_path: %s'%full_mesh_path)
 
             # pass the full mesh path to write to filesystem if the object is not a proxy
-            if hasattr(obj.data, 'indigo_mesh') and not obj.data.indigo_mesh.valid_proxy():
-                if os.path.exists(full_mesh_path) and self.skip_existing_meshes:
+            if hasattr(obj.data, 'indigo_mesh') and not is_proxy:
+                cache_entry = None
+                if self.mesh_cache != None and self.skip_existing_meshes:
+                    cache_entry = self.mesh_cache.get(exported_mesh_name)
+
+                if cache_entry == None and mesh == None:
+                    # the mesh file went away after the object was matched to it
+                    mesh = obj.to_mesh()
+
+                if cache_entry != None:
+                    # mesh is on disk and the manifest knows what it uses
+                    ep.count('mesh cache file hit')
+                    used_mat_indices = cache_entry['used_mat_indices']
+                    use_shading_normals = cache_entry['shading_normals']
+                    self.mesh_uses_shading_normals[full_mesh_path] = use_shading_normals
+                elif os.path.exists(full_mesh_path) and self.skip_existing_meshes:
                     # if skipping mesh write, parse faces to gather used mats
                     used_mat_indices = set()
                     num_smooth = 0
@@ -446,47 +832,112 @@ class GeometryExporter(SceneIterator):
                             num_smooth += 1
 
                     use_shading_normals = num_smooth > 0
+                elif self.mesh_writer_pool != None:
+                    # extract the mesh data here, the pool writes the file
+                    prof = ep.phase('igmesh extract')
+                    buffers = igmesh_writer.extract_mesh_buffers(obj, mesh)
+                    prof.stop()
+                    prof = ep.phase('igmesh queue')
+                    self.mesh_writer_pool.submit(full_mesh_path, buffers)
+                    prof.stop()
+                    ep.count('meshes written')
+                    (used_mat_indices, use_shading_normals) = (buffers.used_mat_indices, buffers.use_shading_normals)
+                    self.mesh_uses_shading_normals[full_mesh_path] = use_shading_normals
+                    del buffers
                 else:
                     # else let the igmesh_writer do its thing
+                    prof = ep.phase('igmesh write')
                     (used_mat_indices, use_shading_normals) = igmesh_writer.factory(self.scene, obj, full_mesh_path, mesh, debug=OBJECT_ANALYSIS)
+                    prof.stop()
+                    ep.count('meshes written')
+                    if ep.current != None and os.path.exists(full_mesh_path):
+                        ep.add_bytes('igmesh', os.path.getsize(full_mesh_path))
                     self.mesh_uses_shading_normals[full_mesh_path] = use_shading_normals
+
+                if cache_entry == None and self.mesh_cache != None:
+                    self.mesh_cache.add(exported_mesh_name, mesh_filename, used_mat_indices, use_shading_normals)
             else:
                 # Assume igmesh has same number of mats as the proxy object
                 used_mat_indices = range(len(obj.material_slots))
 
             # Remove mesh.
             if mesh: obj.to_mesh_clear()
-            
-            # Export materials used by this mesh
-            if len(obj.material_slots) > 0:
-                for mi in used_mat_indices:
-                    mat = obj.material_slots[mi].material
-                    if mat == None or mat.name in self.ExportedMaterials: continue
-                    mat_xmls = mat.indigo_material.factory(obj, mat, self.scene)
-                    self.ExportedMaterials[mat.name] = mat_xmls
-
-            # .. put the relative path in the mesh element
-            filename = '/'.join([self.rel_mesh_dir, mesh_filename])
-
-            #print('MESH FILENAME %s' % filename)
 
             shading_normals = True
             if full_mesh_path in self.mesh_uses_shading_normals:
                 shading_normals = self.mesh_uses_shading_normals[full_mesh_path]
 
-            xml = obj.data.indigo_mesh.build_xml_element(obj, filename, shading_normals, exported_name=exported_mesh_name)
+            if frame_key != None:
+                self.frame_mesh_cache.add(frame_key, frame_signature, exported_mesh_name, mesh_filename, used_mat_indices, shading_normals)
 
-            mesh_definition = (exported_mesh_name, xml)
-            
-            self.MeshesOnDisk[exported_mesh_name] = mesh_definition
+            mesh_definition = self.finishMeshDefinition(obj, exported_mesh_name, mesh_filename, used_mat_indices, shading_normals)
             self.ExportedMeshes[obj] = mesh_definition
             
             total = time.time() - start_time
             self.total_mesh_export_time += total
+            ep.object_time(obj.name, total)
             if self.verbose: indigo_log('Mesh Export took: %f s' % total)
 
             return mesh_definition
 
+    def finishMeshDefinition(self, obj, exported_mesh_name, mesh_filename, used_mat_indices, shading_normals):
+        # Export materials used by this mesh
+        if len(obj.material_slots) > 0:
+            if self.material_graph == None:
+                self.material_graph = MaterialGraph(self.scene, self.ExportedMaterials, self.material_cache)
+            for mi in used_mat_indices:
+                self.material_graph.export(obj, obj.material_slots[mi].material)
+
+        # .. put the relative path in the mesh element
+        filename = '/'.join([self.rel_mesh_dir, mesh_filename])
+
+        #print('MESH FILENAME %s' % filename)
+
+        prof = ep.phase('xml build')
+        xml = obj.data.indigo_mesh.build_xml_element(obj, filename, shading_normals, exported_name=exported_mesh_name)
+        prof.stop()
+
+        mesh_definition = (exported_mesh_name, xml)
+        
+        self.MeshesOnDisk[exported_mesh_name] = mesh_definition
+        return mesh_definition
+
+    def instanceKey(self, ob_inst, obj):
+        # If this object was instanced by a DupliObject, hash the DupliObject's persistent_id
+        return hash((*ob_inst.persistent_id, ob_inst.random_id, obj.name, obj.data.name)) # the more the merrier. ob_insts can have identical hash and random_id... 
+
+    def sampleTransforms(self, depsgraph):
+        '''
+        Cheap pass for the motion blur subframes after the first: instances
+        recorded by an earlier pass only get their matrix_world sampled.
+        Everything else (lamps, instances appearing in this subframe) goes
+        through the full handling. Instances that vanished simply get no
+        keyframe; their keyframe list is padded to the end of the exposure
+        like before.
+        '''
+        self.scene = depsgraph.scene_eval
+
+        sample = self.Instances.begin_sample(self.normalised_time)
+        for ob_inst in depsgraph.object_instances:
+            if ob_inst.is_instance:  # Real dupli instance
+                obj = ob_inst.instance_object
+            else:  # Usual object
+                obj = ob_inst.object
+
+            if self.canAbort(): break
+
+            if obj.type in ('MESH', 'CURVE', 'SURFACE', 'FONT'):
+                key = self.instanceKey(ob_inst, obj)
+                row = self.Instances.find(key)
+                if row != None:
+                    sample.add(row, ob_inst.matrix_world)
+                    continue
+                if key in self.ExportedObjects or key in self.WrittenObjects:
+                    continue
+
+            self.handleObjectInstance(ob_inst, obj)
+        self.Instances.end_sample(sample)
+
     def exportModelElements(self, ob_inst, mesh_definition, matrix):
         if ob_inst.is_instance:  # Real dupli instance
             obj = ob_inst.instance_object
@@ -494,15 +945,14 @@ class GeometryExporter(SceneIterator):
             obj = ob_inst.object
 
         if OBJECT_ANALYSIS: indigo_log('exportModelElements: %s, %s' % (obj, mesh_definition))
-        # If this object was instanced by a DupliObject, hash the DupliObject's persistent_id
-        key = hash((*ob_inst.persistent_id, ob_inst.random_id, obj.name, obj.data.name)) # the more the merrier. ob_insts can have identical hash and random_id... 
+        key = self.instanceKey(ob_inst, obj)
         
         # If the model (object) was already exported, only update the keyframe list.
-        emodel = self.ExportedObjects.get(key)
-        if emodel != None:
-            if emodel[0] == 'OBJECT':
-                # Append to list of (time, matrix) tuples.
-                emodel[3].append((self.normalised_time, matrix))
+        row = self.Instances.find(key)
+        if row != None:
+            self.Instances.add_keyframe(row, self.normalised_time, matrix)
+            return
+        if key in self.ExportedObjects or key in self.WrittenObjects:
             return
 
         # Special handling for section planes:  If object has the section_plane attribute set, then export it as a section plane.
@@ -511,8 +961,7 @@ class GeometryExporter(SceneIterator):
 
             model_definition = ('SECTION', xml)
 
-            self.ExportedObjects[key] = model_definition
-            self.object_id += 1
+            self.addModel(key, model_definition)
             return
 
         # Special handling for sphere primitives
@@ -521,8 +970,7 @@ class GeometryExporter(SceneIterator):
 
             model_definition = ('SPHERE', xml)
 
-            self.ExportedObjects[key] = model_definition
-            self.object_id += 1
+            self.addModel(key, model_definition)
             return
 
         mesh_name = mesh_definition[0]
@@ -533,14 +981,42 @@ class GeometryExporter(SceneIterator):
             
             model_definition = ('PORTAL', xml)
 
-            self.ExportedObjects[key] = model_definition
-            self.object_id += 1
+            self.addModel(key, model_definition)
             return
             
-        # Create list of (time, matrix) tuples.
-        obj_matrices = [(self.normalised_time, matrix)]
+        self.object_id += 1
 
-        model_definition = ('OBJECT', obj, mesh_name, obj_matrices, self.scene)
+        if self.objects_writer != None and self.final_subframe:
+            # No keyframes to come, write it out.
+            self.writeModel(('OBJECT', obj, mesh_name, [(self.normalised_time, matrix)], self.scene))
+            self.WrittenObjects.add(key)
+        else:
+            self.Instances.add(key, obj, mesh_name, self.scene, self.normalised_time, matrix)
 
-        self.ExportedObjects[key] = model_definition
-        self.object_id += 1
\ No newline at end of file
+    def addModel(self, key, model_definition):
+        self.object_id += 1
+
+        if self.objects_writer == None:
+            self.ExportedObjects[key] = model_definition
+        else:
+            self.writeModel(model_definition)
+            self.WrittenObjects.add(key)
+
+    def modelXml(self, model_definition):
+        if model_definition[0] == 'OBJECT':
+            obj, mesh_name, obj_matrices, scene = model_definition[1:]
+            return model_object(scene).build_xml_element(obj, mesh_name, obj_matrices)
+        return model_definition[1]
+
+    def writeModel(self, model_definition):
+        self.objects_writer.write_element(self.modelXml(model_definition))
+
+    def writeInstances(self, writer):
+        self.Instances.write(writer, self.modelXml)
+
+    def finishObjectWrites(self):
+        '''
+        Write the streamed object instances that were collecting keyframes.
+        '''
+        self.writeInstances(self.objects_writer)
+        self.WrittenObjects = set()
\ No newline at end of file
@@ -3,8 +3,15 @@ import bpy, bmesh
 from .. export import UnexportableObjectException
 from .. export._igmesh import igmesh, igmesh_stream
 from .. export import ( indigo_log )
+import os
 import time
 import array
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 ### Some utility methods for writing binary data to a file. ###
@@ -39,6 +46,41 @@ def write_list_of_vec2s(file, vec2_list):
     a.tofile(file)
     
     
+def get_used_material_names(obj):
+    used_mat_indices = set()
+    mats = []
+    
+    num_mats = len(obj.material_slots)
+    for mi in range(num_mats):
+        mats.append(obj.material_slots[mi].material)
+        used_mat_indices.add(mi)
+    
+    if len(mats) == 0:
+        return (used_mat_indices, ['blendigo_clay'])
+    
+    # Only actual materials get a name.
+    return (used_mat_indices, [m.indigo_material.get_name(m) for m in mats if m != None])
+    
+    
+def write_used_materials(file, obj):
+    used_mat_indices, material_names = get_used_material_names(obj)
+    
+    # Write num used materials
+    write_uint32(file, len(material_names))
+    
+    for name in material_names:
+        # Write material name
+        write_string(file, name)
+    
+    return used_mat_indices
+    
+    
+def write_array(file, a):
+    # Write number of elements (rows for 2D arrays), then the raw array buffer.
+    write_uint32(file, len(a))
+    a.tofile(file)
+    
+    
 def write_list_of_vec3s(file, vec3_list):
     # Write length of vector
     write_uint32(file, len(vec3_list))
@@ -55,8 +97,35 @@ def write_list_of_vec3s(file, vec3_list):
     
     
 
+class igmesh_buffers(object):
+    '''
+    Raw mesh data copied out of a Blender mesh by igmesh_writer.extract_mesh_buffers,
+    holding everything igmesh_writer.write_mesh_buffers needs.
+    '''
+    def __init__(self):
+        self.material_names = []
+        self.used_mat_indices = set()
+        self.use_loops = False
+        self.use_shading_normals = False
+        self.vertices = None            # (num_verts, 3) float32
+        self.normals = None             # (num_loops or num_verts or 0, 3) float32
+        self.loop_vertex_index = None   # (num_loops,) int32
+        self.loop_start = None          # (num_polys,) int32
+        self.loop_total = None          # (num_polys,) int32
+        self.poly_mat_index = None      # (num_polys,) int32
+        self.loop_uvs = []              # One (num_loops, 2) float32 array per UV set
+    
+    def nbytes(self):
+        arrays = [self.vertices, self.normals, self.loop_vertex_index, self.loop_start, self.loop_total, self.poly_mat_index] + self.loop_uvs
+        return sum(a.nbytes for a in arrays if a is not None)
+
+
 class igmesh_writer(object):
     
+    # Bump whenever the bytes written for a given mesh change. Mesh hashes are
+    # salted with it, so igmesh files cached on disk by an older writer are not reused.
+    WRITER_VERSION = 1
+    
     @staticmethod
     def factory(scene, obj, filename, mesh, debug=False):
         
@@ -71,7 +140,14 @@ class igmesh_writer(object):
             raise Exception("Can only export 'MESH', 'SURFACE', 'FONT', 'CURVE' objects")
         
 
-        (used_mat_indices, use_shading_normals) = igmesh_writer.write_mesh(filename, scene, obj, mesh)
+        writer = igmesh_writer.writer_mode(scene)
+        if writer == 'numpy':
+            (used_mat_indices, use_shading_normals) = igmesh_writer.write_mesh_numpy(filename, scene, obj, mesh)
+        elif writer == 'stream':
+            memory_budget = scene.indigo_engine.igmesh_stream_memory_mb * 1024 * 1024
+            (used_mat_indices, use_shading_normals) = igmesh_writer.write_mesh_streamed(filename, scene, obj, mesh, memory_budget)
+        else:
+            (used_mat_indices, use_shading_normals) = igmesh_writer.write_mesh(filename, scene, obj, mesh)
 
         if debug:
             end_time = time.time()
@@ -80,7 +156,14 @@ class igmesh_writer(object):
         
         return (used_mat_indices, use_shading_normals)
         
-    
+    @staticmethod
+    def writer_mode(scene):
+        # The NumPy writer is the default; the per-element writer is kept as a fallback,
+        # also for the streaming writer, which needs NumPy too.
+        writer = scene.indigo_engine.igmesh_writer
+        if writer in ('numpy', 'stream') and np is None:
+            return 'python'
+        return writer
                 
         
     ################################################################################
@@ -132,41 +215,10 @@ class igmesh_writer(object):
         else:
             write_uint32(file, num_uv_sets)
         
-        #used_mat_indices = rang(obj.material_slots)
-        
-        used_mat_indices = set()
-        mats = []
-        
-        num_mats = len(obj.material_slots)
-        for mi in range(num_mats):
-            mats.append(obj.material_slots[mi].material)
-            used_mat_indices.add(mi)
-        
+        used_mat_indices = write_used_materials(file, obj)
         
         if profile:
             indigo_log('used_mat_indices: %s' % str(used_mat_indices))
-    
-                
-        if len(mats) == 0:
-            # Write num used materials
-            write_uint32(file, 1)
-            
-            # Write material name
-            write_string(file, 'blendigo_clay')
-        else:
-            # Count number of actual materials.
-            count = 0
-            for m in mats:
-                if m == None: continue
-                count += 1
-                
-            # Write num used materials
-            write_uint32(file, count)
-            
-            for m in mats:
-                if m == None: continue
-                # Write material name
-                write_string(file, m.indigo_material.get_name(m))
         
         # Write num uv set expositions.  Note that in v2, these aren't actually read, so can just write zero.
         write_uint32(file, 0)
@@ -308,6 +360,420 @@ class igmesh_writer(object):
         
         return (used_mat_indices, use_shading_normals)
 
+    ################################################################################
+    @staticmethod
+    def write_mesh_numpy(filename, scene, obj, mesh):
+        """
+        Writes the same igmesh as write_mesh, but pulls the mesh data out with
+        foreach_get into typed numpy arrays and builds the UV, triangle and quad
+        blocks with array operations instead of walking the mesh in Python.
+        """
+        buffers = igmesh_writer.extract_mesh_buffers(obj, mesh)
+        igmesh_writer.write_mesh_buffers(filename, buffers)
+        
+        return (buffers.used_mat_indices, buffers.use_shading_normals)
+    
+    @staticmethod
+    def extract_mesh_buffers(obj, mesh):
+        """
+        The part of write_mesh_numpy that needs bpy: triangulates ngons and
+        copies the raw mesh data into numpy arrays. The returned igmesh_buffers
+        no longer reference the mesh, so they can be written from another thread.
+        """
+        profile = False
+        
+        if profile:
+            start_time = time.time()
+        
+        num_polys = len(mesh.polygons)
+        
+        if num_polys < 1:
+            raise UnexportableObjectException('Object %s has no faces!' % obj.name)
+        
+        if len(mesh.vertices) < 1:
+            raise UnexportableObjectException('Object %s has no verts!' % obj.name)
+        
+        loop_total = np.empty(num_polys, dtype=np.int32)
+        mesh.polygons.foreach_get('loop_total', loop_total)
+        
+        # convert ngons to tris. Skip the bmesh round trip entirely if there are none.
+        if (loop_total > 4).any():
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            ngons = tuple(f for f in bm.faces if len(f.verts)>4)
+            bmesh.ops.triangulate(bm, faces=ngons)
+            bm.to_mesh(mesh)
+            bm.free()
+            mesh.update(calc_edges=True)
+            
+            num_polys = len(mesh.polygons)
+            loop_total = np.empty(num_polys, dtype=np.int32)
+            mesh.polygons.foreach_get('loop_total', loop_total)
+        
+        num_verts = len(mesh.vertices)
+        num_loops = len(mesh.loops)
+        
+        b = igmesh_buffers()
+        b.used_mat_indices, b.material_names = get_used_material_names(obj)
+        b.loop_total = loop_total
+        
+        b.loop_start = np.empty(num_polys, dtype=np.int32)
+        mesh.polygons.foreach_get('loop_start', b.loop_start)
+        
+        b.poly_mat_index = np.empty(num_polys, dtype=np.int32)
+        mesh.polygons.foreach_get('material_index', b.poly_mat_index)
+        
+        poly_smooth = np.empty(num_polys, dtype=bool)
+        mesh.polygons.foreach_get('use_smooth', poly_smooth)
+        
+        b.loop_vertex_index = np.empty(num_loops, dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', b.loop_vertex_index)
+        
+        # Same normal export rules as write_mesh.
+        b.use_loops = b.use_shading_normals = mesh.has_custom_normals
+        if not mesh.has_custom_normals:
+            has_smooth_faces = bool(poly_smooth.any())
+            has_flat_faces = not poly_smooth.all()
+            
+            if has_smooth_faces and has_flat_faces:
+                b.use_shading_normals = True
+                b.use_loops = True
+            elif has_smooth_faces:
+                b.use_shading_normals = True
+                edge_sharp = np.empty(len(mesh.edges), dtype=bool)
+                mesh.edges.foreach_get('use_edge_sharp', edge_sharp)
+                b.use_loops = bool(edge_sharp.any())
+            
+            # else: all flat, no normals exported
+        
+        b.vertices = np.empty((num_verts, 3), dtype=np.float32)
+        mesh.vertices.foreach_get('co', b.vertices.ravel())
+        
+        if b.use_loops:
+            b.normals = np.empty((num_loops, 3), dtype=np.float32)
+            mesh.loops.foreach_get('normal', b.normals.ravel())
+        elif b.use_shading_normals:
+            b.normals = np.empty((num_verts, 3), dtype=np.float32)
+            mesh.vertices.foreach_get('normal', b.normals.ravel())
+        else:
+            b.normals = np.empty((0, 3), dtype=np.float32)
+        
+        for layer_uv in mesh.uv_layers: # For each UV set
+            loop_uvs = np.empty((num_loops, 2), dtype=np.float32)
+            layer_uv.data.foreach_get('uv', loop_uvs.ravel())
+            b.loop_uvs.append(loop_uvs)
+        
+        if profile:
+            indigo_log('    Extracting mesh data: %0.5f sec' % (time.time() - start_time))
+        
+        return b
+    
+    @staticmethod
+    def write_mesh_buffers(filename, b, fsync=False):
+        """
+        The part of write_mesh_numpy that doesn't need bpy: builds the derived
+        vertex, UV, triangle and quad arrays from igmesh_buffers and writes
+        each section straight from the array buffer.
+        """
+        profile = False
+        
+        if profile:
+            total_start_time = time.time()
+        
+        num_polys = len(b.loop_total)
+        num_uv_sets = len(b.loop_uvs)
+        
+        # Open file to write to
+        file = open(filename, 'wb')
+        
+        # Write magic number
+        write_uint32(file, 5456751)
+        
+        # Write format version
+        write_uint32(file, 3)
+        
+        # Write num UV mappings. A dummy UV set is always exported.
+        write_uint32(file, max(num_uv_sets, 1))
+        
+        # Write num used materials, then the names.
+        write_uint32(file, len(b.material_names))
+        for name in b.material_names:
+            write_string(file, name)
+        
+        # Write num uv set expositions.
+        write_uint32(file, 0)
+        
+        start_time = time.time()
+        
+        # write vertices
+        if b.use_loops:
+            write_array(file, b.vertices[b.loop_vertex_index])
+        else:
+            write_array(file, b.vertices)
+        
+        # write vertex normals
+        write_array(file, b.normals)
+        
+        if profile:
+            indigo_log('Writing vertices and vertex normals: %0.5f sec' % (time.time() - start_time))
+        
+        start_time = time.time()
+        
+        # Write UV layout
+        write_uint32(file, 1) # UV_LAYOUT_LAYER_VERTEX = 1;
+        
+        # Every polygon gets 4 UV slots per set, triangles leave the 4th slot at (0,0).
+        corner = np.arange(4, dtype=np.int32)
+        if num_uv_sets > 0:
+            corner_valid = corner < b.loop_total[:, None]
+            poly_loops = (b.loop_start[:, None] + corner)[corner_valid]
+            uv_slots = (np.arange(num_polys, dtype=np.int32)[:, None] * 4 + corner)[corner_valid]
+            
+            write_uint32(file, num_uv_sets * num_polys * 4)
+            
+            layer_uvs = np.zeros((num_polys * 4, 2), dtype=np.float32)
+            for loop_uvs in b.loop_uvs: # For each UV set
+                layer_uvs[uv_slots] = loop_uvs[poly_loops]
+                layer_uvs.tofile(file)
+            
+            del layer_uvs, poly_loops, uv_slots, corner_valid
+        else:
+            write_array(file, np.zeros((1, 2), dtype=np.float32))
+        
+        if profile:
+            indigo_log('Total UV time: %0.5f sec' % (time.time() - start_time))
+        
+        start_time = time.time()
+        
+        # Write triangles, then quads.
+        is_tri = b.loop_total == 3
+        for (polys, n) in ((np.flatnonzero(is_tri), 3), (np.flatnonzero(~is_tri), 4)):
+            poly_data = np.zeros((len(polys), 2 * n + 1), dtype=np.int32)
+            
+            poly_corners = b.loop_start[polys, None] + corner[:n]
+            poly_data[:, 0:n] = poly_corners if b.use_loops else b.loop_vertex_index[poly_corners]
+            if num_uv_sets > 0:
+                poly_data[:, n:2 * n] = polys[:, None] * 4 + corner[:n]
+            poly_data[:, 2 * n] = b.poly_mat_index[polys]
+            
+            write_array(file, poly_data)
+            del poly_data, poly_corners
+        
+        if fsync:
+            file.flush()
+            os.fsync(file.fileno())
+        
+        # Close the file we have been writing to.
+        file.close()
+        
+        if profile:
+            indigo_log('Writing triangles and quads: %0.5f sec' % (time.time() - start_time))
+            indigo_log('Total mesh writing time: %0.5f sec' % (time.time() - total_start_time))
+    
+    ################################################################################
+    @staticmethod
+    def write_mesh_streamed(filename, scene, obj, mesh, memory_budget):
+        """
+        Writes the same igmesh as write_mesh, section by section in fixed-size
+        chunks. Each mesh attribute is copied out with foreach_get into a
+        disk backed scratch array next to the output file, which the kernel
+        can page out, and the sections are built from slices of memory_budget
+        (in bytes). Ngons are split along Blender's own loop triangles.
+        Section counts are written as placeholders and patched afterwards, so
+        the memory in use depends on memory_budget rather than on the size of
+        the mesh.
+        """
+        profile = False
+        
+        if profile:
+            total_start_time = time.time()
+        
+        if len(mesh.polygons) < 1:
+            raise UnexportableObjectException('Object %s has no faces!' % obj.name)
+        
+        if len(mesh.vertices) < 1:
+            raise UnexportableObjectException('Object %s has no verts!' % obj.name)
+        
+        scratch_dir = os.path.dirname(os.path.abspath(filename))
+        
+        def bulk(collection, attr, dtype, components=1):
+            # The whole attribute, in a scratch array that doesn't have to fit in memory.
+            n = len(collection) * components
+            a = np.memmap(tempfile.TemporaryFile(dir=scratch_dir), dtype=dtype, mode='w+', shape=(max(n, 1),))[:n]
+            if n > 0:
+                collection.foreach_get(attr, a)
+            return a.reshape(-1, components) if components > 1 else a
+        
+        def chunk_ranges(n, item_size):
+            chunk_len = max(1, memory_budget // item_size)
+            return [(start, min(n, start + chunk_len)) for start in range(0, n, chunk_len)]
+        
+        num_polys = len(mesh.polygons)
+        num_loops = len(mesh.loops)
+        
+        loop_start = bulk(mesh.polygons, 'loop_start', np.int32)
+        loop_total = bulk(mesh.polygons, 'loop_total', np.int32)
+        poly_mat_index = bulk(mesh.polygons, 'material_index', np.int32)
+        loop_vertex_index = bulk(mesh.loops, 'vertex_index', np.int32)
+        
+        # Per polygon: loop_start, loop_total, material_index, and up to 4 corners and UV slots of each set.
+        poly_chunks = chunk_ranges(num_polys, 3 * 4 + 4 * 8 + max(len(mesh.uv_layers), 1) * 4 * 8)
+        
+        has_ngons = any((loop_total[start:end] > 4).any() for (start, end) in poly_chunks)
+        if has_ngons:
+            if hasattr(mesh, 'calc_loop_triangles'):
+                mesh.calc_loop_triangles()
+            tri_loops = bulk(mesh.loop_triangles, 'loops', np.int32, 3)
+        
+        render_uvs = [uvl for uvl in mesh.uv_layers]
+        num_uv_sets = len(render_uvs)
+        
+        # Same normal export rules as write_mesh.
+        use_loops = use_shading_normals = mesh.has_custom_normals
+        if not mesh.has_custom_normals:
+            poly_smooth = bulk(mesh.polygons, 'use_smooth', bool)
+            has_smooth_faces = any(poly_smooth[start:end].any() for (start, end) in poly_chunks)
+            has_flat_faces = not all(poly_smooth[start:end].all() for (start, end) in poly_chunks)
+            del poly_smooth
+            
+            if has_smooth_faces and has_flat_faces:
+                use_shading_normals = True
+                use_loops = True
+            elif has_smooth_faces:
+                use_shading_normals = True
+                edge_sharp = bulk(mesh.edges, 'use_edge_sharp', bool)
+                use_loops = any(edge_sharp[start:end].any() for (start, end) in chunk_ranges(len(edge_sharp), 1))
+                del edge_sharp
+            
+            # else: all flat, no normals exported
+        
+        def stream_polys():
+            """
+            Yields (first output polygon, corners, num corners, material indices)
+            per chunk of polygons, with ngons split into their loop triangles.
+            corners holds 4 loop indices per output polygon, the unused 4th
+            corner of triangles repeats the 3rd.
+            """
+            out_start = 0
+            tri_start = 0
+            corner = np.arange(4)
+            for (start, end) in poly_chunks:
+                chunk_loop_start = np.asarray(loop_start[start:end], dtype=np.int64)
+                chunk_loop_total = np.asarray(loop_total[start:end], dtype=np.int64)
+                
+                # Every polygon has loop_total - 2 loop triangles, stored in polygon order.
+                num_tris = chunk_loop_total - 2
+                is_ngon = chunk_loop_total > 4
+                num_out = np.where(is_ngon, num_tris, 1)
+                src = np.repeat(np.arange(end - start), num_out)
+                
+                corners = chunk_loop_start[src, None] + corner
+                num_corners = np.where(is_ngon[src], 3, chunk_loop_total[src])
+                
+                out_is_ngon = is_ngon[src]
+                if out_is_ngon.any():
+                    poly_tri_start = tri_start + np.cumsum(num_tris) - num_tris
+                    tri_index = np.arange(len(src)) - np.repeat(np.cumsum(num_out) - num_out, num_out)
+                    rows = (poly_tri_start[src] + tri_index)[out_is_ngon]
+                    corners[out_is_ngon, 0:3] = tri_loops[rows]
+                corners[:, 3] = np.where(num_corners == 4, corners[:, 3], corners[:, 2])
+                
+                yield (out_start, corners, num_corners, np.asarray(poly_mat_index[start:end])[src])
+                out_start += len(src)
+                tri_start += int(num_tris.sum())
+        
+        stream = igmesh_stream(filename, format_version=3)
+        
+        # Write num UV mappings. A dummy UV set is always exported.
+        stream.add_num_uv_mappings(max(num_uv_sets, 1))
+        
+        used_mat_indices, mat_names = get_used_material_names(obj)
+        stream.add_num_used_materials(len(mat_names))
+        for name in mat_names:
+            stream.add_used_material(name)
+        
+        # Write num uv set expositions.
+        stream.add_num_uv_set_expositions(0)
+        
+        start_time = time.time()
+        
+        # write vertices
+        vertices = bulk(mesh.vertices, 'co', np.float32, 3)
+        stream.begin_section(stream.SEQ_NVP)
+        if use_loops:
+            for (start, end) in chunk_ranges(num_loops, 12 + 4):
+                stream.add_chunk(vertices[loop_vertex_index[start:end]])
+        else:
+            for (start, end) in chunk_ranges(len(vertices), 12):
+                stream.add_chunk(np.ascontiguousarray(vertices[start:end]))
+        stream.end_section()
+        del vertices
+        
+        # write vertex normals
+        stream.begin_section(stream.SEQ_NVN)
+        if use_loops or use_shading_normals:
+            normals = bulk(mesh.loops if use_loops else mesh.vertices, 'normal', np.float32, 3)
+            for (start, end) in chunk_ranges(len(normals), 12):
+                stream.add_chunk(np.ascontiguousarray(normals[start:end]))
+            del normals
+        stream.end_section()
+        
+        if profile:
+            indigo_log('Writing vertices and vertex normals: %0.5f sec' % (time.time() - start_time))
+        
+        start_time = time.time()
+        
+        # Write UV layout
+        stream.add_uv_layout(1) # UV_LAYOUT_LAYER_VERTEX = 1;
+        
+        # Every output polygon gets 4 UV slots per set, triangles leave the 4th slot at (0,0).
+        corner = np.arange(4)
+        stream.begin_section(stream.SEQ_NUP)
+        if num_uv_sets > 0:
+            for layer_uv in render_uvs: # For each UV set
+                loop_uvs = bulk(layer_uv.data, 'uv', np.float32, 2)
+                for (out_start, corners, num_corners, mat_index) in stream_polys():
+                    corner_valid = corner < num_corners[:, None]
+                    layer_uvs = np.zeros((len(corners), 4, 2), dtype=np.float32)
+                    layer_uvs[corner_valid] = loop_uvs[corners[corner_valid]]
+                    stream.add_chunk(layer_uvs)
+                    del layer_uvs
+                del loop_uvs
+        else:
+            stream.add_chunk(np.zeros(2, dtype=np.float32))
+        stream.end_section()
+        
+        if profile:
+            indigo_log('Total UV time: %0.5f sec' % (time.time() - start_time))
+        
+        start_time = time.time()
+        
+        # Write triangles, then quads. Each is a separate pass over the polygons.
+        for (SEQ_N, n) in ((stream.SEQ_NT, 3), (stream.SEQ_NQ, 4)):
+            stream.begin_section(SEQ_N)
+            for (out_start, corners, num_corners, mat_index) in stream_polys():
+                polys = np.flatnonzero(num_corners == n)
+                if len(polys) == 0:
+                    continue
+                
+                poly_corners = corners[polys, :n]
+                poly_data = np.zeros((len(polys), 2 * n + 1), dtype=np.int32)
+                poly_data[:, 0:n] = poly_corners if use_loops else loop_vertex_index[poly_corners]
+                if num_uv_sets > 0:
+                    poly_data[:, n:2 * n] = (out_start + polys[:, None]) * 4 + corner[:n]
+                poly_data[:, 2 * n] = mat_index[polys]
+                stream.add_chunk(poly_data)
+                del poly_data, poly_corners
+            stream.end_section()
+        
+        # The stream closes the file after the last section.
+        
+        if profile:
+            indigo_log('Writing triangles and quads: %0.5f sec' % (time.time() - start_time))
+            indigo_log('Total mesh writing time: %0.5f sec' % (time.time() - total_start_time))
+        
+        return (used_mat_indices, use_shading_normals)
+
 def populate_vertices(mesh, vertices, use_loops):
     if use_loops:
         for l in mesh.loops:
@@ -0,0 +1,185 @@
+import hashlib, os
+
+import bpy            #@UnresolvedImport
+
+from ..extensions_framework import util as efutil
+from . import indigo_log
+from . texture_proxy import preview_texture_size
+from . texture_cache import image_texture_cache
+from .. import eprofiler as ep
+
+def file_signature(path):
+    try:
+        st = os.stat(efutil.filesystem_path(path))
+        return (st.st_mtime_ns, st.st_size)
+    except (OSError, ValueError):
+        return None
+
+def property_values(pg, values, refs):
+    '''
+    Append (identifier, value) for every property of the property group pg,
+    descending into nested groups. Names of referenced textures and texts,
+    and the state of referenced files, are collected in refs.
+    '''
+    for prop in pg.bl_rna.properties:
+        ident = prop.identifier
+        if ident == 'rna_type':
+            continue
+        value = getattr(pg, ident)
+
+        if prop.type == 'POINTER':
+            if isinstance(value, bpy.types.ID):
+                values.append((ident, value.name))
+            elif value != None:
+                property_values(value, values, refs)
+        elif prop.type == 'COLLECTION':
+            for item in value:
+                property_values(item, values, refs)
+        else:
+            if prop.type == 'ENUM' and prop.is_enum_flag:
+                value = tuple(sorted(value))
+            elif getattr(prop, 'is_array', False):
+                value = tuple(value)
+            values.append((ident, value))
+
+            if prop.type == 'STRING' and value != '':
+                if ident.endswith('_TX_texture'):
+                    refs['textures'].add(value)
+                elif ident.endswith('_SH_text'):
+                    refs['texts'].add(value)
+                elif prop.subtype == 'FILE_PATH':
+                    refs['files'].add(value)
+
+def material_fingerprint(obj, mat, scene, context_key):
+    '''
+    A digest of everything the XML of mat depends on: the Indigo property
+    groups used by its type, the textures, images, shader texts and files
+    they refer to, the UV layer names of obj and the export context.
+    '''
+    from ..properties.material import MATERIAL_FEATURES
+
+    im = mat.indigo_material
+    values = [('type', im.type), ('context', context_key)]
+    refs = {'textures': set(), 'texts': set(), 'files': set()}
+    for feature in sorted(MATERIAL_FEATURES.get(im.type, ())):
+        values.append(('feature', feature))
+        property_values(getattr(im, 'indigo_material_%s' % feature), values, refs)
+
+    if obj != None and obj.data != None and hasattr(obj.data, 'uv_layers'):
+        values.append(('uv_layers', tuple(obj.data.uv_layers.keys())))
+
+    for tex_name in sorted(refs['textures']):
+        tex = bpy.data.textures.get(tex_name)
+        if tex == None:
+            values.append(('texture', tex_name, None))
+            continue
+        tex_refs = {'textures': set(), 'texts': set(), 'files': set()}
+        tex_values = [('texture', tex_name)]
+        property_values(tex.indigo_texture, tex_values, tex_refs)
+        values.extend(tex_values)
+        refs['files'].update(tex_refs['files'])
+
+        if tex.indigo_texture.image_ref == 'blender':
+            img = bpy.data.images.get(tex.indigo_texture.image)
+            if img != None:
+                values.append(('image', img.name, img.filepath, img.source, img.packed_file != None, img.is_dirty))
+                # Generated and packed images may change without a change to their settings,
+                # they are written to a file named by the same content key.
+                if img.source != 'FILE' or img.packed_file:
+                    values.append(('image content', image_texture_cache.image_key(img, scene)[0]))
+                else:
+                    refs['files'].add(img.filepath)
+
+    for text_name in sorted(refs['texts']):
+        text = bpy.data.texts.get(text_name)
+        values.append(('text', text_name, text.as_string() if text != None else None))
+
+    for path in sorted(refs['files']):
+        values.append(('file', path, file_signature(path)))
+
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+class MaterialExportCache(object):
+    '''
+    Material XML kept between the frames of an animation export, keyed on
+    material name and only valid while the fingerprint matches.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.entries = {}
+
+    def get(self, name, fingerprint):
+        entry = self.entries.get(name)
+        if entry != None and entry[0] == fingerprint:
+            return entry[1]
+        return None
+
+    def add(self, name, fingerprint, elements):
+        self.entries[name] = (fingerprint, elements)
+
+# Lives across the export of consecutive animation frames.
+material_export_cache = MaterialExportCache()
+
+class MaterialGraph(object):
+    '''
+    Exports materials together with the materials they reference (blend
+    inputs, coating substrates and double sided thin front and back), each
+    exactly once. Referenced materials are visited first, so exported holds
+    material XML in dependency order.
+    '''
+    def __init__(self, scene, exported, cache=None):
+        self.scene = scene
+        self.exported = exported    # material name -> list of XML elements
+        self.cache = cache
+        self.visiting = set()
+        self.reused = 0
+
+        lightlayers = scene.indigo_lightlayers
+        self.context_key = (
+            os.path.dirname(efutil.export_path),
+            efutil.scene_filename(),
+            scene.name,
+            scene.render.image_settings.file_format,
+            tuple(sorted(lightlayers.enumerate().items())),
+            lightlayers.ignore,
+            preview_texture_size(scene),
+        )
+
+    def export(self, obj, mat):
+        if mat == None or mat.name in self.exported:
+            return
+        if mat.name in self.visiting:
+            indigo_log('Material "%s" references itself, skipping the reference' % mat.name, message_type='WARNING')
+            return
+
+        self.visiting.add(mat.name)
+        try:
+            for dep in mat.indigo_material.dependencies():
+                self.export(obj, dep)
+        finally:
+            self.visiting.discard(mat.name)
+
+        if self.cache == None:
+            self.exported[mat.name] = self.factory(obj, mat)
+            return
+
+        prof = ep.phase('material fingerprint')
+        fingerprint = material_fingerprint(obj, mat, self.scene, self.context_key)
+        prof.stop()
+        elements = self.cache.get(mat.name, fingerprint)
+        if elements == None:
+            ep.count('material cache miss')
+            elements = self.factory(obj, mat)
+            self.cache.add(mat.name, fingerprint, elements)
+        else:
+            ep.count('material cache hit')
+            self.reused += 1
+        self.exported[mat.name] = elements
+
+    def factory(self, obj, mat):
+        prof = ep.phase('material factory')
+        elements = mat.indigo_material.factory(obj, mat, self.scene)
+        prof.stop()
+        return elements
@@ -1,11 +1,11 @@
-import os
-
 import bpy            #@UnresolvedImport
 
 from ...extensions_framework import util as efutil
 
 from .. import xml_builder, xml_cdata
 from .. materials.spectra import blackbody, rgb, uniform
+from .. texture_cache import image_texture_cache
+from .. texture_proxy import texture_proxy_cache
 
 class MaterialBase(xml_builder):
     
@@ -97,7 +97,7 @@ class MaterialBase(xml_builder):
                     
                     if tex_property_group.image_ref == 'file':
                         relative_texture_path = efutil.path_relative_to_export(
-                            getattr(tex_property_group, 'path')
+                            texture_proxy_cache.get_path(self.scene, getattr(tex_property_group, 'path'))
                         )
                     elif tex_property_group.image_ref == 'blender':
                         if not tex_property_group.image in bpy.data.images:
@@ -111,16 +111,10 @@ class MaterialBase(xml_builder):
                             bl_img_path = img.filepath
                         
                         if img.source != 'FILE' or img.packed_file:
-                            bl_file_formatted = os.path.splitext(os.path.basename(bl_img_path))[0]
-                            bl_file_formatted = '%s.%s' % (bl_file_formatted, self.scene.render.image_settings.file_format)
-                            bl_img_path = os.path.join(
-                                efutil.export_path,
-                                efutil.scene_filename(),
-                                bpy.path.clean_name(self.scene.name),
-                                '%05d' % self.scene.frame_current,
-                                bl_file_formatted
-                            )
-                            img.save_render(bl_img_path, scene=self.scene)
+                            # Written once per image content, shared by all materials and frames
+                            bl_img_path = image_texture_cache.get_path(img, bl_img_path, self.scene)
+                        else:
+                            bl_img_path = texture_proxy_cache.get_path(self.scene, bl_img_path)
                         
                         relative_texture_path = efutil.path_relative_to_export(bl_img_path)
                     
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+
+# Meshes used since the add-on was loaded may still be referenced by scenes
+# exported earlier in this session (e.g. queued animation frames).
+SESSION_START = time.time()
+
+class MeshCache(object):
+    '''
+    Persistent manifest of the igmesh files in a mesh directory.
+
+    Meshes are keyed by content hash (GeometryExporter.meshHash) and record
+    the file name, size, writer version, used material indices, whether
+    shading normals are used, and when the mesh was last used. Objects whose
+    geometry is known not to have changed can also be mapped straight to a
+    mesh hash, so a repeat export doesn't have to evaluate or hash them.
+
+    The manifest is merged with the copy on disk and replaced atomically
+    on save(), so exports sharing a mesh directory don't lose each other's
+    entries.
+    '''
+
+    MANIFEST_NAME = 'mesh_cache.json'
+    MANIFEST_VERSION = 1
+
+    def __init__(self, mesh_dir, writer_version):
+        self.mesh_dir = mesh_dir
+        self.manifest_path = os.path.join(mesh_dir, self.MANIFEST_NAME)
+        self.writer_version = writer_version
+        self.lock = threading.Lock()
+
+        self.meshes = {}
+        self.objects = {}
+        self.used_meshes = set() # hashes used by the current export
+
+        self.meshes, self.objects = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != self.MANIFEST_VERSION:
+                return ({}, {})
+            return (manifest.get('meshes', {}), manifest.get('objects', {}))
+        except (OSError, ValueError):
+            return ({}, {})
+
+    def mesh_path(self, entry):
+        return os.path.join(self.mesh_dir, entry['file'])
+
+    def get(self, mesh_hash):
+        '''
+        Returns the manifest entry for mesh_hash if its igmesh file is on disk
+        and was written by the current writer, otherwise None.
+        '''
+        with self.lock:
+            entry = self.meshes.get(mesh_hash)
+            if entry == None or entry['writer_version'] != self.writer_version:
+                return None
+
+            try:
+                size = os.path.getsize(self.mesh_path(entry))
+            except OSError:
+                return None
+            if entry['size'] != None and entry['size'] != size:
+                return None
+
+            entry['last_used'] = time.time()
+            self.used_meshes.add(mesh_hash)
+            return entry
+
+    def add(self, mesh_hash, filename, used_mat_indices, use_shading_normals):
+        '''
+        Record a mesh written (or about to be written) by this export.
+        The file size is filled in by save().
+        '''
+        with self.lock:
+            self.meshes[mesh_hash] = {
+                'file': filename,
+                'size': None,
+                'writer_version': self.writer_version,
+                'used_mat_indices': sorted(used_mat_indices),
+                'shading_normals': use_shading_normals,
+                'last_used': time.time(),
+            }
+            self.used_meshes.add(mesh_hash)
+
+    def get_object(self, object_key, signature):
+        '''
+        Returns the mesh hash recorded for object_key if the object signature
+        still matches and the mesh is still valid, otherwise None.
+        '''
+        entry = self.objects.get(object_key)
+        if entry == None or entry['signature'] != signature:
+            return None
+        if self.get(entry['hash']) == None:
+            return None
+        return entry['hash']
+
+    def add_object(self, object_key, signature, mesh_hash):
+        with self.lock:
+            self.objects[object_key] = {
+                'signature': signature,
+                'hash': mesh_hash,
+            }
+
+    def evict(self, max_bytes):
+        '''
+        Delete least recently used igmesh files until the mesh directory holds
+        at most max_bytes of them. Meshes used in this session are never
+        deleted, so the cap can be exceeded. igmesh files missing from the
+        manifest are treated as last used at their mtime.
+        '''
+        candidates = []
+        total = 0
+        for name in os.listdir(self.mesh_dir):
+            if not name.endswith('.igmesh'):
+                continue
+            path = os.path.join(self.mesh_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            total += st.st_size
+
+            mesh_hash = name[:-len('.igmesh')]
+            if mesh_hash in self.used_meshes:
+                continue
+            entry = self.meshes.get(mesh_hash)
+            last_used = entry['last_used'] if entry != None else st.st_mtime
+            if last_used >= SESSION_START:
+                continue
+            candidates.append((last_used, st.st_size, mesh_hash, path))
+
+        candidates.sort()
+        evicted = 0
+        for last_used, size, mesh_hash, path in candidates:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+            self.meshes.pop(mesh_hash, None)
+
+        if evicted > 0:
+            self.objects = {k: v for k, v in self.objects.items() if v['hash'] in self.meshes}
+
+        return evicted
+
+    def save(self):
+        '''
+        Fill in file sizes, merge with the manifest on disk and write it atomically.
+        '''
+        with self.lock:
+            for mesh_hash in self.used_meshes:
+                entry = self.meshes.get(mesh_hash)
+                if entry == None:
+                    continue
+                try:
+                    entry['size'] = os.path.getsize(self.mesh_path(entry))
+                except OSError:
+                    del self.meshes[mesh_hash]
+
+            # Keep entries other exports added since we loaded the manifest,
+            # unless their file has been evicted.
+            disk_meshes, disk_objects = self.read_manifest()
+            for mesh_hash, entry in disk_meshes.items():
+                if mesh_hash not in self.meshes and os.path.exists(self.mesh_path(entry)):
+                    self.meshes[mesh_hash] = entry
+            for object_key, entry in disk_objects.items():
+                if object_key not in self.objects and entry['hash'] in self.meshes:
+                    self.objects[object_key] = entry
+
+            manifest = {
+                'version': self.MANIFEST_VERSION,
+                'meshes': self.meshes,
+                'objects': self.objects,
+            }
+
+            temp_path = '%s.%i.tmp' % (self.manifest_path, os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f, indent=1)
+            os.replace(temp_path, self.manifest_path)
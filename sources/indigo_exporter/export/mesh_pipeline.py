@@ -0,0 +1,73 @@
+import os
+import queue
+import threading
+
+from .. export import indigo_log
+from .. export.igmesh import igmesh_writer
+from .. import eprofiler as ep
+
+class MeshWriterPool(object):
+    '''
+    Writes igmesh files on a pool of worker threads.
+
+    The main thread extracts mesh data with igmesh_writer.extract_mesh_buffers
+    and submits it; the workers build the igmesh sections, write and fsync the
+    file. The queue is bounded, so submit() blocks once queue_depth meshes are
+    waiting, which caps the memory held by extracted buffers.
+
+    join() must be called before the scene file referencing the meshes is
+    written. Errors raised by the workers are collected in self.errors.
+    '''
+
+    def __init__(self, num_workers, queue_depth):
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self.errors = []
+        self.errors_lock = threading.Lock()
+        self.threads = []
+
+        for i in range(max(1, num_workers)):
+            t = threading.Thread(target=self.worker, name='igmesh writer %i' % i, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, filename, buffers):
+        self.queue.put((filename, buffers))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            filename, buffers = item
+            # Write to a temporary file first so an interrupted export never
+            # leaves a truncated igmesh behind for skip_existing_meshes to pick up.
+            temp_filename = '%s.%i.tmp' % (filename, threading.get_ident())
+            try:
+                igmesh_writer.write_mesh_buffers(temp_filename, buffers, fsync=True)
+                os.replace(temp_filename, filename)
+                ep.add_bytes('igmesh', os.path.getsize(filename))
+            except Exception as err:
+                with self.errors_lock:
+                    self.errors.append((filename, err))
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+            finally:
+                del item, buffers
+                self.queue.task_done()
+
+    def join(self):
+        '''
+        Wait for all submitted meshes to be written and stop the workers.
+        '''
+        for t in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+        for filename, err in self.errors:
+            indigo_log('Failed to write mesh %s: %s' % (filename, err), message_type='ERROR')
+
+        return self.errors
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zipfile
+
+from ..extensions_framework import util as efutil
+
+class PigmCache(object):
+    '''
+    Shared cache of extracted PIGM (zipped external material) archives.
+
+    Archives are identified by a hash of their content, so the same PIGM
+    is extracted once however many paths or blend files refer to it. To
+    avoid rehashing, the hash is remembered for each (path, size, mtime).
+    Each archive gets a directory in the cache holding the extracted
+    files and an info.json with the name of the IGM inside, and the
+    material name and emission flag parsed from it.
+
+    Exports hardlink the extracted files into the export directory, and
+    fall back to copying where hardlinks aren't possible. Files already
+    linked or copied there are left alone.
+    '''
+
+    INDEX_NAME = 'index.json'
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(efutil.temp_directory(), 'blendigo_pigm_cache')
+        self.lock = threading.RLock()
+        self.index = None   # 'path|size|mtime' -> content hash
+        self.infos = {}     # content hash -> info dict
+        self.linked = set() # (content hash, export dir) linked by this session
+
+    def index_path(self):
+        return os.path.join(self.cache_dir, self.INDEX_NAME)
+
+    def load_index(self):
+        if self.index == None:
+            try:
+                with open(self.index_path(), 'r') as f:
+                    index = json.load(f)
+                self.index = index.get('files', {}) if index.get('version') == self.CACHE_VERSION else {}
+            except (OSError, ValueError):
+                self.index = {}
+        return self.index
+
+    def save_index(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = '%s.%i.tmp' % (self.index_path(), os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump({'version': self.CACHE_VERSION, 'files': self.index}, f, indent=1)
+            os.replace(temp_path, self.index_path())
+        except OSError as err:
+            print('Saving PIGM cache index failed: %s' % err)
+
+    def content_hash(self, path):
+        '''
+        Content hash of the archive at path, computed once per path, size and mtime.
+        '''
+        st = os.stat(path)
+        key = '%s|%i|%i' % (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+        with self.lock:
+            index = self.load_index()
+            if key in index:
+                return index[key]
+
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        with self.lock:
+            self.index[key] = digest
+            self.save_index()
+        return digest
+
+    def entry_dir(self, digest):
+        return os.path.join(self.cache_dir, digest)
+
+    def info(self, path, parse_igm):
+        '''
+        Returns the info dict of the archive at path, with keys igm_filename
+        ('' if the archive holds no IGM), igm_name and igm_emit. parse_igm
+        is called with the raw IGM contents and returns (name, emitting);
+        it is only called the first time an archive is seen. Returns None
+        if path isn't a zip file.
+        '''
+        digest = self.content_hash(path)
+        with self.lock:
+            if digest in self.infos:
+                return self.infos[digest]
+
+        info_path = os.path.join(self.entry_dir(digest), 'info.json')
+        try:
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+
+        if info == None:
+            if not zipfile.is_zipfile(path):
+                return None
+
+            info = {'igm_filename': '', 'igm_name': '', 'igm_emit': False}
+            with zipfile.ZipFile(path, 'r') as zf:
+                for zf_internal in zf.namelist():
+                    if zf_internal[-4:].lower() == '.igm':
+                        info['igm_filename'] = zf_internal
+                        break
+                if info['igm_filename'] != '':
+                    with zf.open(info['igm_filename'], 'r') as igm_file:
+                        info['igm_name'], info['igm_emit'] = parse_igm(igm_file.read())
+
+            try:
+                os.makedirs(self.entry_dir(digest), exist_ok=True)
+                temp_path = '%s.%i.tmp' % (info_path, os.getpid())
+                with open(temp_path, 'w') as f:
+                    json.dump(info, f, indent=1)
+                os.replace(temp_path, info_path)
+            except OSError as err:
+                print('Saving PIGM cache info failed: %s' % err)
+
+        with self.lock:
+            self.infos[digest] = info
+        return info
+
+    def extract(self, path, digest):
+        '''
+        Extract the archive into its cache directory, unless already done.
+        Returns the directory holding the extracted files.
+        '''
+        files_dir = os.path.join(self.entry_dir(digest), 'files')
+        if os.path.isdir(files_dir):
+            return files_dir
+
+        # Extract next to the final location and move it in place in one step,
+        # so a concurrent or interrupted export never sees a partial tree.
+        os.makedirs(self.entry_dir(digest), exist_ok=True)
+        temp_dir = '%s.%i.tmp' % (files_dir, os.getpid())
+        if os.path.isdir(temp_dir):
+            shutil.rmtree(temp_dir)
+        with zipfile.ZipFile(path, 'r') as zf:
+            zf.extractall(temp_dir)
+        try:
+            os.rename(temp_dir, files_dir)
+        except OSError:
+            # Another export got there first.
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return files_dir
+
+    def link_into(self, path, export_dir):
+        '''
+        Make the files of the archive at path available in export_dir, as
+        extractall(export_dir) would have.
+        '''
+        digest = self.content_hash(path)
+        with self.lock:
+            igm_filename = self.infos.get(digest, {}).get('igm_filename', '')
+            if (digest, export_dir) in self.linked and os.path.exists(os.path.join(export_dir, igm_filename)):
+                return
+
+            files_dir = self.extract(path, digest)
+            for root, dirs, files in os.walk(files_dir):
+                rel_root = os.path.relpath(root, files_dir)
+                dest_root = os.path.normpath(os.path.join(export_dir, rel_root))
+                os.makedirs(dest_root, exist_ok=True)
+                for name in files:
+                    link_file(os.path.join(root, name), os.path.join(dest_root, name))
+
+            self.linked.add((digest, export_dir))
+
+def link_file(src, dest):
+    src_st = os.stat(src)
+    try:
+        dest_st = os.stat(dest)
+        if os.path.samestat(src_st, dest_st):
+            return
+        # A copy made by an earlier export keeps the mtime of the cached file.
+        if dest_st.st_size == src_st.st_size and dest_st.st_mtime_ns == src_st.st_mtime_ns:
+            return
+        os.remove(dest)
+    except OSError:
+        pass
+
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+pigm_cache = PigmCache()
@@ -0,0 +1,264 @@
+import hashlib
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import bpy            #@UnresolvedImport
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ..extensions_framework import util as efutil
+from .. import eprofiler as ep
+
+def to_rgb8(pixels, width, height, channels, alpha):
+    '''
+    Convert float pixels in [0, 1], bottom row first as Blender stores them,
+    to top row first 8 bit RGB or RGBA rows, as save_render writes them for
+    an sRGB byte image under the Standard view transform.
+    '''
+    pixels = pixels.reshape(height, width, channels)[::-1]
+    out = np.empty((height, width, 4 if alpha else 3), dtype=np.uint8)
+    values = np.clip(pixels * 255.0 + 0.5, 0.0, 255.0).astype(np.uint8)
+    if channels >= 3:
+        out[:, :, 0:3] = values[:, :, 0:3]
+    else:
+        out[:, :, 0:3] = values[:, :, 0:1]
+    if alpha:
+        out[:, :, 3] = values[:, :, -1] if channels in (2, 4) else 255
+    return out
+
+def write_png(filename, rgb8):
+    '''
+    Write (height, width, 3 or 4) uint8 rows, top row first, to a PNG.
+    '''
+    height, width, channels = rgb8.shape
+
+    # Each scanline starts with filter type 0
+    rows = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    rows[:, 1:] = rgb8.reshape(height, width * channels)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    color_type = 6 if channels == 4 else 2
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+class ImageTextureCache(object):
+    '''
+    Files written for packed and generated Blender images used as textures.
+
+    Each image is written once per content into a textures directory shared
+    by all frames, and the file is reused for as long as the image, the
+    output format and, for images saved through Blender, the colour
+    management settings are unchanged. Packed images are identified by a
+    hash of the packed file, unmodified generated images by their settings
+    and anything else by a hash of its pixels.
+
+    Images are saved with Image.save_render, which applies the colour
+    management of the scene. Where that leaves the pixels of a byte image
+    unchanged (an sRGB image, the Standard view transform on an sRGB display
+    and no look, exposure, gamma or curves) and the output is an 8 bit RGB or
+    RGBA PNG, the image is instead converted to 8 bit on the main thread and
+    encoded by worker threads. At most max_pending_bytes of converted images
+    wait for the workers. finish() must be called before a scene referencing
+    the files is rendered.
+    '''
+
+    def __init__(self, num_workers=4, max_pending_bytes=256 * 1024 * 1024):
+        self.num_workers = num_workers
+        self.max_pending_bytes = max_pending_bytes
+        self.written = {}   # key -> filename, for files written or queued
+        self.image_keys = {}   # (image pointer, settings) -> (key, pixels), for this export
+        self.queue = None
+        self.threads = []
+        self.errors = []
+        self.lock = threading.Lock()
+        self.pending_bytes = 0
+        self.pending_changed = threading.Condition(self.lock)
+
+    def content_key(self, img, scene, pixels):
+        settings = scene.render.image_settings
+        parts = [img.name, settings.file_format, settings.color_mode, settings.color_depth]
+
+        if img.packed_file and not img.is_dirty:
+            parts.append(hashlib.sha1(img.packed_file.data).hexdigest())
+        elif img.source == 'GENERATED' and not img.is_dirty:
+            parts.append(repr((img.generated_type, img.generated_width, img.generated_height,
+                tuple(img.generated_color), img.use_generated_float)))
+        else:
+            if pixels is not None:
+                parts.append(hashlib.sha1(pixels.tobytes()).hexdigest())
+            else:
+                # Hashing pixels without numpy is too slow, write the image again for each frame
+                parts.append('frame %i' % scene.frame_current)
+
+        # The colour management save_render applies
+        vs = scene.view_settings
+        parts.append(repr((img.colorspace_settings.name, scene.display_settings.display_device, vs.view_transform,
+            vs.look, vs.exposure, vs.gamma, vs.use_curve_mapping)))
+
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def use_workers(self, img, scene):
+        if np == None or img.is_float or img.colorspace_settings.name != 'sRGB':
+            return False
+        settings = scene.render.image_settings
+        if settings.file_format != 'PNG' or settings.color_mode not in ('RGB', 'RGBA') or settings.color_depth != '8':
+            return False
+        vs = scene.view_settings
+        return (scene.display_settings.display_device == 'sRGB' and vs.view_transform == 'Standard' and vs.look == 'None'
+            and vs.exposure == 0.0 and vs.gamma == 1.0 and not vs.use_curve_mapping)
+
+    def read_pixels(self, img):
+        if np == None:
+            return None
+        pixels = np.empty(len(img.pixels), dtype=np.float32)
+        img.pixels.foreach_get(pixels)
+        return pixels
+
+    def image_key(self, img, scene):
+        '''
+        Returns (content key, pixels) for img. Pixels are only read when the
+        image can't be identified more cheaply, otherwise they are None.
+        Results are remembered until reset(), so each image is read and hashed
+        once per export.
+        '''
+        settings = scene.render.image_settings
+        vs = scene.view_settings
+        memo_key = (img.as_pointer(), scene.frame_current, settings.file_format, settings.color_mode, settings.color_depth,
+            img.colorspace_settings.name, scene.display_settings.display_device, vs.view_transform, vs.look,
+            vs.exposure, vs.gamma, vs.use_curve_mapping)
+
+        with self.lock:
+            result = self.image_keys.get(memo_key)
+        if result != None:
+            return result
+
+        cheap_key = (img.packed_file or img.source == 'GENERATED') and not img.is_dirty
+        pixels = None if cheap_key else self.read_pixels(img)
+        result = (self.content_key(img, scene, pixels), pixels)
+        with self.lock:
+            self.image_keys[memo_key] = result
+        return result
+
+    def get_path(self, img, bl_img_path, scene):
+        '''
+        Returns the filename a packed or generated image is (being) written to.
+        '''
+        key, pixels = self.image_key(img, scene)
+
+        with self.lock:
+            if key in self.written:
+                ep.count('texture cache hit')
+                return self.written[key]
+
+        texture_dir = os.path.join(
+            efutil.export_path,
+            efutil.scene_filename(),
+            bpy.path.clean_name(scene.name),
+            'textures'
+        )
+        os.makedirs(texture_dir, exist_ok=True)
+        filename = os.path.join(texture_dir, '%s.%s.%s' % (
+            os.path.splitext(os.path.basename(bl_img_path))[0],
+            key[:16],
+            scene.render.image_settings.file_format
+        ))
+
+        if os.path.exists(filename):
+            ep.count('texture cache hit')
+        else:
+            ep.count('texture cache miss')
+            if self.use_workers(img, scene):
+                if pixels is None:
+                    pixels = self.read_pixels(img)
+                width, height = img.size
+                rgb8 = to_rgb8(pixels, width, height, img.channels, scene.render.image_settings.color_mode == 'RGBA')
+                del pixels
+                self.submit(filename, rgb8)
+            else:
+                prof = ep.phase('texture save')
+                img.save_render(filename, scene=scene)
+                prof.stop()
+                ep.add_bytes('textures', os.path.getsize(filename))
+
+        with self.lock:
+            self.written[key] = filename
+        return filename
+
+    def submit(self, filename, rgb8):
+        if self.queue == None:
+            self.queue = queue.Queue()
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self.worker, name='texture writer %i' % i, daemon=True)
+                t.start()
+                self.threads.append(t)
+
+        # Wait for room unless nothing is pending, so an image larger than the budget still goes through.
+        with self.pending_changed:
+            while self.pending_bytes > 0 and self.pending_bytes + rgb8.nbytes > self.max_pending_bytes:
+                self.pending_changed.wait()
+            self.pending_bytes += rgb8.nbytes
+        self.queue.put((filename, rgb8))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            filename, rgb8 = item
+            nbytes = rgb8.nbytes
+            temp_filename = '%s.%i.tmp' % (filename, threading.get_ident())
+            try:
+                write_png(temp_filename, rgb8)
+                os.replace(temp_filename, filename)
+                ep.add_bytes('textures', os.path.getsize(filename))
+            except Exception as err:
+                with self.lock:
+                    self.errors.append((filename, err))
+                    self.written = {k: v for k, v in self.written.items() if v != filename}
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+            finally:
+                del item, rgb8
+                with self.pending_changed:
+                    self.pending_bytes -= nbytes
+                    self.pending_changed.notify_all()
+                self.queue.task_done()
+
+    def finish(self):
+        '''
+        Wait for queued images to be written and stop the workers.
+        Returns a list of (filename, error) for images that failed.
+        '''
+        if self.queue != None:
+            for t in self.threads:
+                self.queue.put(None)
+            for t in self.threads:
+                t.join()
+            self.queue = None
+            self.threads = []
+
+        with self.lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def reset(self):
+        # Files on disk are still reused, they are named by content.
+        with self.lock:
+            self.written = {}
+            self.image_keys = {}
+
+# Shared by all exports, see reset().
+image_texture_cache = ImageTextureCache(min(4, os.cpu_count() or 1))
@@ -0,0 +1,129 @@
+import hashlib
+import math
+import os
+
+import bpy            #@UnresolvedImport
+
+from ..extensions_framework import util as efutil
+from . import indigo_log
+
+# Formats Blender can write, by source file extension. Proxies keep the
+# format of their source, so float maps stay float.
+PROXY_FORMATS = {
+    '.png': 'PNG',
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.exr': 'OPEN_EXR',
+    '.hdr': 'HDR',
+    '.tif': 'TIFF',
+    '.tiff': 'TIFF',
+    '.tga': 'TARGA',
+    '.bmp': 'BMP',
+}
+
+def preview_texture_size(scene):
+    '''
+    Largest texture dimension worth exporting for the render size of scene,
+    or 0 if preview textures are off.
+    '''
+    ie = scene.indigo_engine
+    if not ie.preview_textures:
+        return 0
+    render_size = max(scene.render.resolution_x, scene.render.resolution_y) * scene.render.resolution_percentage / 100.0
+    return max(16, int(math.ceil(render_size * ie.preview_texture_factor)))
+
+class TextureProxyCache(object):
+    '''
+    Downscaled copies of texture files for preview renders.
+
+    A proxy is made for a texture larger than the preview size of the scene,
+    by loading it into Blender, scaling it down and saving it in its own
+    format. Proxies are named by a hash of the source path, size, mtime and
+    the proxy size, in a directory next to the exported scenes, so they are
+    made once and picked up again by later exports. Textures that are small
+    enough, missing or in a format Blender can't write are used as they are.
+    '''
+
+    def __init__(self):
+        self.proxies = {}   # (source path, size, mtime, max size, power of two) -> path
+
+    def proxy_dir(self):
+        return os.path.join(efutil.export_path, efutil.scene_filename(), 'texture_proxies')
+
+    def get_path(self, scene, path, power_of_two=False, min_size=0):
+        '''
+        Returns the path of a proxy for the texture file at path, or path
+        itself if no proxy is needed. With power_of_two set, proxies are
+        square with a power of two size of at least min_size, as aperture
+        images require.
+        '''
+        max_size = preview_texture_size(scene)
+        if max_size == 0:
+            return path
+
+        filename = efutil.filesystem_path(path)
+        file_format = PROXY_FORMATS.get(os.path.splitext(filename)[1].lower())
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return path
+        if file_format == None:
+            return path
+
+        if power_of_two:
+            max_size = max(min_size, 1 << int(math.ceil(math.log2(max_size))))
+
+        key = (filename, st.st_size, st.st_mtime_ns, max_size, power_of_two)
+        if key in self.proxies:
+            return self.proxies[key]
+
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        proxy_path = os.path.join(
+            self.proxy_dir(),
+            '%s.%s%s' % (os.path.splitext(os.path.basename(filename))[0], digest, os.path.splitext(filename)[1])
+        )
+
+        if not os.path.exists(proxy_path):
+            try:
+                if not self.make_proxy(filename, proxy_path, file_format, max_size, power_of_two):
+                    proxy_path = path
+            except Exception as err:
+                indigo_log('Could not make a preview texture for %s: %s' % (filename, err), message_type='WARNING')
+                proxy_path = path
+
+        self.proxies[key] = proxy_path
+        return proxy_path
+
+    def make_proxy(self, filename, proxy_path, file_format, max_size, power_of_two):
+        '''
+        Write a downscaled copy of filename to proxy_path. Returns False if
+        the texture is already small enough.
+        '''
+        img = bpy.data.images.load(filename, check_existing=False)
+        try:
+            width, height = img.size
+            if power_of_two:
+                if width <= max_size and height <= max_size:
+                    return False
+                new_width = new_height = max_size
+            else:
+                scale = max_size / max(width, height)
+                if scale >= 1.0:
+                    return False
+                new_width = max(1, int(round(width * scale)))
+                new_height = max(1, int(round(height * scale)))
+
+            img.scale(new_width, new_height)
+
+            os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+            # Save under a temporary name first so an interrupted export doesn't leave a partial proxy
+            temp_path = '%s.%i.tmp%s' % (os.path.splitext(proxy_path)[0], os.getpid(), os.path.splitext(proxy_path)[1])
+            img.filepath_raw = temp_path
+            img.file_format = file_format
+            img.save()
+            os.replace(temp_path, proxy_path)
+            return True
+        finally:
+            bpy.data.images.remove(img)
+
+texture_proxy_cache = TextureProxyCache()
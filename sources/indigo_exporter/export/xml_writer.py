@@ -0,0 +1,101 @@
+from . import xml_cdata, xml_multichild
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def escape_attrib(text):
+    return escape_text(text).replace('"', '&quot;')
+
+class xml_stream_writer(object):
+    '''
+    Writes XML straight to a file in one pass.
+
+    Accepts ElementTree elements as built by the property groups, and the
+    format dicts understood by xml_builder.build_subelements, so scene parts
+    don't have to be collected into one tree first. Text that is an
+    xml_cdata is written as a CDATA section.
+
+    With indent set, elements with children are laid out one per line,
+    elements with only text are written on a single line, and whitespace-only
+    text between child elements is dropped.
+    '''
+
+    def __init__(self, file, indent='\t', newline='\n'):
+        self.file = file
+        self.indent = indent
+        self.newline = newline if indent else ''
+        self.depth = 0
+
+    def write_declaration(self):
+        self.file.write('<?xml version="1.0" encoding="utf-8"?>%s' % self.newline)
+
+    def start_tag(self, tag, attrib=None):
+        return '<%s%s' % (tag, ''.join(' %s="%s"' % (k, escape_attrib(str(v))) for k, v in attrib.items()) if attrib else '')
+
+    def text(self, text):
+        if type(text) is xml_cdata:
+            return '<![CDATA[\n%s\n]]>' % text.replace(']]>', ']]]]><![CDATA[>')
+        return escape_text(str(text))
+
+    def start(self, tag, attrib=None):
+        '''
+        Open an element whose children will be written by further calls.
+        '''
+        self.file.write('%s%s>%s' % (self.indent * self.depth, self.start_tag(tag, attrib), self.newline))
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        self.file.write('%s</%s>%s' % (self.indent * self.depth, tag, self.newline))
+
+    def leaf(self, tag, text, attrib=None):
+        pad = self.indent * self.depth
+        if text == None or text == '':
+            self.file.write('%s%s/>%s' % (pad, self.start_tag(tag, attrib), self.newline))
+        else:
+            self.file.write('%s%s>%s</%s>%s' % (pad, self.start_tag(tag, attrib), self.text(text), tag, self.newline))
+
+    def keep_text(self, text):
+        # Whitespace between child elements is layout, not content, when indenting.
+        return text != None and (not self.indent or type(text) is xml_cdata or text.strip() != '')
+
+    def write_element(self, elem):
+        '''
+        Write an ElementTree element and its children.
+        '''
+        if len(elem) == 0:
+            self.leaf(elem.tag, elem.text, elem.attrib)
+            return
+
+        self.start(elem.tag, elem.attrib)
+        if self.keep_text(elem.text):
+            self.file.write('%s%s%s' % (self.indent * self.depth, self.text(elem.text), self.newline))
+        for child in elem:
+            self.write_element(child)
+            if self.keep_text(child.tail):
+                self.file.write('%s%s%s' % (self.indent * self.depth, self.text(child.tail), self.newline))
+        self.end(elem.tag)
+
+    def write_format(self, builder, context, d):
+        '''
+        Write the format dict d the way builder.build_subelements would add
+        it to an element, without creating the elements.
+        '''
+        for key in d.keys():
+            value = d[key]
+            # tuple and xml_multichild provides multiple child elements
+            if type(value) in (tuple, xml_multichild):
+                for cd in value:
+                    self.write_format(builder, context, {key:cd})
+                continue
+
+            # dictionary provides nested elements
+            if type(value) is dict:
+                if len(value) == 0:
+                    self.leaf(key, None)
+                else:
+                    self.start(key)
+                    self.write_format(builder, context, value)
+                    self.end(key)
+            else:
+                self.leaf(key, builder.format_value(context, value))
@@ -25,6 +25,7 @@
 #
 # ***** END GPL LICENCE BLOCK *****
 #
+import atexit
 import configparser
 import datetime
 import os
@@ -77,75 +78,134 @@ def filesystem_path(p):
 
 # TODO: - somehow specify TYPES to get/set from config
 
+class ConfigStore(object):
+    """Process wide, in-memory copy of the add-on config files.
+
+    Each module's config is read once, on first use, and served from memory
+    afterwards. Writes update the memory copy straight away and are saved
+    by a write-behind flush FLUSH_DELAY seconds later, so that a burst of
+    writes costs one file write. A flush re-reads the file, applies only
+    the keys changed here and atomically replaces it, so processes sharing
+    the config file don't lose each other's values or see partial files.
+    Pending writes are also flushed at exit.
+
+    """
+    FLUSH_DELAY = 1.0
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.parsers = {}   # module -> (parser, config file paths, file read)
+        self.pending = {}   # module -> {(section, key): value}
+        self.timer = None
+        atexit.register(self.flush)
+
+    def config_files(self, module):
+        global config_paths
+        fc = []
+        for p in config_paths:
+            if os.path.exists(p) and os.path.isdir(p) and os.access(p, os.W_OK):
+                fc.append( '/'.join([p, '%s.cfg' % module]))
+        return fc
+
+    def load(self, module):
+        with self.lock:
+            if module not in self.parsers:
+                fc = self.config_files(module)
+                cp = configparser.ConfigParser(interpolation=None)
+                cfg_files = cp.read(fc)
+                self.parsers[module] = (cp, fc, cfg_files[0] if len(cfg_files) > 0 else None)
+            return self.parsers[module]
+
+    def get(self, module, section, key, default):
+        with self.lock:
+            cp, fc, cfg_file = self.load(module)
+            if len(fc) < 1:
+                print('Cannot find %s config file path' % module)
+                return default
+            try:
+                val = cp.get(section, key)
+            except (configparser.Error, ValueError):
+                return default
+        if val == 'true':
+            return True
+        elif val == 'false':
+            return False
+        else:
+            return val
+
+    def set(self, module, section, key, value):
+        if value == True:
+            value = 'true'
+        elif value == False:
+            value = 'false'
+
+        with self.lock:
+            cp, fc, cfg_file = self.load(module)
+            if len(fc) < 1:
+                raise Exception('Cannot find a writable path to store %s config file' %
+                    module)
+
+            if cp.has_option(section, key) and cp.get(section, key) == value:
+                return
+            if not cp.has_section(section):
+                cp.add_section(section)
+            cp.set(section, key, value)
+
+            self.pending.setdefault(module, {})[(section, key)] = value
+            if self.timer == None:
+                self.timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Write all pending values to their config files"""
+        with self.lock:
+            if self.timer != None:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending = self.pending, {}
+
+            for module, values in pending.items():
+                cp, fc, cfg_file = self.parsers[module]
+                if cfg_file == None:
+                    cfg_file = fc[0]
+                    self.parsers[module] = (cp, fc, cfg_file)
+
+                # Pick up values written by other processes since loading.
+                current = configparser.ConfigParser(interpolation=None)
+                try:
+                    current.read(cfg_file)
+                except configparser.Error:
+                    pass
+                for (section, key), value in values.items():
+                    if not current.has_section(section):
+                        current.add_section(section)
+                    current.set(section, key, value)
+
+                try:
+                    temp_file = '%s.%i.tmp' % (cfg_file, os.getpid())
+                    with open(temp_file, 'w') as fh:
+                        current.write(fh)
+                    os.replace(temp_file, cfg_file)
+                except OSError as err:
+                    print('Cannot write %s config file: %s' % (module, err))
+config_store = ConfigStore()
+
 def find_config_value(module, section, key, default):
     """Attempt to find the configuration value specified by string key
     in the specified section of module's configuration file. If it is
     not found, return default.
 
     """
-    global config_paths
-    fc = []
-    for p in config_paths:
-        if os.path.exists(p) and os.path.isdir(p) and os.access(p, os.W_OK):
-            fc.append( '/'.join([p, '%s.cfg' % module]))
-
-    if len(fc) < 1:
-        print('Cannot find %s config file path' % module)
-        return default
-
-    cp = configparser.SafeConfigParser()
-
-    cfg_files = cp.read(fc)
-    if len(cfg_files) > 0:
-        try:
-            val = cp.get(section, key)
-            if val == 'true':
-                return True
-            elif val == 'false':
-                return False
-            else:
-                return val
-        except:
-            return default
-    else:
-        return default
+    return config_store.get(module, section, key, default)
 
 def write_config_value(module, section, key, value):
     """Attempt to write the configuration value specified by string key
-    in the specified section of module's configuration file.
+    in the specified section of module's configuration file. The file
+    is written shortly after by the config store.
 
     """
-    global config_paths
-    fc = []
-    for p in config_paths:
-        if os.path.exists(p) and os.path.isdir(p) and os.access(p, os.W_OK):
-            fc.append( '/'.join([p, '%s.cfg' % module]))
-
-    if len(fc) < 1:
-        raise Exception('Cannot find a writable path to store %s config file' %
-            module)
-
-    cp = configparser.SafeConfigParser()
-
-    cfg_files = cp.read(fc)
-
-    if not cp.has_section(section):
-        cp.add_section(section)
-
-    if value == True:
-        cp.set(section, key, 'true')
-    elif value == False:
-        cp.set(section, key, 'false')
-    else:
-        cp.set(section, key, value)
-
-    if len(cfg_files) < 1:
-        cfg_files = fc
-
-    fh=open(cfg_files[0],'w')
-    cp.write(fh)
-    fh.close()
-
+    config_store.set(module, section, key, value)
     return True
 
 def scene_filename():
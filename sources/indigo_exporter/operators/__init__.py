@@ -1,7 +1,6 @@
 import os, time
 import math
 import xml.etree.cElementTree as ET
-import xml.dom.minidom as MD
 
 import bpy            #@UnresolvedImport
 
@@ -14,6 +13,11 @@ from .. export import (
 )
 from .. export.igmesh import igmesh_writer
 from .. export.geometry import model_object
+from .. export.mesh_cache import MeshCache
+from .. export.material_graph import material_export_cache
+from .. export.texture_cache import image_texture_cache
+from .. export.xml_writer import xml_stream_writer
+from .. properties.environment import light_layer_index
 
 from .. import eprofiler as ep
 
@@ -126,7 +130,7 @@ class _Impl_OT_indigo(_Impl_operator):
                 raise Exception('Output path is not writable')
             
             try:
-                os.makedirs(efutil.export_path)
+                os.makedirs(efutil.export_path, exist_ok=True)
             except: 
                 indigo_log('Could not create output path %s' % efutil.export_path)
                 raise Exception('Could not create output path')
@@ -201,6 +205,23 @@ class _Impl_OT_indigo(_Impl_operator):
     scene_xml = None
     verbose = True
     
+    def report_profile(self, profiler, igs_filename, top):
+        '''
+        Write the export profile next to the .igs and log the slowest objects.
+        '''
+        report_filename = os.path.splitext(igs_filename)[0] + '.profile.json'
+        try:
+            profiler.write_report(report_filename)
+            indigo_log('Export profile written to %s' % report_filename)
+        except OSError as err:
+            indigo_log('Writing export profile failed: %s' % err, message_type='WARNING')
+        
+        slowest = profiler.slowest_objects(top)
+        if len(slowest) > 0:
+            indigo_log('Slowest objects:')
+            for name, (seconds, count) in slowest:
+                indigo_log('  %8.3f s  %s%s' % (seconds, name, ' (%i times)' % count if count > 1 else ''))
+    
     def execute(self, render_engine, depsgraph):
         master_scene = depsgraph.scene_eval
         # master_scene = depsgraph.scene
@@ -218,19 +239,32 @@ class _Impl_OT_indigo(_Impl_operator):
             # export_scenes = [master_scene.background_set, master_scene]
             export_scenes = [master_scene] # background set objects also are in depsgraph now
             
+            # Light layer numbering is shared by all materials and lamps of this export.
+            light_layer_index.begin()
+            image_texture_cache.reset()
+            
+            if master_scene.indigo_engine.export_profile:
+                ep.begin_export()
+            
             if self.verbose: indigo_log('Export render settings')
             
             #------------------------------------------------------------------------------
             # Start with render settings, this also creates the root <scene>
+            prof = ep.phase('render settings')
             self.scene_xml = master_scene.indigo_engine.build_xml_element(master_scene)
+            prof.stop()
             
             #------------------------------------------------------------------------------
             # Tonemapping
+            prof = ep.phase('tonemapping')
             self.export_tonemapping(master_scene)
+            prof.stop()
             
             #------------------------------------------------------------------------------
             # Materials - always export the default clay material and a null material
+            prof = ep.phase('default materials')
             self.export_default_materials(master_scene)
+            prof.stop()
             
             # Initialise values used for motion blur export.
             fps = master_scene.render.fps / master_scene.render.fps_base
@@ -250,6 +284,22 @@ class _Impl_OT_indigo(_Impl_operator):
             geometry_exporter.rel_mesh_dir = rel_mesh_dir
             geometry_exporter.skip_existing_meshes = master_scene.indigo_engine.skip_existing_meshes
             geometry_exporter.verbose = self.verbose
+            geometry_exporter.mesh_cache = MeshCache(efutil.filesystem_path(mesh_dir), igmesh_writer.WRITER_VERSION)
+            if master_scene.indigo_engine.mesh_writer_threads > 0 and igmesh_writer.writer_mode(master_scene) == 'numpy':
+                from .. export.mesh_pipeline import MeshWriterPool
+                geometry_exporter.mesh_writer_pool = MeshWriterPool(
+                    master_scene.indigo_engine.mesh_writer_threads,
+                    master_scene.indigo_engine.mesh_writer_queue_depth
+                )
+            
+            # Animation renders reuse the meshes of unchanged objects and the XML
+            # of unchanged materials from the previous frame.
+            if render_engine.is_animation:
+                if start_frame == master_scene.frame_start:
+                    geometry.frame_mesh_cache.reset()
+                    material_export_cache.reset()
+                geometry_exporter.frame_mesh_cache = geometry.frame_mesh_cache
+                geometry_exporter.material_cache = material_export_cache
             
             # Make frame_dir directory if it does not exist yet.
             if not os.path.exists(frame_dir):
@@ -268,23 +318,78 @@ class _Impl_OT_indigo(_Impl_operator):
                 
             #indigo_log('frame_list: %s'%frame_list)
             
+            # When streaming objects, <model> elements go to objects.igs while the scene is iterated.
+            objects_file_name = '%s/objects.igs' % (
+                frame_dir
+            )
+            objects_file = None
+            if master_scene.indigo_engine.stream_objects:
+                objects_file = open(objects_file_name, 'w', encoding='utf-8')
+                geometry_exporter.objects_writer = xml_stream_writer(objects_file, indent=None)
+                geometry_exporter.objects_writer.write_declaration()
+                geometry_exporter.objects_writer.start('scenedata')
+            
             #------------------------------------------------------------------------------
             # Process all objects in all frames in all scenes.
             print( '\n\n\n\n*******', master_scene.frame_current)
-            for cur_frame in frame_list:
-                # Calculate normalised time for keyframes.
-                normalised_time = (cur_frame - start_frame) / fps / exposure
-                if self.verbose: indigo_log('Processing frame: %i time: %f'%(cur_frame, normalised_time))
-                
-                geometry_exporter.normalised_time = normalised_time
-                
-                render_engine.frame_set(cur_frame, subframe=0.0)
-                depsgraph.update()
+            try:
+                for cur_frame in frame_list:
+                    prof_frame = ep.phase('frame %i' % cur_frame)
+                    
+                    # Calculate normalised time for keyframes.
+                    normalised_time = (cur_frame - start_frame) / fps / exposure
+                    if self.verbose: indigo_log('Processing frame: %i time: %f'%(cur_frame, normalised_time))
+                    
+                    geometry_exporter.normalised_time = normalised_time
+                    geometry_exporter.final_subframe = cur_frame == frame_list[-1]
+                    
+                    prof = ep.phase('frame_set')
+                    render_engine.frame_set(cur_frame, subframe=0.0)
+                    depsgraph.update()
+                    prof.stop()
+                    if geometry_exporter.frame_mesh_cache != None:
+                        geometry_exporter.frame_mesh_cache.begin_frame(depsgraph, (efutil.scene_filename(), master_scene.name, mesh_dir))
 
-                # Add Camera matrix.
-                camera[1].append((normalised_time, camera[0].matrix_world.copy()))
+                    # Add Camera matrix.
+                    camera[1].append((normalised_time, camera[0].matrix_world.copy()))
 
-                geometry_exporter.iterateScene(depsgraph)
+                    if cur_frame == frame_list[0]:
+                        prof = ep.phase('scene iteration')
+                        geometry_exporter.iterateScene(depsgraph)
+                    else:
+                        # Only transforms matter for the following motion blur subframes.
+                        prof = ep.phase('transform sampling')
+                        geometry_exporter.sampleTransforms(depsgraph)
+                    prof.stop()
+                    prof_frame.stop()
+                
+                if objects_file != None:
+                    geometry_exporter.finishObjectWrites()
+                    geometry_exporter.objects_writer.end('scenedata')
+            finally:
+                if objects_file != None:
+                    objects_file.close()
+                # Meshes queued on the writer pool must be on disk before the scene references them.
+                prof = ep.phase('mesh and texture writes')
+                mesh_write_errors = geometry_exporter.finishMeshWrites()
+                texture_write_errors = image_texture_cache.finish()
+                prof.stop()
+            
+            if len(mesh_write_errors) > 0:
+                raise Exception('Failed to write %i mesh(es)' % len(mesh_write_errors))
+            for filename, err in texture_write_errors:
+                indigo_log('Failed to write texture %s: %s' % (filename, err), message_type='ERROR')
+            if len(texture_write_errors) > 0:
+                raise Exception('Failed to write %i texture(s)' % len(texture_write_errors))
+            
+            # Update the mesh cache manifest, evicting old meshes if the mesh directory is over its size cap.
+            try:
+                if master_scene.indigo_engine.mesh_cache_size_mb > 0:
+                    evicted = geometry_exporter.mesh_cache.evict(master_scene.indigo_engine.mesh_cache_size_mb * 1024 * 1024)
+                    if self.verbose and evicted > 0: indigo_log('Evicted %i cached meshes' % evicted)
+                geometry_exporter.mesh_cache.save()
+            except OSError as err:
+                indigo_log('Updating mesh cache failed: %s' % err, message_type='WARNING')
                 
             
             # Export background light if no light exists.
@@ -410,71 +515,69 @@ class _Impl_OT_indigo(_Impl_operator):
             
             self.scene_xml.append(basic_medium)
             
-            #------------------------------------------------------------------------------
-            # Export used materials.
-            if self.verbose: indigo_log('Exporting used materials')
-            material_count = 0
-            for ck, ci in geometry_exporter.ExportedMaterials.items():
-                for xml in ci:
-                    self.scene_xml.append(xml)
-                material_count += 1
-            if self.verbose: indigo_log('Exported %i materials' % material_count)
-            
-            # Export used meshes.
-            if self.verbose: indigo_log('Exporting meshes')
-            mesh_count = 0
-            for ck, ci in geometry_exporter.MeshesOnDisk.items():
-                mesh_name, xml = ci
-                self.scene_xml.append(xml)
-                mesh_count += 1
-            if self.verbose: indigo_log('Exported %i meshes' % mesh_count)
-            
             #------------------------------------------------------------------------------
             # We write object instances to a separate file
-            oc = 0
-            scene_data_xml = ET.Element('scenedata')
-            for ck, ci in geometry_exporter.ExportedObjects.items():
-                obj_type = ci[0]
-                
-                if obj_type == 'OBJECT':
-                    obj = ci[1]
-                    mesh_name = ci[2]
-                    obj_matrices = ci[3]
-                    scene = ci[4]
-                    
-                    xml = geometry.model_object(scene).build_xml_element(obj, mesh_name, obj_matrices)
-                else:
-                    xml = ci[1]
-                scene_data_xml.append(xml)
-                oc += 1
-            
-            objects_file_name = '%s/objects.igs' % (
-                frame_dir
-            )
-            objects_file = open(objects_file_name, 'wb')
-            ET.ElementTree(element=scene_data_xml).write(objects_file, encoding='utf-8')
-            objects_file.close()
+            prof = ep.phase('objects write')
+            if objects_file == None:
+                oc = 0
+                with open(objects_file_name, 'w', encoding='utf-8') as objects_file:
+                    objects_writer = xml_stream_writer(objects_file, indent=None)
+                    objects_writer.write_declaration()
+                    objects_writer.start('scenedata')
+                    for ck, ci in geometry_exporter.ExportedObjects.items():
+                        objects_writer.write_element(geometry_exporter.modelXml(ci))
+                        oc += 1
+                    oc += len(geometry_exporter.Instances)
+                    geometry_exporter.writeInstances(objects_writer)
+                    objects_writer.end('scenedata')
+            prof.stop()
+            if ep.current != None:
+                ep.add_bytes('objects.igs', os.path.getsize(objects_file_name))
             # indigo_log('Exported %i object instances to %s' % (oc,objects_file_name))
             scene_data_include = include.xml_include( efutil.path_relative_to_export(objects_file_name) )
-            self.scene_xml.append( scene_data_include.build_xml_element(master_scene) )
             
             #------------------------------------------------------------------------------
-            # Write formatted XML for settings, materials and meshes
-            out_file = open(igs_filename, 'w')
-            xml_str = ET.tostring(self.scene_xml, encoding='utf-8').decode()
-            
-            # substitute back characters protected from entity encoding in CDATA nodes
-            xml_str = xml_str.replace('{_LESSTHAN_}', '<')
-            xml_str = xml_str.replace('{_GREATERTHAN_}', '>')
-            
-            
-            xml_dom = MD.parseString(xml_str)
-            xml_dom.writexml(out_file, addindent='\t', newl='\n', encoding='utf-8')
-            out_file.close()
+            # Write formatted XML for settings, materials and meshes.
+            # Materials and meshes are streamed from the exporter caches
+            # rather than being added to scene_xml first.
+            prof = ep.phase('xml write')
+            with open(igs_filename, 'w', encoding='utf-8') as out_file:
+                writer = xml_stream_writer(out_file)
+                writer.write_declaration()
+                writer.start(self.scene_xml.tag, self.scene_xml.attrib)
+                for xml in self.scene_xml:
+                    writer.write_element(xml)
+                
+                # Export used materials.
+                if self.verbose: indigo_log('Exporting used materials')
+                material_count = 0
+                for ck, ci in geometry_exporter.ExportedMaterials.items():
+                    for xml in ci:
+                        writer.write_element(xml)
+                    material_count += 1
+                if self.verbose: indigo_log('Exported %i materials' % material_count)
+                if self.verbose and geometry_exporter.material_graph != None and geometry_exporter.material_graph.reused > 0:
+                    indigo_log('Reused %i unchanged materials from the previous frame' % geometry_exporter.material_graph.reused)
+                
+                # Export used meshes.
+                if self.verbose: indigo_log('Exporting meshes')
+                mesh_count = 0
+                for ck, ci in geometry_exporter.MeshesOnDisk.items():
+                    mesh_name, xml = ci
+                    writer.write_element(xml)
+                    mesh_count += 1
+                if self.verbose: indigo_log('Exported %i meshes' % mesh_count)
+                
+                writer.write_format(scene_data_include, master_scene, {'include': scene_data_include.format})
+                writer.end(self.scene_xml.tag)
+            prof.stop()
+            if ep.current != None:
+                ep.add_bytes('igs', os.path.getsize(igs_filename))
             
             #------------------------------------------------------------------------------
             # Computing devices
             if len(master_scene.indigo_engine.render_devices):
+                prof = ep.phase('settings.xml update')
                 from .. core.util import getSettingsPath
                 settings_file = getSettingsPath()
 
@@ -529,6 +632,7 @@ class _Impl_OT_indigo(_Impl_operator):
 
                 with open(settings_file, 'w') as f:
                     f.write(xml_string)
+                prof.stop()
             
             #------------------------------------------------------------------------------
             # Print stats
@@ -536,6 +640,10 @@ class _Impl_OT_indigo(_Impl_operator):
             if self.verbose: indigo_log('Total mesh export time: %f seconds' % (geometry_exporter.total_mesh_export_time))
             indigo_log('Export finished; took %f seconds' % (export_end_time-export_start_time))
             
+            profiler = ep.end_export()
+            if profiler != None:
+                self.report_profile(profiler, igs_filename, master_scene.indigo_engine.export_profile_top)
+            
             # Reset to start_frame.
             if len(frame_list) > 1:
                 bpy.context.scene.frame_set(start_frame)
@@ -550,6 +658,10 @@ class _Impl_OT_indigo(_Impl_operator):
                 raise err
             return {'CANCELLED'}
         
+        finally:
+            light_layer_index.end()
+            ep.end_export()
+        
 class EXPORT_OT_indigo(_Impl_OT_indigo, bpy.types.Operator):
     def execute(self, context):
         self.set_report(self.report)
@@ -558,6 +670,78 @@ class EXPORT_OT_indigo(_Impl_OT_indigo, bpy.types.Operator):
 menu_func = lambda self, context: self.layout.operator("export.indigo", text="Export Indigo Scene...")
 bpy.types.TOPBAR_MT_file_export.append(menu_func)
 
+class INDIGO_OT_export_animation_parallel(bpy.types.Operator):
+    '''Export the animation frame range with several background Blender processes'''
+    
+    bl_idname = "indigo.export_animation_parallel"
+    bl_label = "Export Animation in Parallel"
+    
+    _timer = None
+    _export = None
+    
+    def execute(self, context):
+        from .. core import get_output_paths, get_igq_filename
+        from .. core.parallel_export import ParallelAnimationExport, split_frame_range
+        
+        # The workers load the .blend file from disk.
+        if bpy.data.filepath == '' or bpy.data.is_dirty:
+            self.report({'ERROR'}, 'Save the .blend file before exporting in parallel')
+            return {'CANCELLED'}
+        
+        scene = context.scene
+        output_path = get_output_paths(scene, True)[0]
+        os.makedirs(output_path, exist_ok=True)
+        
+        frame_ranges = split_frame_range(scene.frame_start, scene.frame_end, scene.frame_step, scene.indigo_engine.parallel_export_workers)
+        self._export = ParallelAnimationExport(
+            bpy.app.binary_path,
+            bpy.data.filepath,
+            __package__.split('.')[0],
+            get_igq_filename(scene, output_path),
+            frame_ranges
+        )
+        self._export.start()
+        indigo_log('Exporting frames %i-%i with %i workers' % (scene.frame_start, scene.frame_end, len(frame_ranges)))
+        
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(1.0, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        self._timer = None
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._export.terminate()
+            self.finish(context)
+            self.report({'WARNING'}, 'Parallel animation export cancelled')
+            return {'CANCELLED'}
+        
+        if event.type != 'TIMER' or self._export.poll() > 0:
+            return {'PASS_THROUGH'}
+        
+        self.finish(context)
+        
+        failed = self._export.failed()
+        if len(failed) > 0:
+            self._export.close_logs()
+            self.report({'ERROR'}, 'Export workers %s failed, see %s' % (
+                ', '.join('%i' % i for i in failed),
+                ', '.join(self._export.part_filename(i) + '.log' for i in failed)
+            ))
+            return {'CANCELLED'}
+        
+        try:
+            num_items = self._export.merge()
+        except Exception as err:
+            self.report({'ERROR'}, str(err))
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, 'Exported %i frames to %s' % (num_items, self._export.igq_filename))
+        return {'FINISHED'}
+
 class INDIGO_OT_lightlayer_add(bpy.types.Operator):
     '''Add a new light layer definition to the scene'''
     
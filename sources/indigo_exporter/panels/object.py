@@ -37,4 +37,10 @@ class INDIGO_PT_ui_object_settings(bpy.types.Panel):
             col.prop(indigo_mesh, 'displacement_error_threshold')
         col.prop(indigo_mesh, 'mesh_proxy')
         if indigo_mesh.mesh_proxy:
-            col.prop(indigo_mesh, 'mesh_path')
\ No newline at end of file
+            col.prop(indigo_mesh, 'mesh_path')
+            proxy_info = indigo_mesh.proxy_igmesh_info()
+            if proxy_info != None:
+                num_verts, num_tris, num_quads, used_materials = proxy_info
+                box = col.box()
+                box.label(text='%i vertices, %i triangles, %i quads' % (num_verts, num_tris, num_quads))
+                box.label(text='Materials: %s' % ', '.join(used_materials))
\ No newline at end of file
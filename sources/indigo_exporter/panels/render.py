@@ -108,6 +108,11 @@ class INDIGO_PT_ui_render_engine_settings(bpy.types.Panel):
         sr.prop(indigo_engine, 'haltspp')
         sr = sub.row()
         sr.prop(indigo_engine, 'period_save')
+        sr = sub.row(align=True)
+        sr.prop(indigo_engine, 'framebuffer_feedback')
+        rc = sr.row()
+        rc.prop(indigo_engine, 'framebuffer_update_interval')
+        rc.enabled = indigo_engine.framebuffer_feedback
         
         col = layout.column()
         col.separator()
@@ -128,6 +133,12 @@ class INDIGO_PT_ui_render_engine_settings(bpy.types.Panel):
         row = col.row()
         row.prop(indigo_engine, 'auto_start')
         row.prop(indigo_engine, 'console_output', text="Print to console")
+        col.prop(indigo_engine, 'queue_runner')
+        if indigo_engine.queue_runner:
+            row = col.row(align=True)
+            row.prop(indigo_engine, 'queue_jobs')
+            row.prop(indigo_engine, 'queue_threads_per_job')
+            col.prop(indigo_engine, 'queue_resume')
         
         ##
         from .. properties.render_settings import IndigoDevice
@@ -177,7 +188,31 @@ class INDIGO_PT_ui_render_export_settings(bpy.types.Panel):
         col.enabled = not indigo_engine.use_output_path
         col = layout.column()
         col.prop(indigo_engine, 'install_path')
+        row = col.row(align=True)
+        row.prop(indigo_engine, 'export_profile')
+        sub = row.row(align=True)
+        sub.active = indigo_engine.export_profile
+        sub.prop(indigo_engine, 'export_profile_top')
+        row = col.row(align=True)
+        row.prop(indigo_engine, 'preview_textures')
+        sub = row.row(align=True)
+        sub.active = indigo_engine.preview_textures
+        sub.prop(indigo_engine, 'preview_texture_factor')
         col.prop(indigo_engine, 'skip_existing_meshes')
+        col.prop(indigo_engine, 'mesh_cache_size_mb')
+        col.prop(indigo_engine, 'stream_objects')
+        row = col.row(align=True)
+        row.prop(indigo_engine, 'parallel_export_workers')
+        row.operator('indigo.export_animation_parallel')
+        col.prop(indigo_engine, 'igmesh_writer')
+        if indigo_engine.igmesh_writer == 'stream':
+            col.prop(indigo_engine, 'igmesh_stream_memory_mb')
+        if indigo_engine.igmesh_writer == 'numpy':
+            row = col.row(align=True)
+            row.prop(indigo_engine, 'mesh_writer_threads')
+            sub = row.row(align=True)
+            sub.prop(indigo_engine, 'mesh_writer_queue_depth')
+            sub.enabled = indigo_engine.mesh_writer_threads > 0
         
         col.separator()
         
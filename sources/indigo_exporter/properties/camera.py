@@ -3,6 +3,7 @@ from ..extensions_framework import util as efutil
 
 from .. core.util import get_worldscale
 from .. export import indigo_log, exportutil, xml_builder
+from .. export.texture_proxy import texture_proxy_cache
 
 def aspect_ratio(context,p):
     return context.render.resolution_x / context.render.resolution_y
@@ -295,7 +296,7 @@ class Indigo_Camera_Properties(bpy.types.PropertyGroup, export.xml_builder):
                 if os.path.exists(ad_obstacle):
                     xml_format.update({
                         'obstacle_map': {
-                            'path': [efutil.path_relative_to_export(ad_obstacle)]
+                            'path': [efutil.path_relative_to_export(texture_proxy_cache.get_path(scene, ad_obstacle, power_of_two=True, min_size=512))]
                         }
                     })
                 else:
@@ -306,7 +307,7 @@ class Indigo_Camera_Properties(bpy.types.PropertyGroup, export.xml_builder):
                 if os.path.exists(ad_image):
                     xml_format['aperture_shape'].update({
                         'image': {
-                            'path': [efutil.path_relative_to_export(ad_image)]
+                            'path': [efutil.path_relative_to_export(texture_proxy_cache.get_path(scene, ad_image, power_of_two=True, min_size=512))]
                         }
                     })
                 else:
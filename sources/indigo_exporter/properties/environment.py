@@ -211,16 +211,52 @@ lightlayers_properties = [
     },
 ]
 
-def is_layer_empty(layer):
+def used_layer_names():
+    '''
+    Names of the light layers that an emitting material or a lamp is placed on.
+    '''
+    names = set()
     for mat in bpy.data.materials:
-        if mat.indigo_material.indigo_material_emission.emit_layer == layer.name:
-            return False
+        names.add(mat.indigo_material.indigo_material_emission.emit_layer)
     
     for lamp in bpy.data.lights:
-        if  layer.name in (lamp.indigo_lamp_sun.sunlayer, lamp.indigo_lamp_sun.skylayer, lamp.indigo_lamp_hemi.layer):
-            return False
-        
-    return True
+        names.update((lamp.indigo_lamp_sun.sunlayer, lamp.indigo_lamp_sun.skylayer, lamp.indigo_lamp_hemi.layer))
+    
+    names.discard('')
+    return names
+
+class LightLayerIndex(object):
+    '''
+    Light layer usage and numbering, shared by everything exported between
+    begin() and end(). The used layer names are found in one pass over the
+    materials and lamps, and each scene's enumeration is made once, instead
+    of for every emitting material and lamp.
+    '''
+    def __init__(self):
+        self.active = False
+        self.used = None
+        self.enumerations = {}
+    
+    def begin(self):
+        self.active = True
+        self.used = None
+        self.enumerations = {}
+    
+    def end(self):
+        self.active = False
+        self.used = None
+        self.enumerations = {}
+    
+    def used_names(self):
+        if not self.active:
+            return used_layer_names()
+        if self.used == None:
+            self.used = used_layer_names()
+        return self.used
+light_layer_index = LightLayerIndex()
+
+def is_layer_empty(layer):
+    return layer.name not in light_layer_index.used_names()
 
 @register_properties_dict
 class Indigo_Lightlayers_Properties(bpy.types.PropertyGroup):
@@ -232,13 +268,21 @@ class Indigo_Lightlayers_Properties(bpy.types.PropertyGroup):
         return True
         
     def enumerate(self):
+        if light_layer_index.active:
+            key = self.as_pointer()
+            if key not in light_layer_index.enumerations:
+                light_layer_index.enumerations[key] = self.build_enumeration(light_layer_index.used_names())
+            return light_layer_index.enumerations[key]
+        return self.build_enumeration(used_layer_names())
+    
+    def build_enumeration(self, used):
         en = {
             'default': 0,
         }
         if not self.ignore:
             idx = 1
             for name, lyr in self.lightlayers.items():
-                if is_layer_empty(lyr):
+                if name not in used:
                     continue
                 en[name] = idx
                 idx += 1
@@ -5,6 +5,7 @@ from . material import Spectrum
 from .. extensions_framework import util as efutil
 
 from .. import export
+from .. export.texture_proxy import texture_proxy_cache
 from . import register_properties_dict
 
 
@@ -284,7 +285,7 @@ class Indigo_Lamp_Hemi_Properties(bpy.types.PropertyGroup, export.xml_builder):
         
         fmt = {
             'texture': {
-                'path': [efutil.path_relative_to_export(self.env_map_path)],
+                'path': [efutil.path_relative_to_export(texture_proxy_cache.get_path(scene, self.env_map_path))],
                 'exponent': [1.0],    # TODO; make configurable?
                 'tex_coord_generation': {
                     self.env_map_type: {
@@ -1,8 +1,8 @@
-import re, os, zipfile
+import re, os
 
 import bpy        #@UnresolvedImport
 import bl_ui
-import xml.etree.cElementTree as ET
+from xml.etree.ElementTree import XMLPullParser, ParseError
 
 from ..extensions_framework import util as efutil
 #from extensions_framework.ui import property_group_renderer
@@ -20,6 +20,7 @@ from .. export.materials.medium      import  medium_xml
 from .. export.materials.External    import ExternalMaterial
 from .. export.materials.Null    import NullMaterial
 from .. export.materials.FastSSS    import FastSSSMaterial
+from .. export.pigm_cache import pigm_cache
 # from .. export import ( indigo_log )
 
 from .. import export
@@ -1162,16 +1163,15 @@ class indigo_material_coating(indigo_material_feature):
         },
     ]
     
+    def get_dependencies(self):
+        # The substrate material is exported separately by the material graph
+        if self.substrate_material_index in bpy.data.materials:
+            return [bpy.data.materials[self.substrate_material_index]]
+        return []
+    
     def get_output(self, obj, indigo_material, blender_material, scene):
         
         materials = []
-        
-        # Try and get the XML for the substrate material
-        if self.substrate_material_index in bpy.data.materials:
-            mata = bpy.data.materials[self.substrate_material_index]
-            materials.extend(
-                mata.indigo_material.factory(obj, mata, scene)
-            )
             
         im = CoatingMaterial(obj, blender_material.name, indigo_material, self).build_xml_element(
             blender_material,
@@ -1280,21 +1280,13 @@ class indigo_material_doublesidedthin(indigo_material_feature):
         },
     ]
     
+    def get_dependencies(self):
+        # The front and back materials are exported separately by the material graph
+        return [bpy.data.materials[name] for name in (self.front_material_index, self.back_material_index) if name in bpy.data.materials]
+    
     def get_output(self, obj, indigo_material, blender_material, scene):
         
         materials = []
-        
-        # Try and get the XML for the front, back material
-        if self.front_material_index in bpy.data.materials:
-            mata = bpy.data.materials[self.front_material_index]
-            materials.extend(
-                mata.indigo_material.factory(obj, mata, scene)
-            )
-        if self.back_material_index in bpy.data.materials:
-            mata = bpy.data.materials[self.back_material_index]
-            materials.extend(
-                mata.indigo_material.factory(obj, mata, scene)
-            )
             
         im = DoubleSidedThinMaterial(obj, blender_material.name, indigo_material, self).build_xml_element(
             blender_material,
@@ -1379,20 +1371,17 @@ class indigo_material_blended(indigo_material_feature):
         },
     ]
     
-    def get_output(self, obj, indigo_material, blender_material, scene):
+    def get_dependencies(self):
+        # Materials A and B are exported separately by the material graph
         materials = []
-        
         if not self.a_null and self.a_index in bpy.data.materials:
-            mata = bpy.data.materials[self.a_index]
-            materials.extend(
-                mata.indigo_material.factory(obj, mata, scene)
-            )
-        
+            materials.append(bpy.data.materials[self.a_index])
         if not self.b_null and self.b_index in bpy.data.materials:
-            matb = bpy.data.materials[self.b_index]
-            materials.extend(
-                matb.indigo_material.factory(obj, matb, scene)
-            )
+            materials.append(bpy.data.materials[self.b_index])
+        return materials
+    
+    def get_output(self, obj, indigo_material, blender_material, scene):
+        materials = []
         
         materials.append( BlendMaterial(obj, blender_material.name, indigo_material, self).build_xml_element(
             blender_material,
@@ -1422,35 +1411,102 @@ def updated_event(self, context):
         pass
         
         
-def get_material_name_from_IGM(igm_contents):
-    try:
-        root = ET.fromstring(igm_contents)
-
-        # For each material definition:
-        name = ""
-        for material in root.findall('material'):
-            name_elem = material.find('name')
-            if(name_elem == None):
+class IGMScanner(object):
+    '''
+    Finds the name of the last material in an IGM, and whether any material
+    emits light, in one incremental pass. Elements are discarded once seen,
+    so large embedded shaders and textures aren't kept in memory. The name
+    of the last material is only known at the end of the file; the emission
+    check stops looking once an emitting material is found.
+    '''
+    def __init__(self):
+        self.parser = XMLPullParser(events=('start', 'end'))
+        self.path = []
+        self.name = ''
+        self.emitting = False
+        self.material_named = False
+    
+    def feed(self, data):
+        self.parser.feed(data)
+        self.process()
+    
+    def close(self):
+        self.parser.close()
+        self.process()
+        return self.name, self.emitting
+    
+    def process(self):
+        for event, elem in self.parser.read_events():
+            path = self.path
+            if event == 'start':
+                path.append(elem.tag)
+                if len(path) == 2 and elem.tag == 'material':
+                    self.material_named = False
+                # <material><diffuse><base_emission><constant> - an emission with content
+                elif not self.emitting and len(path) == 5 and path[1] == 'material' and path[3] in ('base_emission', 'emission'):
+                    self.emitting = True
+                continue
+            
+            if len(path) == 3 and path[1] == 'material' and elem.tag == 'name' and not self.material_named:
+                self.name = elem.text
+                self.material_named = True
+            elif len(path) == 2 and elem.tag == 'material' and not self.material_named:
                 raise Exception('Failed to find material name in IGM file.')
-            name = name_elem.text
+            path.pop()
+            if len(path) > 0:
+                elem.clear()
 
-        # Return last name found
-        return name
+def parse_IGM(igm_contents):
+    '''
+    Returns (material name, emitting) for IGM contents given as bytes or str.
+    '''
+    try:
+        try:
+            scanner = IGMScanner()
+            scanner.feed(igm_contents)
+            return scanner.close()
+        except ParseError:
+            if type(igm_contents) != type(b''):
+                raise
+            # Bytes not matching the declared encoding
+            scanner = IGMScanner()
+            scanner.feed(try_file_decode(igm_contents))
+            return scanner.close()
     except Exception as e:
         raise Exception('While parsing IGM file: ' + str(e))
 
-def is_material_emitting_from_IGM(igm_contents):
+IGM_INFO_CACHE = {}
+
+def get_IGM_info(path):
+    '''
+    Returns (material name, emitting) of the IGM file at path. Results are
+    cached on the file's path, size and mtime.
+    '''
+    st = os.stat(path)
+    key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    if key in IGM_INFO_CACHE:
+        return IGM_INFO_CACHE[key]
+    
     try:
-        root = ET.fromstring(igm_contents)
-        for material in root.findall('material'):
-            for elem in material:
-                if elem.find('base_emission'):
-                    return True
-                elif elem.find('emission'):
-                    return True
-        return False
+        scanner = IGMScanner()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                scanner.feed(chunk)
+        info = scanner.close()
+    except ParseError:
+        info = parse_IGM(try_file_decode(read_guess_encoding(path)))
     except Exception as e:
         raise Exception('While parsing IGM file: ' + str(e))
+    
+    IGM_INFO_CACHE[key] = info
+    return info
+
+def get_material_name_from_IGM(igm_contents):
+    # Return last name found
+    return parse_IGM(igm_contents)[0]
+
+def is_material_emitting_from_IGM(igm_contents):
+    return parse_IGM(igm_contents)[1]
 
 def read_guess_encoding(path):
     for encoding in ['utf-8', 'latin-1', 'ascii', 'ansi']:
@@ -1474,42 +1530,34 @@ def get_material_filename_and_emission_from_external_mat(self, blender_material)
         # If the user specified a PIGM file:
         if self.filename[-5:].lower() == '.pigm':
 
+            # The IGM inside the PIGM is only read and parsed the first time the archive is seen
+            info = pigm_cache.info(extmat_file, parse_IGM)
+
             # Check it is a valid zip file
-            if not zipfile.is_zipfile( extmat_file ):
+            if info == None:
                 ex_str = 'Invalid PIGM file for External material'
                 if (hasattr(blender_material, "name")):
                     ex_str += ' "%s"' % blender_material.name
                 raise Exception(ex_str)
 
-            # Find the name of the IGM file inside the PIGM
-            with zipfile.ZipFile(extmat_file, 'r') as zf:
-                igm_filename = ''
-                for zf_internal in zf.namelist():
-                    if zf_internal[-4:].lower() == '.igm':
-                        igm_filename = zf_internal
-                        break
-                
-                # If no IGM file found, raise exception
-                if igm_filename == '':
-                    ex_str = 'No IGM found in PIGM for External material'
-                    if (hasattr(blender_material, "name")):
-                        ex_str += ' "%s"' % blender_material.name
-                    raise Exception(ex_str)
+            # If no IGM file found, raise exception
+            if info['igm_filename'] == '':
+                ex_str = 'No IGM found in PIGM for External material'
+                if (hasattr(blender_material, "name")):
+                    ex_str += ' "%s"' % blender_material.name
+                raise Exception(ex_str)
 
-                # Get the file contents, store in 'igm_data'
-                with zf.open(igm_filename, 'r') as igm_file:
-                    igm_data = try_file_decode(igm_file.read())
+            igm_name, igm_emit = info['igm_name'], info['igm_emit']
 
         # Else if the user specified an IGM file:
         elif self.filename[-4:].lower() == '.igm':
-            igm_data = try_file_decode(read_guess_encoding(extmat_file)) # Get the file contents
+            igm_name, igm_emit = get_IGM_info(extmat_file)
         else:
             ex_str = "'" + str(self.filename) + "' is not an IGM or PIGM file.  (For External material"
             if (hasattr(blender_material, "name")):
                 ex_str += ' "%s"' % blender_material.name + ")"
             raise Exception(ex_str)
 
-        igm_name = get_material_name_from_IGM(igm_data)
         # print("igm_name: '" + str(igm_name) + "'")
         
         if igm_name == '':
@@ -1520,7 +1568,6 @@ def get_material_filename_and_emission_from_external_mat(self, blender_material)
         
         self.material_name = igm_name # ??? seems to work both in stills and animations - MZ
             
-        igm_emit = is_material_emitting_from_IGM(igm_data)
         return igm_name, igm_emit
         
         # self.is_valid = True
@@ -1630,21 +1677,13 @@ class indigo_material_external(indigo_material_feature):
             
             if self.filename[-5:].lower() == '.pigm':
                 
-                if not zipfile.is_zipfile( extmat_file ):
+                info = pigm_cache.info(extmat_file, parse_IGM)
+                if info == None or info['igm_filename'] == '':
                     return []
+                igm_filename = info['igm_filename']
                 
-                with zipfile.ZipFile(extmat_file) as zf:
-                    igm_filename = ''
-                    for zf_internal in zf.namelist():
-                        if zf_internal[-4:].lower() == '.igm':
-                            igm_filename = zf_internal
-                            break
-                    
-                    if igm_filename == '':
-                        return []
-                    
-                    # Extract the material to the export directory
-                    zf.extractall(efutil.export_path)
+                # Link the material from the extraction cache into the export directory
+                pigm_cache.link_into(extmat_file, efutil.export_path)
             
             elif self.filename[-4:].lower() == '.igm':
                 extmat_file = efutil.path_relative_to_export( self.filename )
@@ -1782,7 +1821,19 @@ class Indigo_Material_Properties(bpy.types.PropertyGroup):
         
         return blender_mat.name
     
-    # xml element factory
+    def dependencies(self):
+        '''
+        Materials referenced by this material, which have to be exported before it.
+        '''
+        materials = []
+        if self.type in MATERIAL_FEATURES.keys():
+            for feature in MATERIAL_FEATURES[self.type]:
+                fpg = getattr(self, 'indigo_material_%s'%feature)
+                if hasattr(fpg, 'get_dependencies'):
+                    materials.extend( fpg.get_dependencies() )
+        return materials
+    
+    # xml element factory; referenced materials are not included, see dependencies()
     
     def factory(self, obj, mat, scene):
         out_elements = []
@@ -4,9 +4,13 @@ import os
 from .. extensions_framework.util import path_relative_to_export, filesystem_path
 
 from .. export import xml_builder
+from .. export._igmesh import igmesh_view
 
 #from .. import export
 from . import register_properties_dict
+
+# Map from (path, size, mtime) to proxy igmesh header info
+proxy_info_cache = {}
     
 @register_properties_dict
 class Indigo_Mesh_Properties(bpy.types.PropertyGroup, xml_builder):
@@ -139,6 +143,29 @@ class Indigo_Mesh_Properties(bpy.types.PropertyGroup, xml_builder):
         proxy_path = filesystem_path(self.mesh_path)
         return self.mesh_proxy and os.path.exists(proxy_path)
     
+    def proxy_igmesh_info(self):
+        '''
+        Returns (num_vert_positions, num_triangles, num_quads, used_materials)
+        read from the header of an .igmesh proxy, or None.
+        '''
+        if not self.valid_proxy():
+            return None
+        
+        proxy_path = filesystem_path(self.mesh_path)
+        if not proxy_path.lower().endswith('.igmesh'):
+            return None
+        
+        st = os.stat(proxy_path)
+        key = (proxy_path, st.st_size, st.st_mtime)
+        if key not in proxy_info_cache:
+            try:
+                with igmesh_view(proxy_path) as m:
+                    proxy_info_cache[key] = (m.counts['vert_positions'], m.counts['triangles'], m.counts['quads'], m.used_materials)
+            except Exception:
+                proxy_info_cache[key] = None
+        
+        return proxy_info_cache[key]
+    
     # xml_builder members
     def build_xml_element(self, obj, filename, use_shading_normals, exported_name=""):
         
@@ -385,6 +385,60 @@ properties = [
         'max': 64,
         'soft_max': 64
     },
+    {
+        'type': 'bool',
+        'attr': 'queue_runner',
+        'name': 'Render queue locally',
+        'description': 'Render animations with several concurrent indigo_console jobs instead of opening the render queue in Indigo',
+        'default': False,
+    },
+    {
+        'type': 'bool',
+        'attr': 'queue_resume',
+        'name': 'Resume',
+        'description': 'Skip frames whose output image already exists, to continue an interrupted queue render',
+        'default': False,
+    },
+    {
+        'type': 'int',
+        'attr': 'queue_jobs',
+        'name': 'Jobs',
+        'description': 'Number of concurrent Indigo jobs (0 = cores / threads per job)',
+        'default': 0,
+        'min': 0,
+        'soft_min': 0,
+        'max': 256,
+        'soft_max': 64
+    },
+    {
+        'type': 'int',
+        'attr': 'queue_threads_per_job',
+        'name': 'Threads per Job',
+        'description': 'Number of render threads for each Indigo job (0 = Indigo default, one job at a time)',
+        'default': 4,
+        'min': 0,
+        'soft_min': 0,
+        'max': 256,
+        'soft_max': 64
+    },
+    {
+        'type': 'bool',
+        'attr': 'framebuffer_feedback',
+        'name': 'Show progress in render result',
+        'description': 'While Indigo renders a single frame, show the images it saves in the Blender render result. Only active when waiting for the Indigo process; use a short Save interval',
+        'default': True,
+    },
+    {
+        'type': 'float',
+        'attr': 'framebuffer_update_interval',
+        'name': 'Update interval',
+        'description': 'Minimum number of seconds between render result updates',
+        'default': 2.0,
+        'min': 0.1,
+        'soft_min': 0.5,
+        'max': 3600.0,
+        'soft_max': 60.0
+    },
     {
         'type': 'int',
         'attr': 'halttime',
@@ -407,12 +461,121 @@ properties = [
         'max': 64000,
         'soft_max': 64000
     },
+    {
+        'type': 'bool',
+        'attr': 'export_profile',
+        'name': 'Profile export',
+        'description': 'Time the phases of the scene export and write a .profile.json report next to the exported scene',
+        'default': False,
+    },
+    {
+        'type': 'int',
+        'attr': 'export_profile_top',
+        'name': 'Slowest Objects',
+        'description': 'Number of slowest objects to list in the log',
+        'default': 10,
+        'min': 0,
+        'soft_max': 50,
+        'max': 1000,
+    },
+    {
+        'type': 'bool',
+        'attr': 'preview_textures',
+        'name': 'Preview textures',
+        'description': 'Export downscaled copies of large texture files, sized for the render resolution, to speed up scene loading for preview renders',
+        'default': False,
+    },
+    {
+        'type': 'float',
+        'attr': 'preview_texture_factor',
+        'name': 'Texture Size',
+        'description': 'Largest preview texture size, relative to the largest render dimension (after resolution percentage)',
+        'default': 1.0,
+        'min': 0.05,
+        'soft_min': 0.25,
+        'max': 16.0,
+        'soft_max': 4.0,
+    },
     {
         'type': 'bool',
         'attr': 'skip_existing_meshes',
         'name': 'Skip writing existing meshes',
         'default': False,
     },
+    {
+        'type': 'int',
+        'attr': 'parallel_export_workers',
+        'name': 'Export Workers',
+        'description': 'Number of background Blender processes used by Export Animation in Parallel',
+        'default': 4,
+        'min': 1,
+        'soft_min': 1,
+        'max': 256,
+        'soft_max': 64
+    },
+    {
+        'type': 'bool',
+        'attr': 'stream_objects',
+        'name': 'Stream object instances',
+        'description': 'Write object instances to the scene file while the scene is processed instead of collecting them all first. Lowers memory use for scenes with many instances',
+        'default': True,
+    },
+    {
+        'type': 'int',
+        'attr': 'mesh_cache_size_mb',
+        'name': 'Mesh Cache Size Limit (MB)',
+        'description': 'Delete the least recently used meshes from the mesh directory when it grows over this size. Meshes used in the current session are kept (0 = unlimited)',
+        'default': 0,
+        'min': 0,
+        'soft_min': 0,
+        'max': 1048576,
+        'soft_max': 102400
+    },
+    {
+        'type': 'enum',
+        'attr': 'igmesh_writer',
+        'name': 'Mesh Writer',
+        'description': 'Method used to write .igmesh files',
+        'default': 'numpy',
+        'items': [
+            ('numpy', 'NumPy', 'Extract mesh data in bulk and write it with NumPy array operations'),
+            ('python', 'Python', 'Walk the mesh element by element in Python (slow, fallback)'),
+            ('stream', 'Streaming', 'Write the mesh in fixed-size chunks so memory use stays within a fixed budget (slow, for very large meshes)'),
+        ]
+    },
+    {
+        'type': 'int',
+        'attr': 'mesh_writer_threads',
+        'name': 'Mesh Writer Threads',
+        'description': 'Number of threads writing .igmesh files during scene export, while the main thread keeps extracting meshes (NumPy mesh writer only, 0 = write on the main thread)',
+        'default': 4,
+        'min': 0,
+        'soft_min': 0,
+        'max': 64,
+        'soft_max': 32
+    },
+    {
+        'type': 'int',
+        'attr': 'mesh_writer_queue_depth',
+        'name': 'Mesh Writer Queue Depth',
+        'description': 'Maximum number of extracted meshes waiting to be written. Export pauses when the queue is full, which limits memory use',
+        'default': 8,
+        'min': 1,
+        'soft_min': 1,
+        'max': 256,
+        'soft_max': 64
+    },
+    {
+        'type': 'int',
+        'attr': 'igmesh_stream_memory_mb',
+        'name': 'Streaming Memory Budget (MB)',
+        'description': 'Approximate peak memory used per chunk when writing meshes in streaming mode',
+        'default': 64,
+        'min': 1,
+        'soft_min': 8,
+        'max': 16384,
+        'soft_max': 4096
+    },
     {
         'type': 'int',
         'attr': 'period_save',
@@ -737,76 +900,101 @@ default_devices = []
 def load_default_devices():
     # previously saved devices are considered new defaults
     import re, os
-    from .. core.util import getSettingsPath
+    from .. core.util import getSettingsPath, BinaryInfoCache
     settings_file = getSettingsPath()
     
     global default_devices
     
-    try:
-        from xml.etree import ElementTree as ET
-        root = ET.parse(settings_file)
-        devices = root.find('selected_opencl_devices').findall('device')
-        default_devices = [(d.find('device_name').text, d.find('vendor_name').text) for d in devices]
+    def read_default_devices():
+        try:
+            from xml.etree import ElementTree as ET
+            root = ET.parse(settings_file)
+            devices = root.find('selected_opencl_devices').findall('device')
+            return [(d.find('device_name').text, d.find('vendor_name').text) for d in devices]
+        except Exception:
+            print('Loading default computing devices from settings.xml failed')
+            return None
+    
+    # settings.xml is only parsed again when it has changed
+    devices = BinaryInfoCache.get(settings_file, 'default_devices', read_default_devices)
+    if devices != None:
+        default_devices = [tuple(d) for d in devices]
         print("Loaded default devices:", default_devices)
-    except Exception:
-        print('Loading default computing devices from settings.xml failed')
 load_default_devices()
+
+def parse_gpu_info(output):
+    '''
+    Parse the output of indigo_console --gpu_info into a list of
+    (platform name, device name, platform vendor, device id) tuples.
+    '''
+    devices = []
+    platforms = output.split("platform_id: ")[1:]
+    
+    device_counters = {}
+
+    for p in platforms:
+        devices_info = p.split("----------- Device")
+        p = devices_info[0]
+        p = p.splitlines()
+        
+        for l in p:
+            if l.startswith("platform_name"):
+                platform_name = l.split(": ")[1]
+                
+        for l in p:
+            if l.startswith("platform_vendor"):
+                platform_vendor = l.split(": ")[1]
+                
+        for d in devices_info[1:]:
+            d = d.splitlines()
+            #device_id = int(d[0].split()[0])
+            for l in d[1:]:
+                if l.startswith("device_name"):
+                    device_name = l.split(": ")[1]
+            
+            # devices ids differentiate devices with the same name. Dis
+            did = '{} {}'.format(device_name, platform_vendor)
+            if device_counters.keys().isdisjoint([did]):
+                device_counters[did] = 0
+            else:
+                device_counters[did] += 1
+            device_id = device_counters[did]
+            
+            devices.append((platform_name, device_name, platform_vendor, device_id))
+    return devices
         
 device_list = []
 device_list_updated = False
 def get_render_devices(refresh=False):
+    '''
+    Returns the computing devices found by indigo_console. With refresh set
+    indigo_console is queried again, otherwise the devices cached for the
+    current binary are used.
+    '''
     global device_list
     global device_list_updated
+    from .. core.util import getConsolePath, BinaryInfoCache
+    
+    indigo_path = getConsolePath(bpy.context.scene)
     if refresh:
         import subprocess
-        from .. core.util import getConsolePath
         
-        indigo_path = getConsolePath(bpy.context.scene)
         if not os.path.exists(indigo_path):
             print('Wrong Indigo path')
             return device_list
         
         out = subprocess.run([indigo_path, '--gpu_info'], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
         
-        device_list = []
-        platforms = out.stdout.decode('utf-8', 'replace')
-        platforms = platforms.split("platform_id: ")[1:]
-        
-        device_counters = {}
-
-        for p in platforms:
-            devices = p.split("----------- Device")
-            p = devices[0]
-            p = p.splitlines()
-            
-            for l in p:
-                if l.startswith("platform_name"):
-                    platform_name = l.split(": ")[1]
-                    
-            for l in p:
-                if l.startswith("platform_vendor"):
-                    platform_vendor = l.split(": ")[1]
-                    
-            for d in devices[1:]:
-                d = d.splitlines()
-                #device_id = int(d[0].split()[0])
-                for l in d[1:]:
-                    if l.startswith("device_name"):
-                        device_name = l.split(": ")[1]
-                
-                # devices ids differentiate devices with the same name. Dis
-                did = '{} {}'.format(device_name, platform_vendor)
-                if device_counters.keys().isdisjoint([did]):
-                    device_counters[did] = 0
-                else:
-                    device_counters[did] += 1
-                device_id = device_counters[did]
-                
-                device_list.append((platform_name, device_name, platform_vendor, device_id))
+        device_list = parse_gpu_info(out.stdout.decode('utf-8', 'replace'))
+        BinaryInfoCache.set(indigo_path, 'devices', device_list)
             
         #print('\n********\n', device_list, '\n*******')
         return device_list
     else:
+        if len(device_list) == 0:
+            devices = BinaryInfoCache.get(indigo_path, 'devices')
+            if devices != None:
+                device_list = [tuple(d) for d in devices]
         return device_list
 
 #get_render_devices(True)
@@ -821,7 +1009,7 @@ class Indigo_Engine_Properties(bpy.types.PropertyGroup, export.xml_builder):
     properties = properties
     
     def refresh_device_collection(self):
-        devices = device_list[:]
+        devices = get_render_devices()[:]
         first_refresh = False
         if len(devices) and len(self.render_devices) == 0:
             # self.render_devices refreshed for the first time. Use default_devices to activate suitable entries
@@ -0,0 +1,27 @@
+'''
+Loads modules of the add-on that don't need Blender.
+
+The add-on package and its subpackages import bpy from their __init__
+modules, so they are registered here as bare packages pointing at the
+source directories, and only the requested module itself is executed.
+'''
+
+import importlib, os, sys, types
+
+SOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sources')
+
+def load(name):
+    '''
+    Import indigo_exporter.<name>, e.g. load('core.supervisor').
+    '''
+    package = 'indigo_exporter'
+    path = os.path.join(SOURCES, package)
+    for part in [None] + name.split('.')[:-1]:
+        if part != None:
+            package += '.' + part
+            path = os.path.join(path, part)
+        if package not in sys.modules:
+            module = types.ModuleType(package)
+            module.__path__ = [path]
+            sys.modules[package] = module
+    return importlib.import_module('indigo_exporter.' + name)
@@ -0,0 +1,67 @@
+import os, tempfile, unittest
+
+from support import load
+
+framebuffer = load('core.framebuffer')
+
+class FramebufferThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'frame.png')
+
+        # Record what would be decoded instead of decoding it.
+        self.decoded = []
+        def decode_image(path):
+            with open(path, 'rb') as f:
+                self.decoded.append(f.read())
+            return (1, 1, None)
+        self.decode_image = framebuffer.decode_image
+        framebuffer.decode_image = decode_image
+
+    def tearDown(self):
+        framebuffer.decode_image = self.decode_image
+        self.temp_dir.cleanup()
+
+    def write(self, data, mode='wb'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_only_settled_image_is_delivered(self):
+        thread = framebuffer.FramebufferThread([self.path])
+
+        self.write(b'partial')
+        thread.check()
+        self.assertIsNone(thread.take())
+
+        # Still being written: the size changed since the last check.
+        self.write(b' image', 'ab')
+        thread.check()
+        self.assertIsNone(thread.take())
+        self.assertEqual(self.decoded, [])
+
+        # Unchanged since the last check, so it has settled.
+        thread.check()
+        self.assertEqual(thread.take(), (self.path, 1, 1, None))
+        self.assertEqual(self.decoded, [b'partial image'])
+
+        # Not decoded again until it changes.
+        thread.check()
+        self.assertIsNone(thread.take())
+        self.assertEqual(len(self.decoded), 1)
+
+    def test_final_check(self):
+        thread = framebuffer.FramebufferThread([self.path])
+        self.write(b'complete image')
+        thread.check(final=True)
+        self.assertEqual(thread.take(), (self.path, 1, 1, None))
+        self.assertEqual(self.decoded, [b'complete image'])
+
+    def test_missing_file(self):
+        thread = framebuffer.FramebufferThread([self.path])
+        thread.check()
+        thread.check()
+        self.assertIsNone(thread.take())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os, tempfile, unittest
+
+import numpy as np
+
+from support import load
+
+_igmesh = load('export._igmesh')
+
+class IgmeshViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, 'mesh.igmesh')
+
+        stream = _igmesh.igmesh_stream(self.filename, format_version=3)
+        stream.add_num_uv_mappings(1)
+        stream.add_num_used_materials(1)
+        stream.add_used_material('mat')
+        stream.add_num_uv_set_expositions(0)
+        for SEQ_N, data in (
+            (stream.SEQ_NVP, np.arange(9, dtype=np.float32)),
+            (stream.SEQ_NVN, np.zeros(0, dtype=np.float32)),
+        ):
+            stream.begin_section(SEQ_N)
+            stream.add_chunk(data)
+            stream.end_section()
+        stream.add_uv_layout(1)
+        for SEQ_N, data in (
+            (stream.SEQ_NUP, np.zeros(8, dtype=np.float32)),
+            (stream.SEQ_NT, np.array([0, 1, 2, 0, 1, 2, 0], dtype=np.int32)),
+            (stream.SEQ_NQ, np.zeros(0, dtype=np.int32)),
+        ):
+            stream.begin_section(SEQ_N)
+            stream.add_chunk(data)
+            stream.end_section()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_views_outlive_with_block(self):
+        with _igmesh.igmesh_view(self.filename) as m:
+            tris = m.triangles
+            vert_indices = tris[:, 0:3]
+            self.assertEqual(m.used_materials, ['mat'])
+        self.assertTrue(m.file_handle.closed)
+        self.assertEqual(vert_indices.tolist(), [[0, 1, 2]])
+
+    def test_close_without_views(self):
+        m = _igmesh.igmesh_view(self.filename)
+        self.assertEqual(m.vert_positions.tolist(), [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+        m.close()
+        self.assertTrue(m.mm.closed)
+        self.assertTrue(m.file_handle.closed)
+
+    def test_truncated_file(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data[:-4])
+        self.assertRaises(Exception, _igmesh.igmesh_view, self.filename)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from support import load
+
+parallel_export = load('core.parallel_export')
+
+class SplitFrameRangeTest(unittest.TestCase):
+
+    def frames(self, ranges, frame_step=1):
+        return [f for first, last in ranges for f in range(first, last + 1, frame_step)]
+
+    def test_covers_range_in_order(self):
+        for (start, end, step, workers) in [(1, 250, 1, 4), (1, 5, 1, 4), (10, 12, 1, 8), (0, 100, 3, 7), (1, 1, 1, 4)]:
+            ranges = parallel_export.split_frame_range(start, end, step, workers)
+            self.assertLessEqual(len(ranges), workers)
+            self.assertEqual(self.frames(ranges, step), list(range(start, end + 1, step)))
+
+    def test_chunk_sizes(self):
+        sizes = [last - first + 1 for first, last in parallel_export.split_frame_range(1, 5, 1, 4)]
+        self.assertEqual(sorted(sizes), [1, 1, 1, 2])
+
+    def test_more_workers_than_frames(self):
+        self.assertEqual(parallel_export.split_frame_range(1, 3, 1, 4), [(1, 1), (2, 2), (3, 3)])
+
+class FrameProgressTest(unittest.TestCase):
+
+    def test_progress(self):
+        self.assertEqual(parallel_export.frame_progress(1, 5, 1), 0.0)
+        self.assertEqual(parallel_export.frame_progress(1, 5, 3), 0.5)
+        self.assertEqual(parallel_export.frame_progress(1, 5, 5), 1.0)
+
+    def test_single_frame(self):
+        # A worker given a one frame chunk renders with frame_start == frame_end.
+        for first, last in parallel_export.split_frame_range(1, 3, 1, 4):
+            self.assertEqual(parallel_export.frame_progress(first, last, first), 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json, os, sys, tempfile, textwrap, time, unittest
+
+from support import load
+
+queue_runner = load('core.queue_runner')
+
+# Stands in for indigo_console rendering a queue: writes each item's image
+# and records the arguments it was started with.
+FAKE_CONSOLE = textwrap.dedent('''
+    import json, sys
+    import xml.etree.ElementTree as ET
+    for item in ET.parse(sys.argv[1]).getroot().findall('item'):
+        output_path = item.find('output_path').text
+        with open(output_path + '.png', 'w') as f:
+            f.write('image')
+        seed = item.find('seed')
+        with open(output_path + '.args.json', 'w') as f:
+            json.dump({'args': sys.argv[2:], 'seed': seed.text if seed is not None else None}, f)
+''')
+
+class IgqQueueRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temp_dir.name
+        self.console = os.path.join(self.dir, 'fake_console.py')
+        with open(self.console, 'w') as f:
+            f.write('#!%s\n' % sys.executable + FAKE_CONSOLE)
+        os.chmod(self.console, 0o755)
+        self.igq = os.path.join(self.dir, 'anim.igq')
+        self.write_queue(3)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_queue(self, num_frames):
+        with open(self.igq, 'w') as f:
+            f.write('<?xml version="1.0" encoding="utf-8" standalone="no" ?>\n<render_queue>\n')
+            for i in range(1, num_frames + 1):
+                f.write('\t<item>\n')
+                f.write('\t\t<scene_path>%s/frame%04i.igs</scene_path>\n' % (self.dir, i))
+                f.write('\t\t<halt_time>-1</halt_time>\n')
+                f.write('\t\t<halt_spp>16</halt_spp>\n')
+                f.write('\t\t<output_path>%s/frame%04i</output_path>\n' % (self.dir, i))
+                f.write('\t\t<seed>%i</seed>\n' % (1000 + i))
+                f.write('\t</item>\n')
+            f.write('</render_queue>\n')
+
+    def runner(self, **kwargs):
+        return queue_runner.IgqQueueRunner(self.console, self.igq, 2, 1, **kwargs)
+
+    def test_renders_items_with_seed_and_output_options(self):
+        counts = self.runner(output_options={'exr_tonemapped': True}).run(poll_interval=0.01)
+        self.assertEqual(counts, {'done': 3})
+
+        with open(os.path.join(self.dir, 'frame0002.args.json')) as f:
+            recorded = json.load(f)
+        self.assertEqual(recorded['seed'], '1002')
+        self.assertEqual(recorded['args'], ['-t', '1', '-texro', os.path.join(self.dir, 'frame0002') + '_tonemapped.exr'])
+        self.assertEqual([f for f in os.listdir(self.dir) if '.item' in f], [])
+
+    def test_rerun_of_same_queue_skips_done_items(self):
+        self.runner().run(poll_interval=0.01)
+        self.assertEqual(self.runner().run(poll_interval=0.01), {'done': 3})
+        for item in self.runner().items:
+            self.assertEqual(item['status'], 'done')
+
+    def test_rewritten_queue_renders_again(self):
+        self.runner().run(poll_interval=0.01)
+        time.sleep(0.01)
+        self.write_queue(3)
+        runner = self.runner()
+        self.assertEqual([item['status'] for item in runner.items], ['pending'] * 3)
+
+    def test_existing_images_only_skipped_when_resuming(self):
+        with open(os.path.join(self.dir, 'frame0001.png'), 'w') as f:
+            f.write('old image')
+        self.assertEqual(self.runner().items[0]['status'], 'pending')
+        self.assertEqual(self.runner(resume=True).items[0]['status'], 'skipped')
+
+if __name__ == '__main__':
+    unittest.main()
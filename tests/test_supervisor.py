@@ -0,0 +1,63 @@
+import os, sys, tempfile, textwrap, time, unittest
+
+from support import load
+
+supervisor = load('core.supervisor')
+
+# Stands in for indigo_console: prints progress lines, then exits with the
+# code given as its first argument, or keeps going when given 'forever'.
+FAKE_CONSOLE = textwrap.dedent('''
+    import sys, time
+    forever = sys.argv[1] == 'forever'
+    i = 0
+    while forever or i < 5:
+        i += 1
+        print('Time: %.1f s, %.1f samples/pixel' % (i * 10.0, i * 2.0), flush=True)
+        time.sleep(0.05)
+    sys.exit(int(sys.argv[1]))
+''')
+
+class ParseProgressTest(unittest.TestCase):
+
+    def test_parse_progress(self):
+        self.assertEqual(supervisor.parse_progress('Time: 12.3 s, 45.6 samples/pixel'), (45.6, 12.3))
+        self.assertEqual(supervisor.parse_progress('1.2e2 S/px, elapsed 65 s'), (120.0, 65.0))
+        self.assertEqual(supervisor.parse_progress('Loading scene...'), (None, None))
+
+class IndigoProcessSupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.script = os.path.join(self.temp_dir.name, 'fake_console.py')
+        with open(self.script, 'w') as f:
+            f.write(FAKE_CONSOLE)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def start(self, arg, halt_spp=-1, halt_time=-1):
+        return supervisor.IndigoProcessSupervisor([sys.executable, self.script, arg], halt_spp, halt_time).start()
+
+    def test_progress(self):
+        s = self.start('0', halt_spp=20)
+        reports = []
+        self.assertEqual(s.wait(on_progress=lambda stats, progress: reports.append((stats, progress)), progress_interval=0.0), 0)
+        self.assertEqual((s.spp, s.elapsed), (10.0, 50.0))
+        self.assertEqual(reports[-1], ('10.0 S/px, 50 s', 0.5))
+
+    def test_exit_code(self):
+        s = self.start('3')
+        self.assertEqual(s.wait(), 3)
+        self.assertEqual(s.returncode, 3)
+
+    def test_cancel(self):
+        s = self.start('forever')
+        cancel_time = time.time() + 0.3
+        s.wait(test_break=lambda: time.time() >= cancel_time, poll_interval=0.05)
+        # Terminated within a poll interval plus process teardown.
+        self.assertLess(time.time() - cancel_time, 1.0)
+        self.assertNotEqual(s.returncode, 0)
+        self.assertIsNotNone(s.spp)
+
+if __name__ == '__main__':
+    unittest.main()